@@ -0,0 +1,147 @@
+"""
+Scale benchmark for the loader and the queries
+
+For each scale factor it generates a synthetic dataset (app/generate_data.py),
+loads it with load_csv_to_mongo and measures the cold (empty cache) and warm
+(second call) latency of query1 to query15. query7 reads a sorted set kept
+up to date on every write, so its cold run includes rebuilding it; query15
+does not use the cache and is reported without a speedup.
+
+Uso:
+    python app/benchmark.py --scales 1 10 100 --mode bulk
+"""
+
+import sys
+import os
+import time
+import argparse
+from contextlib import redirect_stdout
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import get_mongo_collection, get_redis_client
+from app.main import load_csv_to_mongo, build_top_coverage_in_redis, DEFAULT_BATCH_SIZE
+from app.generate_data import generate_dataset
+from app.cache import invalidate_namespaces
+from app.queries import (
+    query1, query2, query3, query4, query5, query6, query7, query8,
+    query9, query10, query11, query12, query13, query14, query15,
+)
+
+# query13-15 are ABM services, so their read operations are measured
+QUERIES = [
+    ("query1", lambda: query1.get_active_clients(use_cache=True)),
+    ("query2", lambda: query2.get_open_claims(use_cache=True)),
+    ("query3", lambda: query3.get_insured_vehicles_with_client_and_policy(use_cache=True)),
+    ("query4", lambda: query4.get_clients_without_active_policies(use_cache=True)),
+    ("query5", lambda: query5.get_active_agents_with_assigned_policies_count(use_cache=True)),
+    ("query6", lambda: query6.get_expired_policies(use_cache=True)),
+    ("query7", lambda: query7.get_top10_clients_by_total_coverage()),
+    ("query8", lambda: query8.get_accident_claims_last_year(use_cache=True)),
+    ("query9", lambda: query9.view_active_policies(use_cache=True)),
+    ("query10", lambda: query10.get_suspended_policies(use_cache=True)),
+    ("query11", lambda: query11.get_clients_with_multiple_insured_vehicles(use_cache=True)),
+    ("query12", lambda: query12.get_agents_with_claims_count(use_cache=True)),
+    ("query13", lambda: query13.read_client(id_cliente=1)),
+    ("query14", lambda: query14.get_claims_by_policy("POL1001")),
+    ("query15", lambda: query15.get_available_agents()),
+]
+
+# Invalidating the namespace does not empty the leaderboard, so query7's cold
+# run pays for rebuilding it as an empty Redis would
+COLD_RUNS = {
+    "query7": lambda: (
+        build_top_coverage_in_redis(get_mongo_collection(), get_redis_client()),
+        query7.get_top10_clients_by_total_coverage(),
+    ),
+}
+
+# Queries that always read MongoDB: their cold and warm runs are the same
+UNCACHED_QUERIES = {"query15"}
+
+
+def timed(func):
+    """Run func with its output discarded and return the elapsed seconds"""
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+
+def benchmark_queries():
+    """
+    Measure cold and warm latency of every query
+
+    Returns:
+        List of (query, cold_seconds, warm_seconds)
+    """
+    results = []
+    for name, func in QUERIES:
+        timed(lambda: invalidate_namespaces(name))
+        cold = timed(COLD_RUNS.get(name, func))
+        warm = timed(func)
+        results.append((name, cold, warm))
+    return results
+
+
+def run_benchmark(scales, output_root="data", mode="bulk", seed=42,
+                  batch_size=DEFAULT_BATCH_SIZE, workers=None):
+    """
+    Generate, load and query a dataset for each scale factor
+
+    Datasets already present in output_root are reused, so repeated runs only
+    pay the generation cost once.
+
+    Returns:
+        Dict of scale -> {"rows": ..., "load_seconds": ..., "queries": [...]}
+    """
+    report = {}
+    for scale in scales:
+        data_dir = os.path.join(output_root, f"scale_{scale:g}")
+        if not os.path.exists(os.path.join(data_dir, "clientes.csv")):
+            print(f"Generating dataset at scale {scale:g} in {data_dir}...")
+            generate_dataset(data_dir, scale=scale, seed=seed)
+
+        with open(os.path.join(data_dir, "clientes.csv")) as f:
+            rows = sum(1 for _ in f) - 1
+
+        print(f"Loading {rows} clients (mode={mode})...")
+        start = time.perf_counter()
+        load_csv_to_mongo(mode=mode, batch_size=batch_size, workers=workers, data_dir=data_dir)
+        load_seconds = time.perf_counter() - start
+
+        report[scale] = {
+            "rows": rows,
+            "load_seconds": load_seconds,
+            "queries": benchmark_queries(),
+        }
+        print_report(scale, report[scale])
+    return report
+
+
+def print_report(scale, result):
+    print("\n" + "=" * 60)
+    print(f"Scale {scale:g}: {result['rows']} clients - load {result['load_seconds']:.2f}s")
+    print("=" * 60)
+    print(f"{'Query':<10} {'Cold (ms)':>12} {'Warm (ms)':>12} {'Speedup':>10}")
+    for name, cold, warm in result["queries"]:
+        if name in UNCACHED_QUERIES:
+            speedup = "sin caché"
+        else:
+            speedup = f"{cold / warm if warm > 0 else 0:.1f}x"
+        print(f"{name:<10} {cold * 1000:>12.1f} {warm * 1000:>12.1f} {speedup:>10}")
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the loader and queries at several dataset scales")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100],
+                        help="Scale factors relative to resources/ (1 = ~200 clients)")
+    parser.add_argument("--output", default="data", help="Directory for the generated datasets")
+    parser.add_argument("--mode", choices=["bulk", "stream", "parallel", "legacy"], default="bulk")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    run_benchmark(args.scales, args.output, args.mode, args.seed, args.batch_size, args.workers)
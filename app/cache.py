@@ -4,18 +4,198 @@ Módulo de Ayuda para Caché Redis
 Proporciona utilidades de caché para consultas MongoDB y mejorar el rendimiento.
 """
 
+import os
 import json
+import time
+import uuid
 import pickle
+import inspect
+import hashlib
+import functools
+import threading
 from datetime import datetime, timedelta
+from redis.exceptions import WatchError
+from app import serialization
+from app import refresh_ahead
+from app import cache_metrics
 from app.db import get_redis_client
+from app.local_cache import get_local_cache, publish_invalidation, key_str
+
+# Claves pedidas a Redis por cada iteración de SCAN y borradas por cada UNLINK
+SCAN_BATCH_SIZE = 500
+UNLINKS_PER_PIPELINE = 10
+
+# Cada tag es un set de Redis con las claves de caché que dependen de él.
+# Tags de colección ("clientes", "polizas", "siniestros", "vehiculos") para
+# resultados construidos a partir de todas las entidades de un tipo, y tags
+# de entidad (cliente:{id}, poliza:{nro}) para resultados de una sola entidad.
+TAG_PREFIX = "tag:"
+
+# Lock de recálculo (single-flight): mientras un proceso recalcula una clave
+# vencida, los demás esperan su resultado en lugar de repetir la consulta.
+# El lock vence solo si el proceso que lo tiene muere sin liberarlo.
+RECOMPUTE_LOCK_PREFIX = "lock:"
+RECOMPUTE_LOCK_TTL_MS = 10000
+RECOMPUTE_WAIT_S = 5
+RECOMPUTE_POLL_S = 0.05
+
+# Reintentos de patch() cuando otro proceso modifica la entrada en el medio
+PATCH_RETRIES = 5
+
+# Stale-while-revalidate: un resultado es fresco durante su TTL y sigue en
+# Redis STALE_TTL_FACTOR * TTL segundos más. En esa ventana se sirve igual y
+# se recalcula en segundo plano (ver app/refresh_ahead.py).
+STALE_TTL_FACTOR = float(os.environ.get("CACHE_STALE_TTL_FACTOR", "1"))
+
+# Generaciones: cada entrada guarda la suma de los contadores de sus
+# namespaces (el global "*" y el prefijo de su clave, ej. "query2") vigentes
+# cuando se calculó. Un INCR invalida todas las entradas del namespace en
+# O(1): al leerlas con una generación vieja cuentan como MISS, y después se
+# sobrescriben al recalcularse o vencen por TTL.
+GENERATION_PREFIX = "gen:"
+ALL_NAMESPACES = "*"
+ENTRY_HEADER = b"\x00"
+
+# Resultados grandes: una lista que serializada supera PAGE_BYTES se guarda en
+# páginas de unos PAGE_BYTES en una lista de Redis (clave + PAGES_SUFFIX), y la
+# entrada principal sólo guarda un manifiesto. Así ningún comando escribe o
+# lee decenas de MB de una vez, y se puede leer una sola página (get_page).
+# Los demás valores de más de MAX_VALUE_BYTES no se cachean.
+PAGE_BYTES = int(os.environ.get("CACHE_PAGE_BYTES", str(1024 * 1024)))
+MAX_VALUE_BYTES = int(os.environ.get("CACHE_MAX_VALUE_BYTES", str(32 * 1024 * 1024)))
+PAGES_SUFFIX = ":pages"
+PAGED_ENTRY_HEADER = b"\x0e"
+PAGE_TOKEN_BYTES = 8
+
+
+def tag_key(tag):
+    return f"{TAG_PREFIX}{tag}"
+
+
+def recompute_lock_key(key):
+    return f"{RECOMPUTE_LOCK_PREFIX}{key}"
+
+
+def generation_key(namespace):
+    return f"{GENERATION_PREFIX}{namespace}"
+
+
+def key_namespaces(key):
+    """Namespaces de generación de una clave: el global y su prefijo"""
+    return [ALL_NAMESPACES, cache_metrics.key_prefix(key)]
+
+
+def pages_key(key):
+    return f"{key_str(key)}{PAGES_SUFFIX}"
+
+
+def pack_entry(generation, payload, paged=False):
+    return (PAGED_ENTRY_HEADER if paged else ENTRY_HEADER) + generation.to_bytes(8, "big") + payload
+
+
+def unpack_entry(raw):
+    """
+    (generación, payload, paginada) de una entrada
+    
+    Las entradas anteriores a las generaciones valen 0. El payload de una
+    entrada paginada es su manifiesto (ver encode_entry).
+    """
+    if raw[:1] in (ENTRY_HEADER, PAGED_ENTRY_HEADER):
+        return int.from_bytes(raw[1:9], "big"), raw[9:], raw[:1] == PAGED_ENTRY_HEADER
+    return 0, raw, False
+
+
+def stale_ttl_for(ttl):
+    """Segundos que se sirve un resultado vencido mientras se recalcula"""
+    return int(ttl * STALE_TTL_FACTOR)
+
+
+def cliente_tag(id_cliente):
+    return f"cliente:{id_cliente}"
+
+
+def poliza_tag(nro_poliza):
+    return f"poliza:{nro_poliza}"
+
+
+def encode_value(data):
+    """
+    Serializar un resultado para guardarlo en Redis
+    
+    Las fechas y ObjectIds se conservan con su tipo (ver app/serialization.py),
+    así un HIT devuelve exactamente lo mismo que la consulta a MongoDB.
+    """
+    return serialization.dumps(data)
+
+
+def decode_value(raw):
+    """Deserializar un valor leído de Redis (None si no existe)"""
+    if raw:
+        return serialization.loads(raw)
+    return None
+
+
+def encode_entry(data):
+    """
+    Serializar un resultado, en páginas si es una lista grande
+    
+    Returns:
+        (payload, páginas): sin paginar, el valor y None; paginado, el
+        manifiesto y la lista de páginas, cada una precedida por el token
+        del manifiesto
+    
+    Raises:
+        ValueError: Si no es una lista y supera MAX_VALUE_BYTES
+    """
+    payload = encode_value(data)
+    if len(payload) <= PAGE_BYTES or not isinstance(data, list) or len(data) < 2:
+        if len(payload) > MAX_VALUE_BYTES:
+            raise ValueError(f"{len(payload)} bytes superan CACHE_MAX_VALUE_BYTES ({MAX_VALUE_BYTES})")
+        return payload, None
+    
+    # Filas por página según lo que ocupa el resultado ya serializado y comprimido
+    page_rows = max(1, len(data) * PAGE_BYTES // len(payload))
+    token = os.urandom(PAGE_TOKEN_BYTES)
+    pages = [token + encode_value(data[start:start + page_rows]) for start in range(0, len(data), page_rows)]
+    manifest = {"pages": len(pages), "rows": len(data), "page_rows": page_rows, "token": token.hex()}
+    return encode_value(manifest), pages
+
+
+def decode_page(raw_page, manifest):
+    """Filas de una página, o None si falta o es de otra escritura que el manifiesto"""
+    if not raw_page or raw_page[:PAGE_TOKEN_BYTES].hex() != manifest["token"]:
+        return None
+    return decode_value(raw_page[PAGE_TOKEN_BYTES:])
+
+
+def decode_pages(raw_pages, manifest):
+    """Filas de un resultado paginado, o None si sus páginas están incompletas"""
+    if len(raw_pages) != manifest["pages"]:
+        return None
+    rows = []
+    for raw_page in raw_pages:
+        page = decode_page(raw_page, manifest)
+        if page is None:
+            return None  # Se está reescribiendo o ya venció
+        rows.extend(page)
+    return rows
 
 
 class RedisCache:
-    """Clase auxiliar para operaciones de caché Redis"""
+    """
+    Clase auxiliar para operaciones de caché Redis
     
-    def __init__(self, redis_client=None):
+    Si CACHE_L1_SIZE > 0 las lecturas pasan primero por el caché en memoria
+    del proceso (ver app/local_cache.py) y las invalidaciones se publican
+    para que los demás procesos descarten sus copias.
+    """
+    
+    def __init__(self, redis_client=None, local_cache=None):
         self.redis = redis_client or get_redis_client()
+        self.local = local_cache or get_local_cache()
         self.default_ttl = 300  # TTL predeterminado de 5 minutos
+        self.locks = {}  # clave -> token de los locks de recálculo tomados
+        self.generations = {}  # clave -> generación leída antes de recalcularla
     
     def get(self, key):
         """
@@ -27,35 +207,466 @@ class RedisCache:
         Returns:
             Datos en caché o None si no se encuentra
         """
+        return self.get_entry(key)[0]
+    
+    def get_with_ttl(self, key):
+        """
+        Obtener datos en caché y su TTL en un solo viaje a Redis
+        
+        Returns:
+            (datos, segundos restantes en Redis), o (None, None) si no se encuentra
+        """
+        data, remaining = self.get_entry(key)
+        return data, int(remaining) if remaining is not None else None
+    
+    def get_entry(self, key, record=True):
+        """
+        Obtener datos en caché junto con su tiempo de vida restante
+        
+        Args:
+            key: Clave de caché
+            record: Contar la lectura como hit o miss en las métricas (las
+                    esperas de single-flight vuelven a leer sin contarla)
+        
+        Returns:
+            (datos, segundos restantes en Redis), o (None, None) si no se encuentra
+        """
+        return self.get_entries([key], record)[key]
+    
+    def get_many(self, keys):
+        """
+        Obtener varias entradas en un solo viaje a Redis
+        
+        Returns:
+            Dict clave -> datos de las claves encontradas
+        """
+        return {key: data for key, (data, _) in self.get_entries(keys).items() if data is not None}
+    
+    def get_entries(self, keys, record=True):
+        """
+        Obtener varias entradas con su tiempo de vida restante
+        
+        Las que están en el caché L1 no van a Redis; el resto se lee con un
+        único pipeline de MGET, PTTL y las generaciones de sus namespaces.
+        
+        Returns:
+            Dict clave -> (datos, segundos restantes en Redis), o (None, None)
+            para las que no se encuentran
+        """
+        entries = {}
+        pending = []
+        for key in keys:
+            data = self.local.get(key) if self.local is not None else None
+            if data is None:
+                pending.append(key)
+                continue
+            if record:
+                cache_metrics.record_hit(key, local=True)
+            entries[key] = (data, self.local.redis_ttl(key))
+        if not pending:
+            return entries
+        
         try:
-            cached = self.redis.get(key)
-            if cached:
-                return json.loads(cached)
-            return None
+            # El TTL y las generaciones vienen en el mismo viaje; el TTL
+            # evita que la copia local sobreviva a la entrada de Redis
+            namespaces = sorted({namespace for key in pending for namespace in key_namespaces(key)})
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.mget(pending)
+            for key in pending:
+                pipe.pttl(key)
+            pipe.mget([generation_key(namespace) for namespace in namespaces])
+            raws, *pttls, generations = pipe.execute()
+            generations = dict(zip(namespaces, (int(generation or 0) for generation in generations)))
+            paged = {}
+            for key, raw, pttl in zip(pending, raws, pttls):
+                current = sum(generations[namespace] for namespace in key_namespaces(key))
+                entries[key] = self._decode_entry(key, raw, pttl, current, record, paged)
+            
+            # Las páginas de los resultados paginados van en un segundo viaje
+            if paged:
+                pipe = self.redis.pipeline(transaction=False)
+                for key in paged:
+                    pipe.lrange(pages_key(key), 0, -1)
+                for key, raw_pages in zip(paged, pipe.execute()):
+                    entries[key] = self._decode_pages(key, raw_pages, *paged[key], record)
         except Exception as e:
             print(f"Error en Redis GET: {e}")
-            return None
+            for key in pending:
+                entries.setdefault(key, (None, None))
+        return entries
     
-    def set(self, key, data, ttl=None):
+    def _decode_entry(self, key, raw, pttl, current, record, paged):
+        """
+        (datos, segundos restantes) de una entrada leída de Redis con la generación vigente
+        
+        Las entradas paginadas se agregan a paged (clave -> (manifiesto,
+        segundos restantes)) para leer sus páginas después.
+        """
+        generation, payload, is_paged = unpack_entry(raw) if raw else (None, None, False)
+        if generation is None or generation < current:
+            # Quien recalcule la clave la guarda con esta generación
+            self.generations[key] = current
+            if record:
+                cache_metrics.record_miss(key)
+            return None, None
+        remaining = pttl / 1000 if pttl > 0 else None
+        if is_paged:
+            paged[key] = (decode_value(payload), remaining)
+            return None, None
+        start = time.perf_counter()
+        data = decode_value(payload)
+        cache_metrics.record_read(key, len(payload), time.perf_counter() - start)
+        return self._found(key, data, remaining, record)
+    
+    def _decode_pages(self, key, raw_pages, manifest, remaining, record):
+        start = time.perf_counter()
+        data = decode_pages(raw_pages, manifest)
+        if data is None:
+            if record:
+                cache_metrics.record_miss(key)
+            return None, None
+        cache_metrics.record_read(key, sum(map(len, raw_pages)), time.perf_counter() - start)
+        return self._found(key, data, remaining, record)
+    
+    def _found(self, key, data, remaining, record):
+        if record:
+            cache_metrics.record_hit(key)
+        if self.local is not None:
+            self.local.set(key, data, remaining)
+        return data, remaining
+    
+    def get_page(self, key, page):
+        """
+        Leer una sola página de un resultado sin descargar el resto
+        
+        Un resultado no paginado es una única página (la 0).
+        
+        Returns:
+            (filas de la página, cantidad de páginas), o (None, None) si no se encuentra
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.mget([generation_key(namespace) for namespace in key_namespaces(key)])
+            raw, generations = pipe.execute()
+            current = sum(int(generation) for generation in generations if generation)
+            generation, payload, paged = unpack_entry(raw) if raw else (None, None, False)
+            if generation is None or generation < current:
+                return None, None
+            if not paged:
+                return (decode_value(payload) if page == 0 else []), 1
+            manifest = decode_value(payload)
+            if not 0 <= page < manifest["pages"]:
+                return [], manifest["pages"]
+            rows = decode_page(self.redis.lindex(pages_key(key), page), manifest)
+            if rows is None:
+                return None, None
+            return rows, manifest["pages"]
+        except Exception as e:
+            print(f"Error en Redis GET: {e}")
+            return None, None
+    
+    def set(self, key, data, ttl=None, tags=None, stale_ttl=0):
         """
         Almacenar datos en caché Redis
         
         Args:
             key: Clave de caché
-            data: Datos a cachear (serán serializados a JSON)
+            data: Datos a cachear (ver encode_value)
             ttl: Tiempo de vida en segundos (predeterminado: 300)
+            tags: Tags de los que depende la entrada (ver invalidate_tags)
+            stale_ttl: Segundos extra que la entrada queda en Redis después
+                       de vencer, para servirla mientras se recalcula
+        """
+        return self.set_many({key: data}, ttl=ttl, tags=tags, stale_ttl=stale_ttl)
+    
+    def set_many(self, items, ttl=None, tags=None, stale_ttl=0):
+        """
+        Almacenar varias entradas en una sola transacción
+        
+        Las listas grandes se guardan paginadas (ver encode_entry): primero
+        las páginas, con un RPUSH por página para que Redis atienda a otros
+        clientes entre una y otra, y después el manifiesto.
+        
+        Args:
+            items: Dict clave -> datos
+            ttl, tags, stale_ttl: Como en set(), comunes a todas las entradas
+        
+        Returns:
+            True si se guardaron todas
         """
         try:
-            ttl = ttl or self.default_ttl
-            self.redis.setex(
-                key,
-                ttl,
-                json.dumps(data, default=str)  # default=str maneja fechas
-            )
-            return True
+            ttl = (ttl or self.default_ttl) + stale_ttl
+            entries = {}
+            for key, data in items.items():
+                start = time.perf_counter()
+                try:
+                    entries[key] = encode_entry(data)
+                except ValueError as e:
+                    print(f"✗ No se cachea {key_str(key)}: {e}")
+                    continue
+                payload, pages = entries[key]
+                cache_metrics.record_write(key, len(payload) + sum(map(len, pages or ())), time.perf_counter() - start)
+            if not entries:
+                return False
+            current = self.current_generations(list(entries))
+            generations = {key: self.generations.pop(key, current[key]) for key in entries}
+            for key in [key for key in entries if generations[key] < current[key]]:
+                # Se invalidó durante el recálculo: se guardaría ya vencida
+                print(f"✗ No se cachea {key_str(key)}: se invalidó mientras se calculaba")
+                del entries[key]
+            if not entries:
+                return False
+            
+            paged = [key for key, (_, pages) in entries.items() if pages]
+            if paged:
+                pipe = self.redis.pipeline(transaction=False)
+                for key in paged:
+                    pipe.unlink(pages_key(key))
+                    for page in entries[key][1]:
+                        pipe.rpush(pages_key(key), page)
+                    pipe.expire(pages_key(key), ttl)
+                pipe.execute()
+            
+            pipe = self.redis.pipeline(transaction=True)
+            for key, (payload, pages) in entries.items():
+                pipe.setex(key, ttl, pack_entry(generations[key], payload, paged=pages is not None))
+                if pages is None:
+                    pipe.unlink(pages_key(key))  # Por si antes estaba paginada
+            for tag in tags or ():
+                pipe.sadd(tag_key(tag), *entries, *map(pages_key, paged))
+                # El set vive tanto como su entrada más duradera
+                pipe.expire(tag_key(tag), ttl, nx=True)
+                pipe.expire(tag_key(tag), ttl, gt=True)
+            pipe.execute()
+            if self.local is not None:
+                # Guardar lo mismo que devolvería un GET a Redis; las
+                # paginadas se guardan en L1 cuando se leen
+                for key, (payload, pages) in entries.items():
+                    if pages is None:
+                        self.local.set(key, decode_value(payload), ttl)
+            return len(entries) == len(items)
         except Exception as e:
             print(f"Error en Redis SET: {e}")
             return False
+        finally:
+            for key in items:
+                self.release_recompute_lock(key)
+    
+    def get_or_wait(self, key, wait=RECOMPUTE_WAIT_S):
+        """
+        Obtener datos en caché evitando recálculos simultáneos (single-flight)
+        
+        En un MISS intenta tomar el lock de recálculo de la clave. Si lo
+        consigue devuelve None: el llamador calcula el valor y set() libera
+        el lock. Si otro proceso ya está recalculando, espera hasta `wait`
+        segundos a que aparezca el valor; pasado ese tiempo devuelve None y
+        el llamador calcula por su cuenta.
+        
+        Returns:
+            Datos en caché o None si el llamador debe calcularlos
+        """
+        data = self.get(key)
+        if data is not None:
+            return data
+        return self.wait_for_recompute(key, wait)
+    
+    def wait_for_recompute(self, key, wait=RECOMPUTE_WAIT_S):
+        """
+        Tomar el lock de recálculo de una clave ausente o esperar su valor
+        
+        Returns:
+            El valor calculado por otro proceso, o None si el llamador debe calcularlo
+        """
+        deadline = time.monotonic() + wait
+        while not self.acquire_recompute_lock(key):
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(RECOMPUTE_POLL_S)
+            data = self.get_entry(key, record=False)[0]
+            if data is not None:
+                return data
+        
+        # El proceso anterior pudo terminar entre el GET y el lock
+        data = self.get_entry(key, record=False)[0]
+        if data is not None:
+            self.release_recompute_lock(key)
+        return data
+    
+    def get_or_compute(self, key, compute, ttl=None, tags=None):
+        """
+        Obtener datos en caché o calcularlos con compute() y cachearlos
+        
+        Returns:
+            (datos, hit); ver get_or_compute_with_ttl
+        """
+        return self.get_or_compute_with_ttl(key, compute, ttl=ttl, tags=tags)[:2]
+    
+    def get_or_compute_with_ttl(self, key, compute, ttl=None, tags=None):
+        """
+        Obtener datos en caché o calcularlos, junto con su TTL en Redis
+        
+        Un resultado vencido pero todavía dentro de su ventana stale se
+        devuelve enseguida y se recalcula en segundo plano. En un MISS sólo
+        un proceso ejecuta compute() (ver get_or_wait).
+        
+        Args:
+            key: Clave de caché
+            compute: Función sin argumentos que calcula el resultado
+            ttl: Segundos durante los que el resultado es fresco
+            tags: Tags de los que depende la entrada
+            
+        Returns:
+            (datos, hit, segundos restantes en Redis), sin otro viaje para el TTL
+        """
+        ttl = ttl or self.default_ttl
+        stale_ttl = stale_ttl_for(ttl)
+        refresh_ahead.register(key, compute, ttl, tags)
+        
+        data, remaining = self.get_entry(key)
+        if data is not None:
+            refresh_ahead.record_hit(key)
+            if remaining is not None and remaining <= stale_ttl:
+                cache_metrics.record_stale_hit(key)
+                refresh_ahead.refresh_in_background(key)
+            return data, True, remaining
+        
+        data = self.wait_for_recompute(key)
+        if data is not None:
+            # Otro proceso acaba de guardarlo
+            return data, True, ttl + stale_ttl
+        try:
+            self.pin_generation(key)
+            start = time.perf_counter()
+            data = compute()
+            cache_metrics.record_recompute(key, time.perf_counter() - start)
+        except Exception:
+            self.release_recompute_lock(key)
+            raise
+        self.set(key, data, ttl=ttl, tags=tags, stale_ttl=stale_ttl)
+        return data, False, ttl + stale_ttl
+    
+    def refresh(self, key, compute, ttl=None, tags=None):
+        """
+        Recalcular una entrada si ningún otro proceso lo está haciendo
+        
+        Returns:
+            True si se recalculó y guardó, False si set() falló o fue
+            rechazado, None si otro proceso ya la está recalculando
+        """
+        if not self.acquire_recompute_lock(key):
+            return None
+        try:
+            self.pin_generation(key)
+            start = time.perf_counter()
+            data = compute()
+            cache_metrics.record_recompute(key, time.perf_counter() - start)
+        except Exception:
+            self.release_recompute_lock(key)
+            raise
+        ttl = ttl or self.default_ttl
+        return self.set(key, data, ttl=ttl, tags=tags, stale_ttl=stale_ttl_for(ttl))
+    
+    def pin_generation(self, key):
+        """
+        Fijar la generación vigente de una clave antes de recalcularla
+        
+        set() la guarda con esta generación, así una invalidación que llega
+        durante compute() deja la entrada ya vencida en vez de sellar un
+        resultado viejo con la generación nueva.
+        """
+        try:
+            self.generations[key] = self.current_generation(key)
+        except Exception as e:
+            print(f"Error en Redis MGET: {e}")
+    
+    def acquire_recompute_lock(self, key):
+        """Tomar el lock de recálculo de una clave (SET NX PX)"""
+        token = uuid.uuid4().hex
+        try:
+            if not self.redis.set(recompute_lock_key(key), token, nx=True, px=RECOMPUTE_LOCK_TTL_MS):
+                return False
+        except Exception as e:
+            print(f"Error en Redis LOCK: {e}")
+            return True  # Sin Redis no hay con quién coordinarse
+        self.locks[key] = token
+        return True
+    
+    def release_recompute_lock(self, key):
+        """Liberar el lock de recálculo si sigue siendo de esta instancia"""
+        token = self.locks.pop(key, None)
+        if token is None:
+            return
+        lock_key = recompute_lock_key(key)
+        try:
+            with self.redis.pipeline(transaction=True) as pipe:
+                pipe.watch(lock_key)
+                if pipe.get(lock_key) == token.encode():
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    pipe.execute()
+        except WatchError:
+            pass  # El lock venció y ya es de otro proceso
+        except Exception as e:
+            print(f"Error en Redis UNLOCK: {e}")
+    
+    def patch(self, key, update):
+        """
+        Actualizar en el lugar un resultado cacheado (write-through)
+        
+        Lee la entrada con WATCH, le aplica update y, en la misma
+        transacción, sube la generación del namespace de la clave y reescribe
+        la entrada con el mismo TTL y la generación nueva; si otro proceso la
+        modifica en el medio, reintenta. Así un recálculo que leyó MongoDB
+        antes de la escritura (con la generación anterior fijada) no puede
+        pisar el parche: set() guarda su resultado ya vencido.
+        
+        Si no se puede parchear (no está en caché, está vencida o paginada,
+        alguien la está recalculando, update devuelve None o no se logra
+        escribir) sólo se sube la generación: la entrada y cualquier recálculo
+        en curso quedan invalidados. La generación es por namespace, así que
+        patch conviene para namespaces de una sola entrada, como los de las
+        consultas 1 a 12.
+        
+        Args:
+            key: Clave de caché
+            update: Función que recibe los datos cacheados y devuelve los nuevos, o None
+        
+        Returns:
+            True si se actualizó, False si se invalidó
+        """
+        namespace = cache_metrics.key_prefix(key)
+        generation_keys = [generation_key(name) for name in key_namespaces(key)]
+        try:
+            for _ in range(PATCH_RETRIES):
+                with self.redis.pipeline(transaction=True) as pipe:
+                    try:
+                        pipe.watch(key, recompute_lock_key(key), *generation_keys)
+                        raw = pipe.get(key)
+                        if not raw:
+                            break
+                        generation, payload, paged = unpack_entry(raw)
+                        current = sum(int(value or 0) for value in pipe.mget(generation_keys))
+                        if paged or generation < current or pipe.exists(recompute_lock_key(key)):
+                            break
+                        data = update(decode_value(payload))
+                        if data is None:
+                            break
+                        payload, pages = encode_entry(data)
+                        if pages is not None:
+                            break
+                        pipe.multi()
+                        pipe.incr(generation_key(namespace))
+                        pipe.set(key, pack_entry(current + 1, payload), keepttl=True)
+                        pipe.execute()
+                    except WatchError:
+                        continue
+                self._evict_local(pattern=f"{namespace}:*")
+                return True
+        except Exception as e:
+            print(f"Error en Redis PATCH: {e}")
+        self.invalidate_namespaces(namespace)
+        return False
     
     def delete(self, key):
         """
@@ -65,29 +676,133 @@ class RedisCache:
             key: Clave de caché a eliminar
         """
         try:
-            self.redis.delete(key)
+            self.redis.unlink(key, pages_key(key))
+            self._evict_local(keys=[key])
             return True
         except Exception as e:
             print(f"Error en Redis DELETE: {e}")
             return False
     
-    def clear_pattern(self, pattern):
+    def scan_keys(self, pattern, batch_size=SCAN_BATCH_SIZE):
+        """
+        Iterar las claves que coinciden con un patrón
+        
+        Usa SCAN en lugar de KEYS: cada llamada al servidor recorre sólo
+        batch_size claves, así no bloquea a los demás clientes.
+        """
+        return self.redis.scan_iter(match=pattern, count=batch_size)
+    
+    def clear_pattern(self, pattern, batch_size=SCAN_BATCH_SIZE):
         """
         Limpiar todas las claves que coincidan con un patrón
         
+        Las claves se borran por lotes con UNLINK (la memoria se libera en
+        segundo plano) enviados en un pipeline.
+        
         Args:
             pattern: Patrón a coincidir (ej., "query:*")
+            batch_size: Claves por iteración de SCAN y por UNLINK
         """
         try:
-            keys = self.redis.keys(pattern)
-            if keys:
-                self.redis.delete(*keys)
-                return len(keys)
-            return 0
+            count = 0
+            batch = []
+            pipe = self.redis.pipeline(transaction=False)
+            for key in self.scan_keys(pattern, batch_size):
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    pipe.unlink(*batch)
+                    count += len(batch)
+                    batch = []
+                    # Bound the keys buffered client-side
+                    if len(pipe) >= UNLINKS_PER_PIPELINE:
+                        pipe.execute()
+            if batch:
+                pipe.unlink(*batch)
+                count += len(batch)
+            if len(pipe):
+                pipe.execute()
+            self._evict_local(pattern=pattern)
+            return count
         except Exception as e:
             print(f"Error en Redis CLEAR: {e}")
             return 0
     
+    def invalidate_tags(self, *tags):
+        """
+        Eliminar las entradas registradas bajo cualquiera de los tags
+        
+        Cuesta O(entradas dependientes), sin recorrer el keyspace. Los sets
+        se leen y se borran en una sola transacción, así una entrada que se
+        registra mientras tanto queda en un set nuevo y no se pierde.
+        
+        Returns:
+            Cantidad de claves eliminadas
+        """
+        try:
+            return self.drop_tags(*tags)
+        except Exception as e:
+            print(f"Error en Redis INVALIDATE: {e}")
+            return 0
+    
+    def drop_tags(self, *tags):
+        """invalidate_tags() que propaga los errores de Redis en vez de ignorarlos"""
+        if not tags:
+            return 0
+        pipe = self.redis.pipeline(transaction=True)
+        for tag in tags:
+            pipe.smembers(tag_key(tag))
+        pipe.unlink(*[tag_key(tag) for tag in tags])
+        keys = list(set().union(*pipe.execute()[:-1]))
+        
+        if not keys:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for start in range(0, len(keys), SCAN_BATCH_SIZE):
+            pipe.unlink(*keys[start:start + SCAN_BATCH_SIZE])
+        # Keys that already expired are not counted
+        count = sum(pipe.execute())
+        self._evict_local(keys=keys)
+        return count
+    
+    def current_generation(self, key):
+        """Suma de las generaciones vigentes de los namespaces de una clave"""
+        return self.current_generations([key])[key]
+    
+    def current_generations(self, keys):
+        """current_generation() de varias claves con un solo MGET"""
+        if not keys:
+            return {}
+        namespaces = sorted({namespace for key in keys for namespace in key_namespaces(key)})
+        values = self.redis.mget([generation_key(namespace) for namespace in namespaces])
+        generations = dict(zip(namespaces, (int(value or 0) for value in values)))
+        return {key: sum(generations[namespace] for namespace in key_namespaces(key)) for key in keys}
+    
+    def invalidate_namespaces(self, *namespaces):
+        """
+        Invalidar todas las entradas de los namespaces con un INCR por namespace
+        
+        Cuesta lo mismo sin importar cuántas claves haya. Las entradas viejas
+        no se borran: dejan de servirse y vencen por TTL.
+        
+        Args:
+            namespaces: Prefijos de clave (ej., "query2") o ALL_NAMESPACES
+        """
+        try:
+            self.bump_generations(*namespaces)
+            return True
+        except Exception as e:
+            print(f"Error en Redis INCR: {e}")
+            return False
+    
+    def bump_generations(self, *namespaces):
+        """invalidate_namespaces() que propaga los errores de Redis en vez de ignorarlos"""
+        pipe = self.redis.pipeline(transaction=False)
+        for namespace in namespaces:
+            pipe.incr(generation_key(namespace))
+        pipe.execute()
+        for namespace in namespaces:
+            self._evict_local(pattern="*" if namespace == ALL_NAMESPACES else f"{namespace}:*")
+    
     def exists(self, key):
         """Verificar si la clave existe en caché"""
         try:
@@ -96,49 +811,206 @@ class RedisCache:
             print(f"Error en Redis EXISTS: {e}")
             return False
     
+    def _evict_local(self, keys=(), pattern=None):
+        """Descartar las copias en memoria de este proceso y de los demás"""
+        if self.local is not None:
+            self.local.invalidate(keys)
+            if pattern is not None:
+                self.local.invalidate_pattern(pattern)
+        publish_invalidation(self.redis, keys, pattern)
+    
     def get_ttl(self, key):
         """Obtener el TTL restante para una clave"""
         try:
+            if self.local is not None:
+                ttl = self.local.redis_ttl(key)
+                if ttl is not None:
+                    return ttl
             return self.redis.ttl(key)
         except Exception as e:
             print(f"Error en Redis TTL: {e}")
             return -1
 
 
-def cached_query(cache_key, ttl=300):
+# Consultas decoradas con cached_query, por namespace
+QUERY_REGISTRY = {}
+
+
+def normalize_args(func, args, kwargs):
+    """Argumentos de una llamada por nombre, sin los que valen su default"""
+    signature = inspect.signature(func)
+    bound = signature.bind(*args, **kwargs)
+    return {
+        name: value for name, value in bound.arguments.items()
+        if value != signature.parameters[name].default
+    }
+
+
+class CachedQuery:
+    """
+    Función de consulta cuyo resultado se cachea en Redis (ver cached_query)
+    
+    Llamarla devuelve el resultado; lookup() devuelve (resultado, hit). Las
+    dos aceptan use_cache=False para ir directo a MongoDB y cache_ttl para
+    cambiar el TTL de esa llamada.
+    """
+    
+    def __init__(self, func, namespace, ttl, tags):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.namespace = namespace
+        self.ttl = ttl
+        self.tags = tags
+        self.stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "hit_seconds": 0.0, "miss_seconds": 0.0}
+    
+    def cache_key(self, *args, **kwargs):
+        """
+        Clave de caché de una llamada
+        
+        Sin argumentos (o con todos en su default) es el namespace; si no,
+        el namespace seguido de un hash de los argumentos normalizados.
+        """
+        params = normalize_args(self.func, args, kwargs)
+        if not params:
+            return self.namespace
+        canonical = json.dumps(params, sort_keys=True, default=str, separators=(",", ":"))
+        return f"{self.namespace}:{hashlib.sha1(canonical.encode()).hexdigest()[:16]}"
+    
+    def tags_for(self, *args, **kwargs):
+        if callable(self.tags):
+            return self.tags(*args, **kwargs)
+        return self.tags
+    
+    def lookup(self, *args, use_cache=True, cache_ttl=None, **kwargs):
+        """
+        Ejecutar la consulta pasando por el caché
+        
+        Returns:
+            (resultado, hit)
+        """
+        return self.lookup_with_ttl(*args, use_cache=use_cache, cache_ttl=cache_ttl, **kwargs)[:2]
+    
+    def lookup_with_ttl(self, *args, use_cache=True, cache_ttl=None, **kwargs):
+        """
+        Como lookup(), con los segundos hasta que el resultado queda stale
+        
+        El TTL viene en el mismo viaje a Redis que el resultado, así mostrarlo
+        no cuesta un TTL aparte.
+        
+        Returns:
+            (resultado, hit, segundos restantes), None si no se cacheó
+        """
+        if not use_cache:
+            return self.func(*args, **kwargs), False, None
+        
+        ttl = cache_ttl or self.ttl
+        start = time.perf_counter()
+        result, hit, remaining = RedisCache().get_or_compute_with_ttl(
+            self.cache_key(*args, **kwargs),
+            functools.partial(self.func, *args, **kwargs),
+            ttl=ttl,
+            tags=self.tags_for(*args, **kwargs),
+        )
+        elapsed = time.perf_counter() - start
+        with self.stats_lock:
+            if hit:
+                self.stats["hits"] += 1
+                self.stats["hit_seconds"] += elapsed
+            else:
+                self.stats["misses"] += 1
+                self.stats["miss_seconds"] += elapsed
+        if remaining is not None:
+            remaining = max(0, int(remaining) - stale_ttl_for(ttl))
+        return result, hit, remaining
+    
+    def __call__(self, *args, use_cache=True, cache_ttl=None, **kwargs):
+        return self.lookup(*args, use_cache=use_cache, cache_ttl=cache_ttl, **kwargs)[0]
+    
+    def get_ttl(self, *args, **kwargs):
+        """Segundos hasta que el resultado cacheado de una llamada queda stale"""
+        ttl = RedisCache().get_ttl(self.cache_key(*args, **kwargs))
+        if ttl < 0:
+            return ttl
+        return max(0, ttl - stale_ttl_for(self.ttl))
+    
+    def get_page(self, page, *args, **kwargs):
+        """Una página del resultado cacheado de una llamada (ver RedisCache.get_page)"""
+        return RedisCache().get_page(self.cache_key(*args, **kwargs), page)
+    
+    def invalidate(self, *args, **kwargs):
+        """Borrar el resultado cacheado de una llamada"""
+        return RedisCache().delete(self.cache_key(*args, **kwargs))
+    
+    def timing_stats(self):
+        """Hits, misses y latencia media en milisegundos de cada caso"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        return {
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "avg_hit_ms": round(stats["hit_seconds"] / stats["hits"] * 1000, 2) if stats["hits"] else None,
+            "avg_miss_ms": round(stats["miss_seconds"] / stats["misses"] * 1000, 2) if stats["misses"] else None,
+        }
+
+
+def cached_query(namespace=None, ttl=300, tags=None):
     """
     Decorador para cachear resultados de consultas
     
+    La clave se arma con el namespace (por defecto módulo:función) y los
+    argumentos de cada llamada, así variantes con distintos parámetros
+    (fechas, filtros, páginas) no se pisan.
+    
+    Args:
+        namespace: Prefijo de las claves (ej., "query2:open_claims")
+        ttl: TTL en segundos (ver RedisCache.get_or_compute)
+        tags: Lista de tags, o función de los mismos argumentos que la consulta que la devuelve
+    
     Uso:
-        @cached_query("query1:active_clients", ttl=600)
-        def get_active_clients():
-            # ... lógica de consulta
-            return result
+        @cached_query("query1:active_clients", ttl=600, tags=["clientes"])
+        def fetch_active_clients():
+            return list(get_mongo_collection().find(...))
+        
+        result, hit = fetch_active_clients.lookup(use_cache=True)
     """
     def decorator(func):
-        def wrapper(*args, **kwargs):
-            cache = RedisCache()
-            
-            # Intentar obtener del caché
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                print(f"✓ Cache HIT: {cache_key}")
-                return cached_result
-            
-            print(f"✗ Cache MISS: {cache_key} - Consultando MongoDB...")
-            
-            # Ejecutar la función
-            result = func(*args, **kwargs)
-            
-            # Almacenar en caché
-            cache.set(cache_key, result, ttl)
-            print(f"✓ Resultado cacheado por {ttl} segundos")
-            
-            return result
-        return wrapper
+        query = CachedQuery(func, namespace or f"{func.__module__}:{func.__name__}", ttl, tags)
+        QUERY_REGISTRY[query.namespace] = query
+        return query
     return decorator
 
 
+def cached_query_stats():
+    """Estadísticas de hits, misses y latencia de cada consulta registrada"""
+    return {namespace: query.timing_stats() for namespace, query in sorted(QUERY_REGISTRY.items())}
+
+
+def cached_results(*queries):
+    """
+    Resultados cacheados de varias consultas (sin argumentos) en un solo viaje
+    
+    No calcula las que faltan: sirve para tableros que muestran varias
+    consultas a la vez.
+    
+    Args:
+        queries: Consultas decoradas con cached_query (por defecto, todas las registradas)
+    
+    Returns:
+        Dict namespace -> (resultado, segundos hasta quedar stale), o
+        (None, None) si no está en caché
+    """
+    queries = queries or [QUERY_REGISTRY[namespace] for namespace in sorted(QUERY_REGISTRY)]
+    entries = RedisCache().get_entries([query.cache_key() for query in queries])
+    results = {}
+    for query in queries:
+        data, remaining = entries[query.cache_key()]
+        if remaining is not None:
+            remaining = max(0, int(remaining) - stale_ttl_for(query.ttl))
+        results[query.namespace] = (data, remaining)
+    return results
+
+
 def invalidate_cache_pattern(pattern):
     """
     Invalidar todas las entradas de caché que coincidan con un patrón
@@ -152,8 +1024,38 @@ def invalidate_cache_pattern(pattern):
     return count
 
 
+def invalidate_namespaces(*namespaces):
+    """
+    Invalidar todas las entradas de caché de los namespaces en O(1)
+    
+    Uso:
+        invalidate_namespaces("query2")
+        invalidate_namespaces(ALL_NAMESPACES)
+    """
+    RedisCache().invalidate_namespaces(*namespaces)
+    print(f"✓ Invalidados los namespaces de caché {', '.join(namespaces)}")
+
+
+def invalidate_tags(*tags):
+    """
+    Invalidar todas las entradas de caché registradas bajo los tags
+    
+    Uso:
+        invalidate_tags("polizas", poliza_tag("POL1001"))
+    """
+    count = RedisCache().invalidate_tags(*tags)
+    print(f"✓ Invalidadas {count} entradas de caché con tags {', '.join(tags)}")
+    return count
+
+
 def get_cache_stats():
-    """Obtener estadísticas de caché Redis"""
+    """
+    Obtener estadísticas de caché Redis
+    
+    keyspace_hits/keyspace_misses son de toda la base (leaderboard
+    incluido); hit_rate_percent y "prefixes" salen de las métricas propias
+    del caché, por prefijo de clave (ver app/cache_metrics.py).
+    """
     cache = RedisCache()
     redis = cache.redis
     
@@ -172,9 +1074,14 @@ def get_cache_stats():
             "keyspace_misses": info.get('keyspace_misses', 0),
         }
         
-        if stats['keyspace_hits'] + stats['keyspace_misses'] > 0:
-            hit_rate = stats['keyspace_hits'] / (stats['keyspace_hits'] + stats['keyspace_misses']) * 100
-            stats['hit_rate_percent'] = round(hit_rate, 2)
+        prefixes = cache_metrics.metrics_summary(redis)
+        hits = sum(prefix['hits'] for prefix in prefixes.values())
+        misses = sum(prefix['misses'] for prefix in prefixes.values())
+        stats['prefixes'] = prefixes
+        stats['hits'] = hits
+        stats['misses'] = misses
+        if hits + misses > 0:
+            stats['hit_rate_percent'] = round(hits / (hits + misses) * 100, 2)
         else:
             stats['hit_rate_percent'] = 0
         
@@ -0,0 +1,425 @@
+"""
+Caché Redis asíncrono
+
+Versión async de RedisCache sobre redis.asyncio. Usa la misma serialización
+que app/cache.py, así que las entradas son compartidas con las consultas
+sincrónicas.
+"""
+
+import time
+import uuid
+import asyncio
+from redis.exceptions import WatchError
+
+from app.cache import (
+    RedisCache, encode_entry, decode_value, decode_page, tag_key, recompute_lock_key, stale_ttl_for, SCAN_BATCH_SIZE,
+    generation_key, key_namespaces, pack_entry, unpack_entry, pages_key, ALL_NAMESPACES,
+    RECOMPUTE_LOCK_TTL_MS, RECOMPUTE_WAIT_S, RECOMPUTE_POLL_S, PATCH_RETRIES,
+)
+from app import cache_metrics
+from app.db_async import get_async_redis_client
+from app.local_cache import get_local_cache, invalidation_message, INVALIDATION_CHANNEL
+
+
+# key -> background refresh task, so each key refreshes once at a time and
+# the tasks are not garbage collected while running
+_refreshing = {}
+
+
+class AsyncRedisCache:
+    """Operaciones de caché Redis para corrutinas"""
+
+    def __init__(self, redis_client=None, local_cache=None):
+        self.redis = redis_client or get_async_redis_client()
+        self.local = local_cache or get_local_cache()
+        self.default_ttl = 300
+        self.generations = {}
+
+    async def get(self, key):
+        """Obtener datos en caché (None si no se encuentra), pasando por el caché L1"""
+        return (await self.get_entry(key))[0]
+
+    async def get_with_ttl(self, key):
+        """(datos, segundos restantes en Redis) en un solo viaje, o (None, None) si no se encuentra"""
+        data, remaining = await self.get_entry(key)
+        return data, int(remaining) if remaining is not None else None
+
+    async def get_entry(self, key, record=True):
+        """(datos, segundos restantes en Redis), o (None, None) si no se encuentra; record como en RedisCache"""
+        return (await self.get_entries([key], record))[key]
+
+    async def get_many(self, keys):
+        """Dict clave -> datos de las claves encontradas, en un solo viaje a Redis"""
+        return {key: data for key, (data, _) in (await self.get_entries(keys)).items() if data is not None}
+
+    async def get_entries(self, keys, record=True):
+        """Dict clave -> (datos, segundos restantes en Redis) con un único pipeline, más uno para las páginas (ver RedisCache)"""
+        entries = {}
+        pending = []
+        for key in keys:
+            data = self.local.get(key) if self.local is not None else None
+            if data is None:
+                pending.append(key)
+                continue
+            if record:
+                cache_metrics.record_hit(key, local=True)
+            entries[key] = (data, self.local.redis_ttl(key))
+        if not pending:
+            return entries
+
+        try:
+            namespaces = sorted({namespace for key in pending for namespace in key_namespaces(key)})
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.mget(pending)
+                for key in pending:
+                    pipe.pttl(key)
+                pipe.mget([generation_key(namespace) for namespace in namespaces])
+                raws, *pttls, generations = await pipe.execute()
+            generations = dict(zip(namespaces, (int(generation or 0) for generation in generations)))
+            paged = {}
+            for key, raw, pttl in zip(pending, raws, pttls):
+                current = sum(generations[namespace] for namespace in key_namespaces(key))
+                entries[key] = self._decode_entry(key, raw, pttl, current, record, paged)
+            if paged:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key in paged:
+                        pipe.lrange(pages_key(key), 0, -1)
+                    raw_pages = await pipe.execute()
+                for key, pages in zip(paged, raw_pages):
+                    entries[key] = self._decode_pages(key, pages, *paged[key], record)
+        except Exception as e:
+            print(f"Error en Redis GET: {e}")
+            for key in pending:
+                entries.setdefault(key, (None, None))
+        return entries
+
+    # Sin I/O: la misma lógica que RedisCache sirve para las dos versiones
+    _decode_entry = RedisCache._decode_entry
+    _decode_pages = RedisCache._decode_pages
+    _found = RedisCache._found
+
+    async def get_page(self, key, page):
+        """(filas de la página, cantidad de páginas), o (None, None) si no se encuentra (ver RedisCache)"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.mget([generation_key(namespace) for namespace in key_namespaces(key)])
+                raw, generations = await pipe.execute()
+            current = sum(int(generation) for generation in generations if generation)
+            generation, payload, paged = unpack_entry(raw) if raw else (None, None, False)
+            if generation is None or generation < current:
+                return None, None
+            if not paged:
+                return (decode_value(payload) if page == 0 else []), 1
+            manifest = decode_value(payload)
+            if not 0 <= page < manifest["pages"]:
+                return [], manifest["pages"]
+            rows = decode_page(await self.redis.lindex(pages_key(key), page), manifest)
+            if rows is None:
+                return None, None
+            return rows, manifest["pages"]
+        except Exception as e:
+            print(f"Error en Redis GET: {e}")
+            return None, None
+
+    async def set(self, key, data, ttl=None, tags=None, stale_ttl=0):
+        """Almacenar datos en caché con un TTL en segundos (más la ventana stale), registrados bajo tags"""
+        return await self.set_many({key: data}, ttl=ttl, tags=tags, stale_ttl=stale_ttl)
+
+    async def set_many(self, items, ttl=None, tags=None, stale_ttl=0):
+        """Almacenar varias entradas (dict clave -> datos), las listas grandes paginadas (ver RedisCache)"""
+        try:
+            ttl = (ttl or self.default_ttl) + stale_ttl
+            entries = {}
+            for key, data in items.items():
+                start = time.perf_counter()
+                try:
+                    entries[key] = encode_entry(data)
+                except ValueError as e:
+                    print(f"✗ No se cachea {key}: {e}")
+                    continue
+                payload, pages = entries[key]
+                cache_metrics.record_write(key, len(payload) + sum(map(len, pages or ())), time.perf_counter() - start)
+            if not entries:
+                return False
+            current = await self.current_generations(list(entries))
+            generations = {key: self.generations.pop(key, current[key]) for key in entries}
+            for key in [key for key in entries if generations[key] < current[key]]:
+                print(f"✗ No se cachea {key}: se invalidó mientras se calculaba")
+                del entries[key]
+            if not entries:
+                return False
+
+            paged = [key for key, (_, pages) in entries.items() if pages]
+            if paged:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key in paged:
+                        pipe.unlink(pages_key(key))
+                        for page in entries[key][1]:
+                            pipe.rpush(pages_key(key), page)
+                        pipe.expire(pages_key(key), ttl)
+                    await pipe.execute()
+
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for key, (payload, pages) in entries.items():
+                    pipe.setex(key, ttl, pack_entry(generations[key], payload, paged=pages is not None))
+                    if pages is None:
+                        pipe.unlink(pages_key(key))
+                for tag in tags or ():
+                    pipe.sadd(tag_key(tag), *entries, *map(pages_key, paged))
+                    pipe.expire(tag_key(tag), ttl, nx=True)
+                    pipe.expire(tag_key(tag), ttl, gt=True)
+                await pipe.execute()
+            if self.local is not None:
+                for key, (payload, pages) in entries.items():
+                    if pages is None:
+                        self.local.set(key, decode_value(payload), ttl)
+            return len(entries) == len(items)
+        except Exception as e:
+            print(f"Error en Redis SET: {e}")
+            return False
+
+    async def get_or_compute(self, key, compute, ttl=None, tags=None, wait=RECOMPUTE_WAIT_S):
+        """
+        Valor en caché de key o, en un MISS, el resultado de await compute()
+
+        Como RedisCache.get_or_compute: un resultado dentro de su ventana
+        stale se devuelve y se recalcula en una tarea aparte, y en un MISS
+        sólo quien toma el lock de recálculo ejecuta compute(); el resto
+        espera hasta `wait` segundos a que aparezca el valor.
+
+        Returns:
+            (datos, hit)
+        """
+        ttl = ttl or self.default_ttl
+        data, remaining = await self.get_entry(key)
+        if data is not None:
+            if remaining is not None and remaining <= stale_ttl_for(ttl):
+                cache_metrics.record_stale_hit(key)
+                if key not in _refreshing:
+                    task = asyncio.create_task(self.refresh(key, compute, ttl, tags))
+                    _refreshing[key] = task
+                    task.add_done_callback(lambda _: _refreshing.pop(key, None))
+            return data, True
+
+        lock_key = recompute_lock_key(key)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        while not await self._acquire_lock(lock_key, token):
+            if time.monotonic() >= deadline:
+                token = None
+                break
+            await asyncio.sleep(RECOMPUTE_POLL_S)
+            data = (await self.get_entry(key, record=False))[0]
+            if data is not None:
+                return data, True
+
+        try:
+            if token is not None:
+                # El proceso anterior pudo terminar entre el GET y el lock
+                data = (await self.get_entry(key, record=False))[0]
+                if data is not None:
+                    return data, True
+            await self.pin_generation(key)
+            start = time.perf_counter()
+            data = await compute()
+            cache_metrics.record_recompute(key, time.perf_counter() - start)
+            await self.set(key, data, ttl=ttl, tags=tags, stale_ttl=stale_ttl_for(ttl))
+            return data, False
+        finally:
+            if token is not None:
+                await self._release_lock(lock_key, token)
+
+    async def refresh(self, key, compute, ttl=None, tags=None):
+        """Recalcular una entrada si ningún otro proceso lo está haciendo (ver RedisCache.refresh)"""
+        lock_key = recompute_lock_key(key)
+        token = uuid.uuid4().hex
+        if not await self._acquire_lock(lock_key, token):
+            return None
+        try:
+            ttl = ttl or self.default_ttl
+            await self.pin_generation(key)
+            start = time.perf_counter()
+            data = await compute()
+            cache_metrics.record_recompute(key, time.perf_counter() - start)
+            return await self.set(key, data, ttl=ttl, tags=tags, stale_ttl=stale_ttl_for(ttl))
+        except Exception as e:
+            print(f"Error refrescando {key}: {e}")
+            return False
+        finally:
+            await self._release_lock(lock_key, token)
+
+    async def pin_generation(self, key):
+        """Fijar la generación vigente de una clave antes de recalcularla (ver RedisCache)"""
+        try:
+            self.generations[key] = await self.current_generation(key)
+        except Exception as e:
+            print(f"Error en Redis MGET: {e}")
+
+    async def _acquire_lock(self, lock_key, token):
+        try:
+            return bool(await self.redis.set(lock_key, token, nx=True, px=RECOMPUTE_LOCK_TTL_MS))
+        except Exception as e:
+            print(f"Error en Redis LOCK: {e}")
+            return True
+
+    async def _release_lock(self, lock_key, token):
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(lock_key)
+                if await pipe.get(lock_key) == token.encode():
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    await pipe.execute()
+        except WatchError:
+            pass
+        except Exception as e:
+            print(f"Error en Redis UNLOCK: {e}")
+
+    async def patch(self, key, update):
+        """Actualizar en el lugar un resultado cacheado con WATCH subiendo su generación, o invalidarlo (ver RedisCache)"""
+        namespace = cache_metrics.key_prefix(key)
+        generation_keys = [generation_key(name) for name in key_namespaces(key)]
+        try:
+            for _ in range(PATCH_RETRIES):
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    try:
+                        await pipe.watch(key, recompute_lock_key(key), *generation_keys)
+                        raw = await pipe.get(key)
+                        if not raw:
+                            break
+                        generation, payload, paged = unpack_entry(raw)
+                        current = sum(int(value or 0) for value in await pipe.mget(generation_keys))
+                        if paged or generation < current or await pipe.exists(recompute_lock_key(key)):
+                            break
+                        data = update(decode_value(payload))
+                        if data is None:
+                            break
+                        payload, pages = encode_entry(data)
+                        if pages is not None:
+                            break
+                        pipe.multi()
+                        pipe.incr(generation_key(namespace))
+                        pipe.set(key, pack_entry(current + 1, payload), keepttl=True)
+                        await pipe.execute()
+                    except WatchError:
+                        continue
+                await self._evict_local(pattern=f"{namespace}:*")
+                return True
+        except Exception as e:
+            print(f"Error en Redis PATCH: {e}")
+        await self.invalidate_namespaces(namespace)
+        return False
+
+    async def delete(self, key):
+        try:
+            await self.redis.unlink(key, pages_key(key))
+            await self._evict_local(keys=[key])
+            return True
+        except Exception as e:
+            print(f"Error en Redis DELETE: {e}")
+            return False
+
+    async def clear_pattern(self, pattern, batch_size=SCAN_BATCH_SIZE):
+        """Limpiar todas las claves que coincidan con un patrón (SCAN + UNLINK por lotes)"""
+        try:
+            count = 0
+            batch = []
+            async for key in self.redis.scan_iter(match=pattern, count=batch_size):
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    await self.redis.unlink(*batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                await self.redis.unlink(*batch)
+                count += len(batch)
+            await self._evict_local(pattern=pattern)
+            return count
+        except Exception as e:
+            print(f"Error en Redis CLEAR: {e}")
+            return 0
+
+    async def invalidate_tags(self, *tags):
+        """Eliminar las entradas registradas bajo cualquiera de los tags (ver RedisCache)"""
+        if not tags:
+            return 0
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for tag in tags:
+                    pipe.smembers(tag_key(tag))
+                pipe.unlink(*[tag_key(tag) for tag in tags])
+                keys = list(set().union(*(await pipe.execute())[:-1]))
+            if not keys:
+                return 0
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for start in range(0, len(keys), SCAN_BATCH_SIZE):
+                    pipe.unlink(*keys[start:start + SCAN_BATCH_SIZE])
+                count = sum(await pipe.execute())
+            await self._evict_local(keys=keys)
+            return count
+        except Exception as e:
+            print(f"Error en Redis INVALIDATE: {e}")
+            return 0
+
+    async def _evict_local(self, keys=(), pattern=None):
+        """Descartar las copias en memoria de este proceso y de los demás"""
+        if self.local is not None:
+            self.local.invalidate(keys)
+            if pattern is not None:
+                self.local.invalidate_pattern(pattern)
+        try:
+            await self.redis.publish(INVALIDATION_CHANNEL, invalidation_message(keys, pattern))
+        except Exception as e:
+            print(f"Error publicando invalidación: {e}")
+
+    async def current_generation(self, key):
+        return (await self.current_generations([key]))[key]
+
+    async def current_generations(self, keys):
+        if not keys:
+            return {}
+        namespaces = sorted({namespace for key in keys for namespace in key_namespaces(key)})
+        values = await self.redis.mget([generation_key(namespace) for namespace in namespaces])
+        generations = dict(zip(namespaces, (int(value or 0) for value in values)))
+        return {key: sum(generations[namespace] for namespace in key_namespaces(key)) for key in keys}
+
+    async def invalidate_namespaces(self, *namespaces):
+        """Invalidar todas las entradas de los namespaces con un INCR por namespace (ver RedisCache)"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for namespace in namespaces:
+                    pipe.incr(generation_key(namespace))
+                await pipe.execute()
+            for namespace in namespaces:
+                await self._evict_local(pattern="*" if namespace == ALL_NAMESPACES else f"{namespace}:*")
+            return True
+        except Exception as e:
+            print(f"Error en Redis INCR: {e}")
+            return False
+
+    async def get_ttl(self, key):
+        try:
+            if self.local is not None:
+                ttl = self.local.redis_ttl(key)
+                if ttl is not None:
+                    return ttl
+            return await self.redis.ttl(key)
+        except Exception as e:
+            print(f"Error en Redis TTL: {e}")
+            return -1
+
+
+async def invalidate_cache_pattern(pattern):
+    """Invalidar todas las entradas de caché que coincidan con un patrón"""
+    return await AsyncRedisCache().clear_pattern(pattern)
+
+
+async def invalidate_namespaces(*namespaces):
+    """Invalidar todas las entradas de caché de los namespaces en O(1)"""
+    return await AsyncRedisCache().invalidate_namespaces(*namespaces)
+
+
+async def invalidate_tags(*tags):
+    """Invalidar todas las entradas de caché registradas bajo los tags"""
+    return await AsyncRedisCache().invalidate_tags(*tags)
@@ -8,7 +8,10 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.cache import RedisCache, get_cache_stats, invalidate_cache_pattern
+from app.cache import RedisCache, get_cache_stats, invalidate_cache_pattern, cached_results
+from app.db import get_pool_stats
+from app.local_cache import get_local_cache
+from app.cache_metrics import reset_metrics
 
 
 def show_cache_stats():
@@ -19,21 +22,60 @@ def show_cache_stats():
     if stats:
         print(f"Total Keys: {stats['total_keys']}")
         print(f"Total Connections: {stats['total_connections']}")
-        print(f"Cache Hits: {stats['keyspace_hits']}")
-        print(f"Cache Misses: {stats['keyspace_misses']}")
+        print(f"Cache Hits: {stats['hits']}")
+        print(f"Cache Misses: {stats['misses']}")
         print(f"Hit Rate: {stats['hit_rate_percent']}%")
+        print(f"Redis keyspace (all keys): {stats['keyspace_hits']} hits, {stats['keyspace_misses']} misses")
+        show_prefix_stats(stats['prefixes'])
     else:
         print("Could not retrieve cache stats")
+
+    pools = get_pool_stats()
+    print(f"\nMongo pool: {pools['mongo']['open_connections']} open, "
+          f"{pools['mongo']['in_use']} in use (max {pools['mongo']['max_pool_size']})")
+    print(f"Redis pool: {pools['redis']['open_connections']} open, "
+          f"{pools['redis']['in_use']} in use (max {pools['redis']['max_connections']})")
+
+    local = get_local_cache()
+    if local is not None:
+        l1 = local.stats()
+        print(f"L1 cache: {l1['entries']}/{l1['max_entries']} entries, "
+              f"{l1['hit_rate_percent']}% hit rate, {l1['evictions']} evictions")
     
     print("\n" + "="*40 + "\n")
 
 
+def format_metric(value):
+    if value is None:
+        return "-"
+    if value == float("inf"):
+        return ">5s"
+    return f"{value:g}"
+
+
+def show_prefix_stats(prefixes):
+    """Display hits, misses, recompute latency and payload metrics per key prefix"""
+    if not prefixes:
+        print("\nNo per-query metrics recorded yet")
+        return
+    
+    print(f"\n{'Prefix':<10} {'Hits':>7} {'Misses':>7} {'Rate':>7} {'L1':>6} {'Stale':>6} "
+          f"{'Recomp':>7} {'Avg ms':>8} {'p50':>6} {'p95':>6} {'Bytes':>9} {'Enc ms':>7} {'Dec ms':>7}")
+    for prefix, m in prefixes.items():
+        print(f"{prefix:<10} {m['hits']:>7} {m['misses']:>7} {m['hit_rate_percent']:>6}% "
+              f"{m['l1_hits']:>6} {m['stale_hits']:>6} {m['recomputes']:>7} "
+              f"{format_metric(m['avg_recompute_ms']):>8} {format_metric(m['p50_recompute_ms']):>6} "
+              f"{format_metric(m['p95_recompute_ms']):>6} {format_metric(m['avg_payload_bytes']):>9} "
+              f"{format_metric(m['avg_encode_ms']):>7} {format_metric(m['avg_decode_ms']):>7}")
+    print("\n(p50/p95: upper bound of the recompute latency bucket, in ms)")
+
+
 def list_cache_keys():
     """List all cache keys"""
     print("=== Cached Query Keys ===\n")
     
     cache = RedisCache()
-    keys = cache.redis.keys("query*")
+    keys = sorted(cache.scan_keys("query*"))
     
     if not keys:
         print("No cached queries found")
@@ -41,9 +83,14 @@ def list_cache_keys():
     
     print(f"Found {len(keys)} cached queries:\n")
     
+    # One round trip for all the TTLs
+    pipe = cache.redis.pipeline(transaction=False)
     for key in keys:
+        pipe.ttl(key)
+    ttls = pipe.execute()
+    
+    for key, ttl in zip(keys, ttls):
         key_str = key.decode() if isinstance(key, bytes) else key
-        ttl = cache.get_ttl(key_str)
         
         if ttl > 0:
             minutes = ttl // 60
@@ -59,6 +106,21 @@ def list_cache_keys():
     print("\n" + "="*60 + "\n")
 
 
+def show_query_dashboard():
+    """Show the cached result of every query, read in a single round trip"""
+    print("=== Cached Query Dashboard ===\n")
+    
+    from app.warmup import registered_queries
+    
+    for namespace, (result, ttl) in cached_results(*registered_queries().values()).items():
+        if result is None:
+            print(f"  {namespace:<40} not cached")
+        else:
+            print(f"  {namespace:<40} {len(result):>6} rows, fresh for {ttl}s")
+    
+    print("\n" + "="*60 + "\n")
+
+
 def clear_all_cache():
     """Clear all query caches"""
     print("=== Clearing All Query Caches ===\n")
@@ -78,12 +140,21 @@ def clear_specific_query(query_num):
     print("\n" + "="*40 + "\n")
 
 
+def clear_metrics():
+    """Reset the per-query cache metrics of every process"""
+    print("=== Resetting Cache Metrics ===\n")
+    
+    count = reset_metrics()
+    print(f"✓ Reset metrics of {count} key prefixes")
+    print("\n" + "="*40 + "\n")
+
+
 def test_cache_performance():
     """Test cache performance"""
     print("=== Cache Performance Test ===\n")
     
     import time
-    from app.queries.query1 import get_active_clients
+    from app.queries.query1 import get_active_clients, fetch_active_clients
     
     # First call - should hit MongoDB
     print("1. First call (should be MISS):")
@@ -107,6 +178,11 @@ def test_cache_performance():
         print(f"  Speed increase: {improvement:.1f}%")
         print(f"  Speedup factor: {speedup:.1f}x faster")
     
+    lookups = fetch_active_clients.timing_stats()
+    print(f"\nCache lookups ({fetch_active_clients.namespace}):")
+    print(f"  Hits: {lookups['hits']} (avg {lookups['avg_hit_ms']} ms)")
+    print(f"  Misses: {lookups['misses']} (avg {lookups['avg_miss_ms']} ms)")
+    
     print("\n" + "="*40 + "\n")
 
 
@@ -122,6 +198,8 @@ def show_menu():
     print("  3 - Clear all cache")
     print("  4 - Clear specific query cache")
     print("  5 - Test cache performance")
+    print("  6 - Reset cache metrics")
+    print("  7 - Show cached query dashboard")
     print("  0 - Exit")
     print()
 
@@ -159,6 +237,10 @@ def main():
                 print("Invalid query number\n")
         elif choice == "5":
             test_cache_performance()
+        elif choice == "6":
+            clear_metrics()
+        elif choice == "7":
+            show_query_dashboard()
         else:
             print("Invalid option\n")
         
@@ -0,0 +1,210 @@
+"""
+Per-prefix cache metrics
+
+Redis' keyspace_hits and keyspace_misses count every key in the database
+(leaderboard included), so they cannot tell which query cache is cold. The
+cache layer records here, for each key prefix ("query1", "query13", ...):
+
+- hits and misses, with the hits served by the L1 cache or past their soft
+  TTL also counted apart
+- recompute latency of misses and background refreshes, as a histogram
+- payload bytes and serialization time of writes and reads
+
+Counters accumulate in memory and a daemon thread adds them every
+CACHE_METRICS_FLUSH_INTERVAL seconds to one Redis hash per prefix
+(metrics:<prefix>), so cache_manager sees the totals of every process.
+CACHE_METRICS=0 disables recording.
+"""
+
+import os
+import time
+import atexit
+import threading
+from collections import Counter, defaultdict
+
+from app.db import get_redis_client
+from app.local_cache import key_str
+
+METRICS_ENABLED = os.environ.get("CACHE_METRICS", "1") != "0"
+METRICS_FLUSH_INTERVAL = float(os.environ.get("CACHE_METRICS_FLUSH_INTERVAL", "5"))
+METRICS_PREFIX = "metrics:"
+
+# Upper bounds, in milliseconds, of the recompute latency buckets
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+_lock = threading.Lock()
+_pending = defaultdict(Counter)  # prefix -> field -> increment since the last flush
+_flusher = None
+
+
+def _reset_after_fork():
+    # The parent flushes its own counters; the flusher thread is not inherited
+    global _lock, _pending, _flusher
+    _lock = threading.Lock()
+    _pending = defaultdict(Counter)
+    _flusher = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def key_prefix(key):
+    """Prefix a cache key is reported under: everything before the first ':'"""
+    return key_str(key).split(":", 1)[0]
+
+
+def metrics_key(prefix):
+    return f"{METRICS_PREFIX}{prefix}"
+
+
+def bucket_field(bound):
+    return f"recompute_le_{'inf' if bound == float('inf') else bound}"
+
+
+def record(key, **increments):
+    """Add increments to the counters of the key's prefix"""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _pending[key_prefix(key)].update(increments)
+    if _flusher is None:
+        _start_flusher()
+
+
+def record_hit(key, local=False):
+    if local:
+        record(key, hits=1, l1_hits=1)
+    else:
+        record(key, hits=1)
+
+
+def record_stale_hit(key):
+    record(key, stale_hits=1)
+
+
+def record_miss(key):
+    record(key, misses=1)
+
+
+def record_recompute(key, seconds):
+    """Count a recompute of key that took seconds in its latency bucket"""
+    ms = seconds * 1000
+    bound = next(bound for bound in LATENCY_BUCKETS_MS if ms <= bound)
+    record(key, recomputes=1, recompute_ms=ms, **{bucket_field(bound): 1})
+
+
+def record_write(key, payload_bytes, seconds):
+    record(key, writes=1, write_bytes=payload_bytes, encode_ms=seconds * 1000)
+
+
+def record_read(key, payload_bytes, seconds):
+    record(key, reads=1, read_bytes=payload_bytes, decode_ms=seconds * 1000)
+
+
+def flush(redis_client=None):
+    """Add the counters recorded since the previous flush to the Redis hashes"""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, defaultdict(Counter)
+    if not pending:
+        return
+    try:
+        pipe = (redis_client or get_redis_client()).pipeline(transaction=False)
+        for prefix, fields in pending.items():
+            for field, amount in fields.items():
+                if isinstance(amount, float):
+                    pipe.hincrbyfloat(metrics_key(prefix), field, amount)
+                else:
+                    pipe.hincrby(metrics_key(prefix), field, amount)
+        pipe.execute()
+    except Exception as e:
+        # Metrics are best effort: a failed flush drops its counters
+        print(f"Error guardando métricas de caché: {e}")
+
+
+def _run_flusher(interval):
+    while True:
+        time.sleep(interval)
+        flush()
+
+
+def _start_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(
+            target=_run_flusher, args=(METRICS_FLUSH_INTERVAL,), name="cache-metrics", daemon=True
+        )
+        _flusher.start()
+
+
+atexit.register(flush)
+
+
+def read_metrics(redis_client=None):
+    """Raw counters per prefix, including the ones this process has not flushed"""
+    redis_client = redis_client or get_redis_client()
+    flush(redis_client)
+    keys = sorted(redis_client.scan_iter(match=f"{METRICS_PREFIX}*"))
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+    return {
+        key_str(key)[len(METRICS_PREFIX):]: {key_str(field): float(value) for field, value in fields.items()}
+        for key, fields in zip(keys, pipe.execute())
+    }
+
+
+def latency_percentile(histogram, fraction):
+    """Upper bound in ms of the bucket holding the given fraction of recomputes"""
+    total = sum(histogram.values())
+    seen = 0
+    for bound in LATENCY_BUCKETS_MS:
+        seen += histogram[bound]
+        if total and seen >= total * fraction:
+            return bound
+    return None
+
+
+def summarize(fields):
+    """Hit rate, averages and latency percentiles from the raw counters of a prefix"""
+    def average(total, count, digits=2):
+        return round(fields.get(total, 0) / fields[count], digits) if fields.get(count) else None
+
+    hits = int(fields.get("hits", 0))
+    misses = int(fields.get("misses", 0))
+    histogram = {bound: int(fields.get(bucket_field(bound), 0)) for bound in LATENCY_BUCKETS_MS}
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate_percent": round(hits / (hits + misses) * 100, 2) if hits + misses else 0,
+        "l1_hits": int(fields.get("l1_hits", 0)),
+        "stale_hits": int(fields.get("stale_hits", 0)),
+        "recomputes": int(fields.get("recomputes", 0)),
+        "avg_recompute_ms": average("recompute_ms", "recomputes"),
+        "p50_recompute_ms": latency_percentile(histogram, 0.5),
+        "p95_recompute_ms": latency_percentile(histogram, 0.95),
+        "recompute_histogram": histogram,
+        "avg_payload_bytes": average("write_bytes", "writes", 0),
+        "avg_encode_ms": average("encode_ms", "writes", 3),
+        "avg_decode_ms": average("decode_ms", "reads", 3),
+    }
+
+
+def metrics_summary(redis_client=None):
+    """summarize() of every prefix with recorded metrics"""
+    return {prefix: summarize(fields) for prefix, fields in read_metrics(redis_client).items()}
+
+
+def reset_metrics(redis_client=None):
+    """Drop the recorded metrics of every process"""
+    global _pending
+    redis_client = redis_client or get_redis_client()
+    with _lock:
+        _pending = defaultdict(Counter)
+    keys = list(redis_client.scan_iter(match=f"{METRICS_PREFIX}*"))
+    if keys:
+        redis_client.unlink(*keys)
+    return len(keys)
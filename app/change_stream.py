@@ -0,0 +1,424 @@
+"""
+Cache invalidation from MongoDB change streams
+
+The write functions of query13 to query15 invalidate the caches they affect,
+but writes made by the loader, another service or a Mongo shell do not, so
+their results stay stale until the TTL expires. This daemon follows the change
+stream of the aseguradoras collection and invalidates, for every change, the
+cache tags of the fields it touched:
+
+- polizas.N.siniestros...      -> "siniestros"
+- polizas.N.cobertura_total    -> "polizas:cobertura"
+- polizas... (estado, agente)  -> "polizas"
+- vehiculos...                 -> "vehiculos"
+- any other client field       -> "clientes" (activo, nombre, ...)
+
+plus the cliente:<id> and poliza:<nro> tags of the cached documents that embed
+the changed client (query13 and query14). Inserts and replacements touch every
+kind of entity; a deleted document is no longer there to say which client it
+was, so deletes also bump the query13 and query14 generations. Drops, renames
+and a lost resume point bump every generation.
+
+The resume token is stored in Redis after each batch, so a restarted daemon
+continues where it stopped. Change streams need a replica set; docker-compose
+starts MongoDB as a single-node one (rs0).
+
+Claim writes made through query14 patch the cached claim lists in place and
+mark the write (policy, claim and the fields it set) with mark_patched, so the
+daemon skips that one event instead of dropping the results it just patched.
+
+Uso:
+    python app/change_stream.py
+    python app/change_stream.py --from-now
+"""
+
+import sys
+import os
+import re
+import time
+import argparse
+import threading
+from bson import json_util
+from pymongo.errors import OperationFailure, PyMongoError
+from redis.exceptions import RedisError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import get_mongo_collection, get_redis_client
+from app.db_async import get_async_redis_client
+from app.cache import RedisCache, cliente_tag, poliza_tag, ALL_NAMESPACES
+
+RESUME_TOKEN_KEY = "change_stream:resume_token"
+PATCHED_PREFIX = "change_stream:patched:"
+PATCHED_TTL = int(os.environ.get("CHANGE_STREAM_PATCHED_TTL", "60"))
+BATCH_SIZE = int(os.environ.get("CHANGE_STREAM_BATCH_SIZE", "500"))
+MAX_AWAIT_MS = int(os.environ.get("CHANGE_STREAM_MAX_AWAIT_MS", "500"))
+RETRY_SECONDS = float(os.environ.get("CHANGE_STREAM_RETRY_SECONDS", "5"))
+
+# Cache tag of each kind of entity embedded in a client document
+COLLECTION_TAGS = ("clientes", "polizas", "polizas:cobertura", "siniestros", "vehiculos")
+
+# Tags of a changed field, by its path without array indexes; first match wins
+FIELD_TAGS = [
+    (("polizas", "siniestros"), ("siniestros",)),
+    (("polizas", "cobertura_total"), ("polizas:cobertura",)),
+    (("polizas",), ("polizas",)),
+    (("vehiculos",), ("vehiculos",)),
+    ((), ("clientes",)),
+]
+
+# Namespaces of the per-client caches, which a delete cannot name by tag
+CLIENT_NAMESPACES = ("query13", "query14")
+
+# Operations after which the stream cannot say what changed
+REBUILD_OPERATIONS = {"drop", "dropDatabase", "rename", "invalidate"}
+
+# Change stream errors meaning the stored resume token cannot be used
+LOST_RESUME_CODES = {260, 280, 286}
+
+# Only the fields the mapping needs are sent back with each event
+WATCH_PIPELINE = [{"$project": {
+    "operationType": 1,
+    "documentKey": 1,
+    "updateDescription": 1,
+    "fullDocument.id_cliente": 1,
+    "fullDocument.polizas.nro_poliza": 1,
+    "fullDocument.polizas.siniestros.id_siniestro": 1,
+}}]
+
+_watcher = None
+
+
+def _reset_after_fork():
+    # The watcher thread is not inherited by a forked child
+    global _watcher
+    _watcher = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def patched_key(nro_poliza, id_siniestro, fields):
+    """
+    Mark key of one claim write: the policy, the claim and the fields it set
+
+    The new estado is part of the key too, so a later status change of the
+    same claim never matches the mark of an earlier one.
+    """
+    names = ",".join(sorted(fields))
+    return f"{PATCHED_PREFIX}{nro_poliza}:{id_siniestro}:{names}:{fields.get('estado', '')}"
+
+
+def mark_patched(nro_poliza, id_siniestro, fields, redis_client=None):
+    """
+    Record that the cache already reflects a claim write
+
+    Args:
+        nro_poliza, id_siniestro: Claim the write changed
+        fields: Claim fields it set, with their values (the whole claim for
+                a new one)
+    """
+    key = patched_key(nro_poliza, id_siniestro, fields)
+    pipe = (redis_client or get_redis_client()).pipeline(transaction=False)
+    pipe.incr(key)
+    pipe.expire(key, PATCHED_TTL)
+    pipe.execute()
+
+
+async def mark_patched_async(nro_poliza, id_siniestro, fields, redis_client=None):
+    key = patched_key(nro_poliza, id_siniestro, fields)
+    pipe = (redis_client or get_async_redis_client()).pipeline(transaction=False)
+    pipe.incr(key)
+    pipe.expire(key, PATCHED_TTL)
+    await pipe.execute()
+
+
+def field_path(path):
+    """Field names of a dotted update path, without its array indexes"""
+    return tuple(part for part in path.split(".") if not part.isdigit())
+
+
+def field_tags(path):
+    names = field_path(path)
+    if names == ("polizas",) or re.fullmatch(r"polizas\.\d+", path):
+        # A whole policy (or every policy) was set, with its claims
+        return {"polizas", "polizas:cobertura", "siniestros"}
+    return set(next(tags for prefix, tags in FIELD_TAGS if names[:len(prefix)] == prefix))
+
+
+def changed_paths(change):
+    description = change.get("updateDescription") or {}
+    paths = list(description.get("updatedFields", {})) + list(description.get("removedFields", []))
+    paths += [truncated["field"] for truncated in description.get("truncatedArrays", [])]
+    return paths
+
+
+def policy_indexes(paths):
+    """Indexes N of the polizas.N... paths, or None if a path is not inside one policy"""
+    indexes = set()
+    for path in paths:
+        match = re.match(r"polizas\.(\d+)(\.|$)", path)
+        if match is None:
+            return None
+        indexes.add(int(match.group(1)))
+    return indexes
+
+
+def entity_tags(document, indexes=None):
+    """cliente:<id> and poliza:<nro> tags of the changed client and policies"""
+    if not document:
+        return set()
+    tags = {cliente_tag(document["id_cliente"])} if "id_cliente" in document else set()
+    polizas = document.get("polizas") or []
+    if indexes is not None and all(index < len(polizas) for index in indexes):
+        polizas = [polizas[index] for index in indexes]
+    tags.update(poliza_tag(poliza["nro_poliza"]) for poliza in polizas if "nro_poliza" in poliza)
+    return tags
+
+
+def change_invalidations(change):
+    """
+    Cache tags and generation namespaces a change event invalidates
+
+    Returns:
+        (tags, namespaces) sets
+    """
+    operation = change["operationType"]
+    document = change.get("fullDocument")
+
+    if operation in REBUILD_OPERATIONS:
+        return set(), {ALL_NAMESPACES}
+    if operation == "delete":
+        return set(COLLECTION_TAGS), set(CLIENT_NAMESPACES)
+    if operation in ("insert", "replace"):
+        return set(COLLECTION_TAGS) | entity_tags(document), set()
+    if operation != "update":
+        return set(), set()
+
+    paths = changed_paths(change)
+    tags = set()
+    for path in paths:
+        tags |= field_tags(path)
+    # Only the policies a change is inside of are invalidated by number
+    tags |= entity_tags(document, policy_indexes(paths))
+    return tags, set()
+
+
+def claim_write(change):
+    """
+    (nro_poliza, id_siniestro, fields) of an update that only changed one claim
+
+    Covers the writes of query14: pushing a new claim (the event holds the
+    whole claim, or the new siniestros array when it was the first one) and
+    setting fields of an existing claim. Returns None for anything else.
+    """
+    description = change.get("updateDescription") or {}
+    updated = description.get("updatedFields") or {}
+    if change["operationType"] != "update" or not updated:
+        return None
+    if description.get("removedFields") or description.get("truncatedArrays"):
+        return None
+
+    claims = set()
+    fields = {}
+    for path, value in updated.items():
+        match = re.fullmatch(r"polizas\.(\d+)\.siniestros(?:\.(\d+)(?:\.(\w+))?)?", path)
+        if match is None:
+            return None
+        poliza_index, claim_index, field = match.groups()
+        if claim_index is None:
+            # The push created the siniestros array
+            if not isinstance(value, list) or len(value) != 1:
+                return None
+            claim_index, value = 0, value[0]
+        if field is None:
+            if not isinstance(value, dict):
+                return None
+            fields.update(value)
+        else:
+            fields[field] = value
+        claims.add((int(poliza_index), int(claim_index)))
+
+    if len(claims) != 1:
+        return None
+    (poliza_index, claim_index), = claims
+    polizas = (change.get("fullDocument") or {}).get("polizas") or []
+    if poliza_index >= len(polizas):
+        return None
+    poliza = polizas[poliza_index]
+    id_siniestro = fields.get("id_siniestro")
+    if id_siniestro is None:
+        siniestros = poliza.get("siniestros") or []
+        if claim_index >= len(siniestros):
+            return None
+        id_siniestro = siniestros[claim_index].get("id_siniestro")
+    return poliza.get("nro_poliza"), id_siniestro, fields
+
+
+def already_patched(change, redis_client):
+    """
+    Whether query14 already patched the cache for this claim write
+
+    Only the mark of this exact write (same claim, fields and estado) is
+    consumed, and only if it is there. Any other write, including one whose
+    mark was set too late or expired, is invalidated as usual.
+    """
+    write = claim_write(change)
+    if write is None:
+        return False
+    key = patched_key(*write)
+    if int(redis_client.get(key) or 0) <= 0:
+        return False
+    redis_client.decr(key)
+    return True
+
+
+def apply_changes(changes, redis_client=None):
+    """
+    Invalidate the caches affected by a batch of change events
+
+    The tags of the whole batch are invalidated together, so a bulk write of
+    many documents costs one invalidation.
+
+    Returns:
+        (tags, namespaces) invalidated
+
+    Raises:
+        RedisError: The invalidation failed; the batch must be applied again
+    """
+    redis_client = redis_client or get_redis_client()
+    tags, namespaces = set(), set()
+    for change in changes:
+        if already_patched(change, redis_client):
+            continue
+        change_tags, change_namespaces = change_invalidations(change)
+        tags |= change_tags
+        namespaces |= change_namespaces
+
+    cache = RedisCache(redis_client)
+    if ALL_NAMESPACES in namespaces:
+        # Every entry is invalidated anyway
+        tags, namespaces = set(), {ALL_NAMESPACES}
+    # Redis errors are raised, so the batch is not marked as done
+    if namespaces:
+        cache.bump_generations(*sorted(namespaces))
+    if tags:
+        cache.drop_tags(*sorted(tags))
+    return tags, namespaces
+
+
+def load_resume_token(redis_client):
+    raw = redis_client.get(RESUME_TOKEN_KEY)
+    return json_util.loads(raw) if raw else None
+
+
+def save_resume_token(redis_client, token):
+    if token is not None:
+        redis_client.set(RESUME_TOKEN_KEY, json_util.dumps(token))
+
+
+def read_batch(stream, batch_size=BATCH_SIZE):
+    """Events already available on the stream, waiting at most MAX_AWAIT_MS for the first"""
+    changes = []
+    while len(changes) < batch_size:
+        change = stream.try_next()
+        if change is None:
+            break
+        changes.append(change)
+    return changes
+
+
+def watch_changes(collection=None, redis_client=None, resume=True, stop=None):
+    """
+    Follow the collection's change stream and invalidate the affected caches
+
+    Args:
+        collection: Watched collection (default: aseguradoras)
+        redis_client: Redis client holding the caches and the resume token
+        resume: Continue after the stored resume token. Without one, every
+                generation is bumped, since writes made while nobody was
+                watching are unknown
+        stop: threading.Event that ends the loop when set
+    """
+    collection = collection if collection is not None else get_mongo_collection()
+    redis_client = redis_client or get_redis_client()
+    token = None
+    token_loaded = not resume
+
+    while stop is None or not stop.is_set():
+        try:
+            if not token_loaded:
+                token = load_resume_token(redis_client)
+                token_loaded = True
+            if token is None:
+                RedisCache(redis_client).bump_generations(ALL_NAMESPACES)
+            with collection.watch(
+                WATCH_PIPELINE,
+                full_document="updateLookup",
+                resume_after=token,
+                max_await_time_ms=MAX_AWAIT_MS,
+            ) as stream:
+                print(f"Escuchando cambios de {collection.name}...")
+                while stream.alive and (stop is None or not stop.is_set()):
+                    changes = read_batch(stream)
+                    if changes:
+                        tags, namespaces = apply_changes(changes, redis_client)
+                        print(f"✓ {len(changes)} cambios: invalidados "
+                              f"{', '.join(sorted(tags | namespaces)) or 'ninguno'}")
+                    if any(change["operationType"] == "invalidate" for change in changes):
+                        # The stream ended (drop/rename): start over
+                        token = None
+                        break
+                    # Also advanced while idle, so a restart skips nothing.
+                    # Only moved once the batch is invalidated and saved
+                    batch_token = stream.resume_token
+                    save_resume_token(redis_client, batch_token)
+                    token = batch_token
+        except OperationFailure as e:
+            if e.code not in LOST_RESUME_CODES:
+                raise
+            print(f"✗ No se puede retomar el change stream ({e}), invalidando todo el caché")
+            token = None
+        except (PyMongoError, RedisError) as e:
+            # The stream is reopened after the last saved token, so a batch
+            # whose invalidation failed is read again
+            print(f"✗ Error en el change stream: {e}, reintentando en {RETRY_SECONDS:.0f} s")
+            time.sleep(RETRY_SECONDS)
+
+
+def start_watcher(collection=None, redis_client=None):
+    """Run watch_changes in a daemon thread of this process (once)"""
+    global _watcher
+    if _watcher is None:
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=watch_changes,
+            kwargs={"collection": collection, "redis_client": redis_client, "stop": stop},
+            name="cache-change-stream",
+            daemon=True,
+        )
+        thread.start()
+        _watcher = (thread, stop)
+    return _watcher
+
+
+def stop_watcher():
+    global _watcher
+    if _watcher is not None:
+        thread, stop = _watcher
+        stop.set()
+        thread.join()
+        _watcher = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Invalidate Redis caches from MongoDB change streams")
+    parser.add_argument("--from-now", action="store_true",
+                        help="Ignore the stored resume token and start from the current changes")
+    args = parser.parse_args()
+
+    try:
+        watch_changes(resume=not args.from_now)
+    except KeyboardInterrupt:
+        print("\nDetenido")
@@ -1,10 +1,172 @@
-from pymongo import MongoClient
+import os
+import threading
+from pymongo import MongoClient, monitoring
 import redis
 
-def get_mongo_collection():
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client["tp_bd2"]
-    return db["aseguradoras"]
+# Connection settings, overridable through environment variables
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = os.environ.get("MONGO_DB", "tp_bd2")
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_TIMEOUT_MS = int(os.environ.get("MONGO_TIMEOUT_MS", "5000"))
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", "6379"))
+REDIS_DB = int(os.environ.get("REDIS_DB", "0"))
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_TIMEOUT_S = float(os.environ.get("REDIS_TIMEOUT_S", "5"))
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Counts MongoDB pool events, since pymongo does not expose pool sizes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+
+    def _count(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_ready(self, event): pass
+
+    def connection_created(self, event):
+        self._count(created=1)
+
+    def connection_closed(self, event):
+        self._count(closed=1)
+
+    def connection_checked_out(self, event):
+        self._count(checked_out=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._count(checked_out=-1)
+
+    def connection_check_out_failed(self, event):
+        self._count(checkout_failures=1)
+
+
+_lock = threading.Lock()
+_mongo_client = None
+_redis_pool = None
+_redis_client = None
+_pool_listener = PoolStatsListener()
+
+
+def _reset_after_fork():
+    # Sockets and monitor threads inherited from the parent must not be
+    # reused, so the child opens its own clients on first use
+    global _lock, _mongo_client, _redis_pool, _redis_client
+    _lock = threading.Lock()
+    _mongo_client = None
+    _redis_pool = None
+    _redis_client = None
+    _pool_listener.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_mongo_client():
+    """Process-wide MongoClient; its connection pool is shared by every caller"""
+    global _mongo_client
+    if _mongo_client is None:
+        with _lock:
+            if _mongo_client is None:
+                _mongo_client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_TIMEOUT_MS,
+                    event_listeners=[_pool_listener],
+                )
+    return _mongo_client
+
+
+def get_mongo_collection(name="aseguradoras"):
+    return get_mongo_client()[MONGO_DB][name]
+
+
+def get_redis_pool():
+    """Process-wide Redis ConnectionPool"""
+    global _redis_pool
+    if _redis_pool is None:
+        with _lock:
+            if _redis_pool is None:
+                _redis_pool = redis.ConnectionPool(
+                    host=REDIS_HOST,
+                    port=REDIS_PORT,
+                    db=REDIS_DB,
+                    max_connections=REDIS_MAX_CONNECTIONS,
+                    socket_timeout=REDIS_TIMEOUT_S,
+                    socket_connect_timeout=REDIS_TIMEOUT_S,
+                )
+    return _redis_pool
+
 
 def get_redis_client():
-    return redis.StrictRedis(host="localhost", port=6379, db=0)
+    global _redis_client
+    if _redis_client is None:
+        pool = get_redis_pool()
+        with _lock:
+            if _redis_client is None:
+                _redis_client = redis.StrictRedis(connection_pool=pool)
+    return _redis_client
+
+
+def get_pool_stats():
+    """Connection pool usage of the shared MongoDB and Redis clients"""
+    stats = {
+        "mongo": {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "open_connections": _pool_listener.created - _pool_listener.closed,
+            "in_use": _pool_listener.checked_out,
+            "created_total": _pool_listener.created,
+            "checkouts_total": _pool_listener.checkouts,
+            "checkout_failures": _pool_listener.checkout_failures,
+        },
+        "redis": {
+            "max_connections": REDIS_MAX_CONNECTIONS,
+            "open_connections": 0,
+            "in_use": 0,
+            "idle": 0,
+        },
+    }
+    if _redis_pool is not None:
+        # redis-py keeps these counters private; read them defensively
+        in_use = len(getattr(_redis_pool, "_in_use_connections", ()))
+        idle = len(getattr(_redis_pool, "_available_connections", ()))
+        stats["redis"].update({
+            "open_connections": getattr(_redis_pool, "_created_connections", in_use + idle),
+            "in_use": in_use,
+            "idle": idle,
+        })
+    return stats
+
+
+def close_connections():
+    """Close the shared clients (e.g. on shutdown); they reopen on next use"""
+    global _mongo_client, _redis_pool, _redis_client
+    with _lock:
+        if _mongo_client is not None:
+            _mongo_client.close()
+        if _redis_pool is not None:
+            _redis_pool.disconnect()
+        _mongo_client = None
+        _redis_pool = None
+        _redis_client = None
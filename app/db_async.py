@@ -0,0 +1,137 @@
+"""
+Async counterpart of app/db.py
+
+Uses pymongo's AsyncMongoClient and redis.asyncio with the same settings as
+the synchronous clients. Async clients are bound to the event loop they were
+created on, so one pair of clients is kept per running loop. They are closed
+when their loop shuts down under asyncio.run, or by close_async_connections();
+those of a loop closed by hand are closed once another loop asks for clients.
+"""
+
+import asyncio
+import socket
+import sys
+import os
+from pymongo import AsyncMongoClient
+import redis.asyncio as aioredis
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import (
+    MONGO_URI, MONGO_DB, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_TIMEOUT_MS,
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_MAX_CONNECTIONS, REDIS_TIMEOUT_S,
+)
+
+# event loop -> {"mongo": AsyncMongoClient, "redis": Redis}
+_clients = {}
+# event loop -> task that closes its clients when the loop shuts down
+_closers = {}
+# Close tasks of abandoned clients, referenced until they finish
+_pending_closes = set()
+
+
+async def _close_clients(clients):
+    if "mongo" in clients:
+        await clients["mongo"].close()
+    if "redis" in clients:
+        await clients["redis"].aclose()
+        await clients["redis"].connection_pool.disconnect()
+
+
+async def _close_on_shutdown(loop):
+    # asyncio.run cancels the tasks still pending before it closes the loop,
+    # so this closes the loop's clients while they can still run on it
+    try:
+        await loop.create_future()
+    except asyncio.CancelledError:
+        _closers.pop(loop, None)
+        await _close_clients(_clients.pop(loop, {}))
+        raise
+
+
+def _close_abandoned(loop, clients):
+    """Close the clients of a loop that was closed without shutting them down"""
+    closer = _closers.pop(loop, None)
+    if closer is not None:
+        # Never run: its loop is gone, and it must not warn when collected
+        closer._log_destroy_pending = False
+    if "redis" in clients:
+        # Their transports cannot be closed through a closed loop, but their
+        # sockets can be shut down so Redis releases the connections
+        pool = clients["redis"].connection_pool
+        for connection in [*pool._available_connections, *pool._in_use_connections]:
+            if connection._writer is not None:
+                try:
+                    connection._writer.get_extra_info("socket").shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+    if "mongo" in clients:
+        task = asyncio.ensure_future(_close_abandoned_mongo(clients["mongo"]))
+        _pending_closes.add(task)
+        task.add_done_callback(_pending_closes.discard)
+
+
+async def _close_abandoned_mongo(client):
+    try:
+        await client.close()
+    except Exception as e:
+        print(f"Error cerrando cliente de MongoDB: {e}")
+
+
+def _loop_clients():
+    loop = asyncio.get_running_loop()
+    clients = _clients.get(loop)
+    if clients is None:
+        # Close the clients of loops that have been closed (e.g. a loop run by
+        # hand instead of with asyncio.run)
+        for old_loop in [l for l in _clients if l.is_closed()]:
+            _close_abandoned(old_loop, _clients.pop(old_loop))
+        clients = _clients[loop] = {}
+        _closers[loop] = loop.create_task(_close_on_shutdown(loop))
+    return clients
+
+
+def get_async_mongo_client():
+    """AsyncMongoClient shared by every coroutine of the running event loop"""
+    clients = _loop_clients()
+    if "mongo" not in clients:
+        clients["mongo"] = AsyncMongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_TIMEOUT_MS,
+        )
+    return clients["mongo"]
+
+
+def get_async_mongo_collection(name="aseguradoras"):
+    return get_async_mongo_client()[MONGO_DB][name]
+
+
+def get_async_redis_client():
+    """redis.asyncio client over a connection pool shared by the running event loop"""
+    clients = _loop_clients()
+    if "redis" not in clients:
+        pool = aioredis.BlockingConnectionPool(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            socket_timeout=REDIS_TIMEOUT_S,
+            socket_connect_timeout=REDIS_TIMEOUT_S,
+            # Wait for a free connection instead of failing when every
+            # connection is busy, so thousands of coroutines can share the pool
+            timeout=None,
+        )
+        clients["redis"] = aioredis.Redis(connection_pool=pool)
+    return clients["redis"]
+
+
+async def close_async_connections():
+    """Close the clients of the running event loop"""
+    loop = asyncio.get_running_loop()
+    closer = _closers.pop(loop, None)
+    if closer is not None:
+        closer.cancel()
+    await _close_clients(_clients.pop(loop, {}))
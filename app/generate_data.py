@@ -0,0 +1,217 @@
+"""
+Synthetic dataset generator
+
+Writes clientes/polizas/siniestros/agentes/vehiculos CSV files with the same
+columns and formats as resources/, at a configurable scale factor. Scale 1
+matches the size of the fixtures (~200 clients); the distributions of
+estados, tipos and claims per policy follow the fixtures as well.
+
+Uso:
+    python app/generate_data.py --scale 1000 --output data/scale_1000 --seed 42
+"""
+
+import sys
+import os
+import csv
+import math
+import random
+import argparse
+import unicodedata
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import csv_files
+
+# Rows per entity at scale 1, taken from resources/
+BASE_CLIENTS = 205
+AGENTS_PER_CLIENT = 6 / 205
+POLICIES_PER_CLIENT = 160 / 205
+CLAIMS_PER_POLICY = 80 / 160
+VEHICLES_PER_CLIENT = 205 / 205
+
+CLIENT_ACTIVE_RATE = 147 / 205
+AGENT_ACTIVE_RATE = 5 / 6
+VEHICLE_INSURED_RATE = 164 / 205
+POLICY_WITHOUT_AGENT_RATE = 5 / 160
+
+ESTADOS_POLIZA = {"Activa": 86, "Vencida": 46, "Suspendida": 28}
+TIPOS_POLIZA = {"Auto": 112, "Hogar": 16, "Vida": 16, "Salud": 16}
+ESTADOS_SINIESTRO = {"Abierto": 32, "Cerrado": 32, "En evaluacion": 16}
+TIPOS_SINIESTRO = {"Accidente": 32, "Robo": 16, "Incendio": 16, "Danio": 16}
+# (prima_mensual, cobertura_total) pairs used by the fixtures
+PLANES = [(12000, 800000), (15000, 1200000), (18000, 1000000), (25000, 2000000), (30000, 2500000)]
+
+NOMBRES = ["Laura", "Martín", "Sofía", "Juan", "María", "Lucas", "Valentina", "Diego",
+           "Camila", "Mateo", "Julieta", "Santiago", "Florencia", "Tomás", "Agustina"]
+APELLIDOS = ["Gómez", "Pérez", "Rodríguez", "Fernández", "López", "Martínez", "García",
+             "Sánchez", "Romero", "Díaz", "Torres", "Álvarez", "Ruiz", "Acosta", "Benítez"]
+UBICACIONES = [("Buenos Aires", "Buenos Aires"), ("Rosario", "Santa Fe"), ("Córdoba", "Córdoba"),
+               ("Mendoza", "Mendoza"), ("La Plata", "Buenos Aires"), ("Mar del Plata", "Buenos Aires"),
+               ("Salta", "Salta"), ("Neuquén", "Neuquén")]
+CALLES = ["Av. Rivadavia", "Calle Mitre", "Av. Corrientes", "San Martín", "Belgrano", "Sarmiento"]
+ZONAS = ["Norte", "Sur", "Centro", "Este", "Oeste"]
+VEHICULOS = [("Toyota", "Corolla"), ("Ford", "Fiesta"), ("Chevrolet", "Onix"), ("Honda", "Fit"),
+             ("Volkswagen", "Gol"), ("Renault", "Sandero"), ("Peugeot", "208"), ("Fiat", "Cronos")]
+DESCRIPCIONES = {
+    "Accidente": ["Colision frontal en autopista", "Accidente leve", "Choque en estacionamiento"],
+    "Robo": ["Robo de vivienda asegurada", "Robo de vehiculo", "Robo parcial"],
+    "Incendio": ["Incendio en cocina", "Incendio parcial de vivienda"],
+    "Danio": ["Danio por tormenta", "Danio por filtracion", "Rotura de cristales"],
+}
+
+HEADERS = {
+    "clientes": ["id_cliente", "nombre", "apellido", "dni", "email", "telefono",
+                 "direccion", "ciudad", "provincia", "activo"],
+    "polizas": ["nro_poliza", "id_cliente", "tipo", "fecha_inicio", "fecha_fin",
+                "prima_mensual", "cobertura_total", "id_agente", "estado"],
+    "siniestros": ["id_siniestro", "nro_poliza", "fecha", "tipo", "monto_estimado",
+                   "descripcion", "estado"],
+    "agentes": ["id_agente", "nombre", "apellido", "matricula", "telefono", "email", "zona", "activo"],
+    "vehiculos": ["id_vehiculo", "id_cliente", "marca", "modelo", "anio", "patente",
+                  "nro_chasis", "asegurado"],
+}
+
+
+def format_date(value):
+    # Same d/m/YYYY format as the fixtures, without zero padding
+    return f"{value.day}/{value.month}/{value.year}"
+
+
+def email_name(text):
+    # Emails in the fixtures are plain ASCII
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+
+
+def weighted_choice(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def poisson(rng, mean):
+    """Knuth's algorithm, good enough for the small means used here"""
+    limit = math.exp(-mean)
+    count, product = 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def policy_dates(rng, estado, today):
+    """Start and end dates consistent with the policy's estado"""
+    if estado == "Vencida":
+        start = today - timedelta(days=rng.randint(400, 1400))
+    else:
+        start = today - timedelta(days=rng.randint(0, 360))
+    end = date(start.year + 1, start.month, min(start.day, 28))
+    return start, end
+
+
+def generate_dataset(output_dir, scale=1.0, seed=42, today=None):
+    """
+    Write a consistent synthetic dataset into output_dir
+
+    Every policy belongs to a generated client and (almost always) a
+    generated agent, every claim to a generated policy and every vehicle to
+    a generated client. Rows are written as they are produced, so memory use
+    does not grow with the scale factor.
+
+    Returns:
+        Dict with the number of rows written per file
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    os.makedirs(output_dir, exist_ok=True)
+    files = csv_files(output_dir)
+
+    n_clients = max(1, round(BASE_CLIENTS * scale))
+    n_agents = max(1, round(n_clients * AGENTS_PER_CLIENT))
+    counts = {name: 0 for name in HEADERS}
+
+    handles = {name: open(files[name], "w", newline="", encoding="utf-8") for name in HEADERS}
+    try:
+        writers = {name: csv.writer(handles[name]) for name in HEADERS}
+        for name, header in HEADERS.items():
+            writers[name].writerow(header)
+
+        for i in range(n_agents):
+            nombre, apellido = rng.choice(NOMBRES), rng.choice(APELLIDOS)
+            writers["agentes"].writerow([
+                101 + i, nombre, apellido, f"MAT{i + 1:03d}",
+                1100000000 + rng.randint(0, 99999999),
+                f"{email_name(nombre)}{i + 1}@seguros.com",
+                rng.choice(ZONAS),
+                rng.random() < AGENT_ACTIVE_RATE,
+            ])
+        counts["agentes"] = n_agents
+
+        next_poliza = 1001
+        next_siniestro = 9001
+        next_vehiculo = 5001
+        for id_cliente in range(1, n_clients + 1):
+            nombre, apellido = rng.choice(NOMBRES), rng.choice(APELLIDOS)
+            ciudad, provincia = rng.choice(UBICACIONES)
+            writers["clientes"].writerow([
+                id_cliente, nombre, apellido, 20000000 + id_cliente,
+                f"{email_name(nombre)}.{email_name(apellido)}{id_cliente}@gmail.com",
+                1100000000 + rng.randint(0, 99999999),
+                f"{rng.choice(CALLES)} {rng.randint(1, 5000)}",
+                ciudad, provincia,
+                rng.random() < CLIENT_ACTIVE_RATE,
+            ])
+            counts["clientes"] += 1
+
+            for _ in range(poisson(rng, VEHICLES_PER_CLIENT)):
+                marca, modelo = rng.choice(VEHICULOS)
+                writers["vehiculos"].writerow([
+                    next_vehiculo, id_cliente, marca, modelo, rng.randint(2005, today.year),
+                    f"{rng.choice('ABCDEFGHI')}{rng.choice('ABCDEFGHI')}{rng.randint(100, 999)}"
+                    f"{rng.choice('ABCDEFGHI')}{rng.choice('ABCDEFGHI')}",
+                    f"CHS{next_vehiculo}",
+                    rng.random() < VEHICLE_INSURED_RATE,
+                ])
+                next_vehiculo += 1
+                counts["vehiculos"] += 1
+
+            for _ in range(poisson(rng, POLICIES_PER_CLIENT)):
+                nro_poliza = f"POL{next_poliza}"
+                next_poliza += 1
+                estado = weighted_choice(rng, ESTADOS_POLIZA)
+                start, end = policy_dates(rng, estado, today)
+                prima, cobertura = rng.choice(PLANES)
+                id_agente = "" if rng.random() < POLICY_WITHOUT_AGENT_RATE else 101 + rng.randrange(n_agents)
+                writers["polizas"].writerow([
+                    nro_poliza, id_cliente, weighted_choice(rng, TIPOS_POLIZA),
+                    format_date(start), format_date(end), prima, cobertura, id_agente, estado,
+                ])
+                counts["polizas"] += 1
+
+                for _ in range(poisson(rng, CLAIMS_PER_POLICY)):
+                    tipo = weighted_choice(rng, TIPOS_SINIESTRO)
+                    fecha = start + timedelta(days=rng.randint(0, max(0, min((end - start).days, (today - start).days))))
+                    writers["siniestros"].writerow([
+                        next_siniestro, nro_poliza, format_date(fecha), tipo,
+                        rng.randint(50, 600) * 1000 + rng.choice([0, 100, 300, 500]),
+                        rng.choice(DESCRIPCIONES[tipo]),
+                        weighted_choice(rng, ESTADOS_SINIESTRO),
+                    ])
+                    next_siniestro += 1
+                    counts["siniestros"] += 1
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset with the resources/ CSV layout")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Scale factor relative to resources/ (1 = ~200 clients)")
+    parser.add_argument("--output", required=True, help="Directory to write the CSV files to")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    counts = generate_dataset(args.output, scale=args.scale, seed=args.seed)
+    for name, count in counts.items():
+        print(f"Wrote {count} rows to {os.path.join(args.output, name + '.csv')}")
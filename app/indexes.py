@@ -0,0 +1,115 @@
+"""
+Index management for the aseguradoras collection
+
+Declares in one place every index the queries and ABM services rely on,
+creates the missing ones and reports which are absent.
+
+Uso:
+    python app/indexes.py            # report and create missing indexes
+    python app/indexes.py --check    # only report
+"""
+
+import sys
+import os
+import argparse
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import get_mongo_collection
+
+# Unique indexes on embedded arrays are multikey: they keep a value from
+# appearing in two different documents. Partial filters let documents
+# without the field (e.g. clients without policies) coexist.
+REQUIRED_INDEXES = [
+    IndexModel([("id_cliente", ASCENDING)], name="id_cliente_unique", unique=True,
+               partialFilterExpression={"id_cliente": {"$exists": True}}),
+    # read_client / update_client / delete_client by DNI, issue_new_policy
+    IndexModel([("dni", ASCENDING)], name="dni_unique", unique=True,
+               partialFilterExpression={"dni": {"$exists": True}}),
+    # create_claim, update_claim_status, get_claims_by_policy, cancel_policy
+    IndexModel([("polizas.nro_poliza", ASCENDING)], name="polizas_nro_poliza_unique", unique=True,
+               partialFilterExpression={"polizas.nro_poliza": {"$exists": True}}),
+    # Agent lookup by matricula in issue_new_policy
+    IndexModel([("polizas.agente.matricula", ASCENDING), ("polizas.agente.activo", ASCENDING)],
+               name="polizas_agente_matricula"),
+    # query6 (Vencida), query9 (Activa), query10 (Suspendida), query4
+    IndexModel([("polizas.estado", ASCENDING)], name="polizas_estado"),
+    # query2 open claims and duplicate checks in create_claim
+    IndexModel([("polizas.siniestros.estado", ASCENDING)], name="polizas_siniestros_estado"),
+    IndexModel([("polizas.siniestros.id_siniestro", ASCENDING)], name="polizas_siniestros_id"),
+    # query1 active clients
+    IndexModel([("activo", ASCENDING)], name="activo"),
+]
+
+
+def index_key(index):
+    """Key pattern of an IndexModel or of an index_information() entry"""
+    if isinstance(index, IndexModel):
+        return list(index.document["key"].items())
+    return [(field, direction) for field, direction in index["key"]]
+
+
+def missing_indexes(collection=None):
+    """
+    Required indexes that do not exist on the collection
+
+    An index counts as present when one with the same key pattern exists,
+    whatever its name.
+    """
+    collection = collection if collection is not None else get_mongo_collection()
+    existing = [index_key(info) for info in collection.index_information().values()]
+    return [index for index in REQUIRED_INDEXES if index_key(index) not in existing]
+
+
+def ensure_indexes(collection=None):
+    """
+    Create every missing required index
+
+    Indexes are created one at a time so a unique index that cannot be built
+    (because the data already has duplicates) does not prevent the others.
+
+    Returns:
+        Dict with the names of the created and failed indexes
+    """
+    collection = collection if collection is not None else get_mongo_collection()
+    created, failed = [], []
+
+    for index in missing_indexes(collection):
+        name = index.document["name"]
+        try:
+            collection.create_indexes([index])
+            created.append(name)
+        except OperationFailure as e:
+            print(f"Error creando índice {name}: {e}")
+            failed.append(name)
+
+    if created:
+        print(f"✓ Índices creados: {', '.join(created)}")
+    return {"created": created, "failed": failed}
+
+
+def report_indexes(collection=None):
+    """Print which required indexes exist and which are missing"""
+    collection = collection if collection is not None else get_mongo_collection()
+    missing = {index.document["name"] for index in missing_indexes(collection)}
+
+    print("=== Índices requeridos ===\n")
+    for index in REQUIRED_INDEXES:
+        name = index.document["name"]
+        status = "✗ FALTA" if name in missing else "✓"
+        keys = ", ".join(field for field, _ in index_key(index))
+        print(f"  {status:<8} {name:<30} ({keys})")
+    print()
+    return sorted(missing)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report and create the indexes of the aseguradoras collection")
+    parser.add_argument("--check", action="store_true", help="Only report missing indexes")
+    args = parser.parse_args()
+
+    missing = report_indexes()
+    if missing and not args.check:
+        ensure_indexes()
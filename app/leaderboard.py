@@ -0,0 +1,136 @@
+"""
+Top clients by coverage (Redis sorted set)
+
+The sorted set is fully rebuilt by app/main.py after a load and kept exact
+afterwards by applying ZINCRBY deltas from every write that changes a
+client's total coverage. Cancelled policies do not count toward the total.
+Each helper has an ``_async`` variant for redis.asyncio clients, which
+imports app/db_async.py only when called so synchronous callers do not load it.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import get_redis_client
+
+TOP_COVERAGE_KEY = "top_clients_coverage"
+CANCELLED_STATE = "Cancelada"
+
+
+def coverage_member(client):
+    """Sorted set member for a client: "id_cliente|nombre apellido" """
+    return f"{client['id_cliente']}|{client.get('nombre', '')} {client.get('apellido', '')}"
+
+
+def policy_coverage(poliza):
+    """Coverage a policy contributes to its client's total"""
+    if poliza.get("estado") == CANCELLED_STATE:
+        return 0.0
+    try:
+        return float(poliza.get("cobertura_total") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def adjust_client_coverage(client, delta, redis_client=None):
+    """
+    Apply a coverage delta to a client's score
+
+    Clients whose total drops to zero are removed, just like a full rebuild
+    would leave them out.
+    """
+    if not delta:
+        return
+    redis_client = redis_client or get_redis_client()
+    try:
+        member = coverage_member(client)
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.zincrby(TOP_COVERAGE_KEY, delta, member)
+        pipe.zremrangebyscore(TOP_COVERAGE_KEY, "-inf", 0)
+        pipe.execute()
+    except Exception as e:
+        print(f"Error actualizando ranking de cobertura: {e}")
+
+
+def rename_client_member(old_client, new_client, redis_client=None):
+    """Move a client's score to its new member after a name change"""
+    old_member = coverage_member(old_client)
+    new_member = coverage_member(new_client)
+    if old_member == new_member:
+        return
+    redis_client = redis_client or get_redis_client()
+
+    def move_score(pipe):
+        # WATCH makes the move retry if a delta lands between read and write
+        score = pipe.zscore(TOP_COVERAGE_KEY, old_member)
+        if score is None:
+            return
+        pipe.multi()
+        pipe.zrem(TOP_COVERAGE_KEY, old_member)
+        pipe.zincrby(TOP_COVERAGE_KEY, score, new_member)
+
+    try:
+        redis_client.transaction(move_score, TOP_COVERAGE_KEY)
+    except Exception as e:
+        print(f"Error actualizando ranking de cobertura: {e}")
+
+
+def remove_client(client, redis_client=None):
+    """Drop a deleted client from the ranking"""
+    redis_client = redis_client or get_redis_client()
+    try:
+        redis_client.zrem(TOP_COVERAGE_KEY, coverage_member(client))
+    except Exception as e:
+        print(f"Error actualizando ranking de cobertura: {e}")
+
+
+async def adjust_client_coverage_async(client, delta, redis_client=None):
+    """adjust_client_coverage for redis.asyncio clients"""
+    if not delta:
+        return
+    if redis_client is None:
+        from app.db_async import get_async_redis_client
+        redis_client = get_async_redis_client()
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zincrby(TOP_COVERAGE_KEY, delta, coverage_member(client))
+            pipe.zremrangebyscore(TOP_COVERAGE_KEY, "-inf", 0)
+            await pipe.execute()
+    except Exception as e:
+        print(f"Error actualizando ranking de cobertura: {e}")
+
+
+async def rename_client_member_async(old_client, new_client, redis_client=None):
+    """rename_client_member for redis.asyncio clients"""
+    old_member = coverage_member(old_client)
+    new_member = coverage_member(new_client)
+    if old_member == new_member:
+        return
+    if redis_client is None:
+        from app.db_async import get_async_redis_client
+        redis_client = get_async_redis_client()
+
+    async def move_score(pipe):
+        score = await pipe.zscore(TOP_COVERAGE_KEY, old_member)
+        if score is None:
+            return
+        pipe.multi()
+        pipe.zrem(TOP_COVERAGE_KEY, old_member)
+        pipe.zincrby(TOP_COVERAGE_KEY, score, new_member)
+
+    try:
+        await redis_client.transaction(move_score, TOP_COVERAGE_KEY)
+    except Exception as e:
+        print(f"Error actualizando ranking de cobertura: {e}")
+
+
+async def remove_client_async(client, redis_client=None):
+    """remove_client for redis.asyncio clients"""
+    if redis_client is None:
+        from app.db_async import get_async_redis_client
+        redis_client = get_async_redis_client()
+    try:
+        await redis_client.zrem(TOP_COVERAGE_KEY, coverage_member(client))
+    except Exception as e:
+        print(f"Error actualizando ranking de cobertura: {e}")
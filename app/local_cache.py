@@ -0,0 +1,197 @@
+"""
+In-process L1 cache in front of Redis
+
+A size-bounded LRU with per-entry TTL that RedisCache consults before going
+to Redis. Invalidations are published on a Redis pub/sub channel and every
+process with an L1 cache evicts the same keys, so a write in one process
+does not leave stale entries in another.
+
+Disabled by default; enable it with the CACHE_L1_SIZE environment variable
+(maximum number of entries). CACHE_L1_TTL bounds how long an entry may be
+served without asking Redis again.
+"""
+
+import os
+import json
+import time
+import threading
+from fnmatch import fnmatchcase
+from collections import OrderedDict
+
+L1_SIZE = int(os.environ.get("CACHE_L1_SIZE", "0"))
+L1_TTL = float(os.environ.get("CACHE_L1_TTL", "30"))
+INVALIDATION_CHANNEL = "cache:invalidations"
+
+
+def key_str(key):
+    return key.decode() if isinstance(key, bytes) else key
+
+
+class LocalCache:
+    """
+    Thread-safe LRU cache with per-entry expiry
+
+    Values are returned as stored, not copied: callers must not mutate them.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (value, expires_at, redis_expires_at)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entry(self, key, now):
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] <= now:
+            del self.entries[key]
+            return None
+        return entry
+
+    def get(self, key):
+        """Cached value, or None if absent or expired"""
+        with self.lock:
+            entry = self._entry(key, time.monotonic())
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def redis_ttl(self, key):
+        """Seconds left on the Redis entry this value came from, if known"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self._entry(key, now)
+            if entry is None or entry[2] is None:
+                return None
+            return max(0, int(entry[2] - now))
+
+    def set(self, key, value, redis_ttl=None):
+        """
+        Store a value
+
+        Args:
+            redis_ttl: Seconds left on the Redis entry; the local copy never
+                       outlives it
+        """
+        now = time.monotonic()
+        redis_expires_at = now + redis_ttl if redis_ttl and redis_ttl > 0 else None
+        expires_at = now + self.ttl
+        if redis_expires_at is not None:
+            expires_at = min(expires_at, redis_expires_at)
+
+        with self.lock:
+            self.entries[key] = (value, expires_at, redis_expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key_str(key), None)
+
+    def invalidate_pattern(self, pattern):
+        """Evict the keys matching a Redis glob pattern"""
+        with self.lock:
+            for key in [k for k in self.entries if fnmatchcase(k, pattern)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate_percent": round(self.hits / total * 100, 2) if total else 0,
+            }
+
+
+def invalidation_message(keys=(), pattern=None):
+    return json.dumps({"keys": [key_str(key) for key in keys], "pattern": pattern})
+
+
+def publish_invalidation(redis_client, keys=(), pattern=None):
+    """Tell every process to evict keys (or a pattern) from its L1 cache"""
+    if not keys and pattern is None:
+        return
+    try:
+        redis_client.publish(INVALIDATION_CHANNEL, invalidation_message(keys, pattern))
+    except Exception as e:
+        print(f"Error publicando invalidación: {e}")
+
+
+def apply_invalidation(local_cache, data):
+    message = json.loads(data)
+    if message.get("pattern"):
+        local_cache.invalidate_pattern(message["pattern"])
+    local_cache.invalidate(message.get("keys", []))
+
+
+def listen_for_invalidations(local_cache, redis_client):
+    """Apply the invalidations published by any process (runs in a daemon thread)"""
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Messages published while not subscribed are lost
+            local_cache.clear()
+            while True:
+                # A read timeout keeps the loop from blocking on the pool's socket timeout
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    apply_invalidation(local_cache, message["data"])
+        except Exception as e:
+            print(f"Error en el listener de invalidaciones: {e}")
+            time.sleep(1)
+        finally:
+            pubsub.close()
+
+
+_lock = threading.Lock()
+_local_cache = None
+
+
+def _reset_after_fork():
+    # The listener thread does not survive a fork
+    global _lock, _local_cache
+    _lock = threading.Lock()
+    _local_cache = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_local_cache():
+    """Process-wide L1 cache, or None when CACHE_L1_SIZE is 0"""
+    global _local_cache
+    if L1_SIZE <= 0:
+        return None
+    if _local_cache is None:
+        with _lock:
+            if _local_cache is None:
+                from app.db import get_redis_client
+
+                local_cache = LocalCache(L1_SIZE, L1_TTL)
+                threading.Thread(
+                    target=listen_for_invalidations,
+                    args=(local_cache, get_redis_client()),
+                    name="cache-invalidation-listener",
+                    daemon=True,
+                ).start()
+                _local_cache = local_cache
+    return _local_cache
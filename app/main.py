@@ -1,57 +1,545 @@
 import pandas as pd
 import sys
 import os
-import datetime
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pymongo import UpdateOne
 
 # Add the parent directory to the path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.db import get_mongo_collection, get_redis_client
+from app.leaderboard import TOP_COVERAGE_KEY, CANCELLED_STATE, coverage_member
+from app.indexes import ensure_indexes
+from app.cache import invalidate_namespaces, ALL_NAMESPACES
 
-def load_csv_to_mongo():
+DEFAULT_DATA_DIR = "resources"
+CSV_NAMES = ["clientes", "polizas", "siniestros", "agentes", "vehiculos"]
+
+
+def csv_files(data_dir=DEFAULT_DATA_DIR):
+    """Paths of the five CSV files inside data_dir"""
+    return {name: os.path.join(data_dir, f"{name}.csv") for name in CSV_NAMES}
+
+
+CSV_FILES = csv_files()
+
+# Column types applied to every CSV before documents are built, so every
+# loader stores the same canonical BSON types (dates, booleans, ints, null)
+COLUMN_TYPES = {
+    "clientes": {
+        "ints": ["id_cliente", "dni", "telefono"],
+        "bools": ["activo"],
+    },
+    "polizas": {
+        "ints": ["id_cliente", "id_agente"],
+        "numbers": ["prima_mensual", "cobertura_total"],
+        "dates": ["fecha_inicio", "fecha_fin"],
+    },
+    "siniestros": {
+        "ints": ["id_siniestro"],
+        "numbers": ["monto_estimado"],
+        "dates": ["fecha"],
+    },
+    "agentes": {
+        "ints": ["id_agente", "telefono"],
+        "bools": ["activo"],
+    },
+    "vehiculos": {
+        "ints": ["id_vehiculo", "id_cliente", "anio"],
+        "bools": ["asegurado"],
+    },
+}
+
+BOOL_VALUES = {"true": True, "1": True, "1.0": True, "false": False, "0": False, "0.0": False}
+DATE_FORMAT = "%d/%m/%Y"
+
+# Number of client documents sent to MongoDB per insert_many call
+DEFAULT_BATCH_SIZE = 1000
+
+# Per-entity fingerprints written by the incremental sync (app/sync.py)
+FINGERPRINTS_COLLECTION = "aseguradoras_fingerprints"
+
+
+def load_csv_to_mongo(mode="bulk", batch_size=DEFAULT_BATCH_SIZE, workers=None, data_dir=DEFAULT_DATA_DIR,
+                      warmup=False):
+    """
+    Load the CSV files in data_dir (resources/ by default) into MongoDB
+
+    Args:
+        mode: "bulk" joins every file in memory and inserts fully built client
+              documents in batches; "stream" reads the files in chunks of
+              batch_size rows and writes each chunk while the next one is
+              parsed; "parallel" shards the clients by a hash of id_cliente
+              across a process pool and runs the bulk loader on each shard;
+              "legacy" inserts the clients and then applies one update per
+              policy, claim, vehicle and agent; "sync" writes only what
+              changed since the last sync (see app/sync.py)
+        batch_size: Documents or rows per write round trip
+        workers: Processes used by the parallel mode (default: CPU count)
+        data_dir: Directory holding clientes/polizas/siniestros/agentes/vehiculos.csv
+        warmup: Recompute the cached read queries once the data is loaded
+                (see app/warmup.py)
+    """
+    files = csv_files(data_dir)
+
+    if mode == "sync":
+        from app.sync import sync_csv_to_mongo
+        sync_csv_to_mongo(batch_size, files)
+    else:
+        load_full(mode, batch_size, workers, files)
+
+    if warmup:
+        from app.warmup import warm_caches
+        warm_caches()
+
+
+def load_full(mode, batch_size, workers, files):
+    """Replace the collection with the contents of files (every mode but "sync")"""
     mongo_collection = get_mongo_collection()
     redis_client = get_redis_client()
-    
+
     # Clear the collection first to avoid duplicates
     mongo_collection.delete_many({})
-    
-    csv_files = [
-        "resources/clientes.csv",
-        "resources/polizas.csv", 
-        "resources/siniestros.csv",
-        "resources/agentes.csv",
-        "resources/vehiculos.csv"
+    # The fingerprints of the last incremental sync no longer describe the
+    # collection; they are written again once the load finishes
+    fingerprints_collection = get_mongo_collection(FINGERPRINTS_COLLECTION)
+    fingerprints_collection.delete_many({})
+
+    if mode == "bulk":
+        load_bulk(mongo_collection, batch_size, files)
+    elif mode == "stream":
+        load_streaming(mongo_collection, batch_size, files)
+    elif mode == "parallel":
+        load_parallel(batch_size, workers, files)
+    elif mode == "legacy":
+        load_row_by_row(mongo_collection, files)
+    else:
+        raise ValueError(f"Unknown load mode: {mode}")
+
+    # Building the indexes once after the load is cheaper than maintaining them per insert
+    ensure_indexes(mongo_collection)
+    # Every cached result belongs to the previous data set
+    invalidate_namespaces(ALL_NAMESPACES)
+    build_top_coverage_in_redis(mongo_collection, redis_client)
+    save_loaded_fingerprints(mongo_collection, fingerprints_collection, batch_size)
+
+
+def save_loaded_fingerprints(mongo_collection, fingerprints_collection, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Store the fingerprints of the loaded documents for the next incremental sync
+
+    They are taken from the collection, so every load mode stores the same
+    ones, and the next "sync" only writes what changed instead of falling back
+    to a full reload.
+    """
+    from app.sync import collect_fingerprints, save_fingerprints
+
+    desired = collect_fingerprints(mongo_collection.find({}, {"_id": 0}))
+    save_fingerprints(fingerprints_collection, {}, desired, batch_size)
+
+
+def coerce_types(df, name):
+    """
+    Convert the columns of a CSV frame to their canonical types, column-wise
+
+    Dates become datetime, booleans arriving as True/"True"/"true"/1 become
+    bool, ids become int and every missing value becomes None instead of NaN.
+    """
+    types = COLUMN_TYPES.get(name, {})
+    df = df.copy()
+
+    for column in types.get("dates", []):
+        if column in df:
+            parsed = pd.to_datetime(df[column], format=DATE_FORMAT)
+            df[column] = pd.Series(parsed.dt.to_pydatetime(), index=df.index, dtype=object)
+    for column in types.get("bools", []):
+        if column in df:
+            df[column] = df[column].astype(str).str.strip().str.lower().map(BOOL_VALUES)
+    for column in types.get("ints", []):
+        if column in df:
+            # Nullable Int64 keeps ids as integers even when some are missing
+            df[column] = pd.to_numeric(df[column]).astype("Int64")
+    for column in types.get("numbers", []):
+        if column in df:
+            df[column] = pd.to_numeric(df[column])
+
+    return df.astype(object).where(df.notna(), None)
+
+
+def file_name(file):
+    """CSV name (clientes, polizas, ...) of a file path"""
+    return os.path.splitext(os.path.basename(file))[0]
+
+
+def read_csv_frame(file):
+    return coerce_types(pd.read_csv(file), file_name(file))
+
+
+def read_csv_records(file):
+    return read_csv_frame(file).to_dict(orient="records")
+
+
+def build_client_documents(clientes, polizas, siniestros, vehiculos, agentes):
+    """
+    Join the CSV records in memory and build the embedded client documents
+
+    Produces the same documents as load_row_by_row: policies, claims and
+    vehicles whose parent does not exist are dropped, and duplicated
+    policies/claims/vehicles keep their first occurrence.
+
+    Args:
+        clientes, polizas, siniestros, vehiculos, agentes: Lists of typed CSV
+            records (see coerce_types)
+
+    Returns:
+        List of client documents ready to be inserted
+    """
+    agentes_by_id = {}
+    for record in agentes:
+        record = dict(record)
+        id_agente = record.pop("id_agente")
+        # Later rows win, like successive update_many calls would
+        agentes_by_id[id_agente] = record
+
+    clients_by_id = {}
+    documents = []
+    for record in clientes:
+        document = dict(record)
+        documents.append(document)
+        # Updates only ever reached the first client with a given id
+        clients_by_id.setdefault(document["id_cliente"], document)
+
+    polizas_by_nro = {}
+    for record in polizas:
+        record = dict(record)
+        id_cliente = record.pop("id_cliente")
+        client = clients_by_id.get(id_cliente)
+        if client is None:
+            continue
+
+        client_polizas = client.setdefault("polizas", [])
+        if any(p["nro_poliza"] == record["nro_poliza"] for p in client_polizas):
+            continue
+
+        client_polizas.append(record)
+        polizas_by_nro.setdefault(record["nro_poliza"], (client, record))
+
+    for record in siniestros:
+        record = dict(record)
+        nro_poliza = record.pop("nro_poliza")
+        match = polizas_by_nro.get(nro_poliza)
+        if match is None:
+            continue
+
+        client, poliza = match
+        already_loaded = any(
+            s["id_siniestro"] == record["id_siniestro"]
+            for p in client["polizas"]
+            for s in p.get("siniestros", [])
+        )
+        if already_loaded:
+            continue
+
+        poliza.setdefault("siniestros", []).append(record)
+
+    for record in vehiculos:
+        record = dict(record)
+        id_cliente = record.pop("id_cliente")
+        client = clients_by_id.get(id_cliente)
+        if client is None:
+            continue
+
+        client_vehiculos = client.setdefault("vehiculos", [])
+        if any(v["id_vehiculo"] == record["id_vehiculo"] for v in client_vehiculos):
+            continue
+        client_vehiculos.append(record)
+
+    # Embed the agent into every policy assigned to it
+    for client in clients_by_id.values():
+        for poliza in client.get("polizas", []):
+            agente = agentes_by_id.get(poliza.get("id_agente"))
+            if agente is not None:
+                poliza["agente"] = dict(agente)
+
+    return documents
+
+
+def insert_in_batches(mongo_collection, documents, batch_size=DEFAULT_BATCH_SIZE):
+    """Insert documents with one insert_many round trip per batch"""
+    inserted = 0
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        mongo_collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def load_bulk(mongo_collection, batch_size=DEFAULT_BATCH_SIZE, files=CSV_FILES):
+    records = {name: read_csv_records(file) for name, file in files.items()}
+    for name, file in files.items():
+        print(f"Read {len(records[name])} records from {file}")
+
+    documents = build_client_documents(
+        records["clientes"],
+        records["polizas"],
+        records["siniestros"],
+        records["vehiculos"],
+        records["agentes"],
+    )
+    inserted = insert_in_batches(mongo_collection, documents, batch_size)
+    print(f"Inserted {inserted} client documents in batches of {batch_size}")
+
+
+def shard_ids(ids, workers):
+    """Shard (0..workers-1) of each row, from a hash of its id"""
+    # Numeric ids are hashed as float so 7 and 7.0 land on the same shard
+    if pd.api.types.is_numeric_dtype(ids):
+        keys = ids.astype("float64")
+    else:
+        keys = ids.astype(str)
+    return pd.util.hash_pandas_object(keys, index=False) % workers
+
+
+def split_shards(frames, workers):
+    """
+    Split the parsed CSV frames into the records of each shard
+
+    Clients, policies and vehicles follow their id_cliente. A claim follows
+    the client that owns its policy in build_client_documents (the first
+    loaded client with a policy of that number), so a policy number used by
+    clients of two shards gets its claims attached only once. Agents are
+    small enough to go to every shard.
+
+    Returns:
+        List with the record lists (clientes, polizas, ...) of each shard
+    """
+    clientes = frames["clientes"]
+    polizas = frames["polizas"]
+    siniestros = frames["siniestros"]
+
+    owners = (
+        polizas[polizas["id_cliente"].isin(clientes["id_cliente"])]
+        .drop_duplicates("nro_poliza")
+        .set_index("nro_poliza")["id_cliente"]
+    )
+    siniestro_owners = siniestros["nro_poliza"].map(owners)
+    # Claims of unknown policies are dropped, as in the serial loader
+    siniestros = siniestros[siniestro_owners.notna()]
+    siniestro_owners = siniestro_owners[siniestro_owners.notna()]
+
+    sharded = {
+        "clientes": (clientes, shard_ids(clientes["id_cliente"], workers)),
+        "polizas": (polizas, shard_ids(polizas["id_cliente"], workers)),
+        "siniestros": (siniestros, shard_ids(siniestro_owners, workers)),
+        "vehiculos": (frames["vehiculos"], shard_ids(frames["vehiculos"]["id_cliente"], workers)),
+    }
+    agentes = frames["agentes"].to_dict(orient="records")
+    return [
+        {
+            **{name: frame[(shards == shard).to_numpy()].to_dict(orient="records")
+               for name, (frame, shards) in sharded.items()},
+            "agentes": agentes,
+        }
+        for shard in range(workers)
     ]
 
-    for file in csv_files:
-        df = pd.read_csv(file)
-        records = df.to_dict(orient="records")
-        
-        if file == "resources/clientes.csv":
+
+def load_shard(records, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Build and insert the client documents of one shard (runs in a worker process)
+
+    The parent parses the CSV files once and sends each worker only the
+    records of its shard, so document building and inserts are spread across
+    processes without parsing the files once per worker.
+    """
+    documents = build_client_documents(
+        records["clientes"],
+        records["polizas"],
+        records["siniestros"],
+        records["vehiculos"],
+        records["agentes"],
+    )
+    # Each process needs its own MongoClient, clients are not fork-safe
+    return insert_in_batches(get_mongo_collection(), documents, batch_size)
+
+
+def load_parallel(batch_size=DEFAULT_BATCH_SIZE, workers=None, files=CSV_FILES):
+    """
+    Load the CSV files with one process per shard of id_cliente
+
+    Every client lands in exactly one shard together with its policies,
+    claims and vehicles, so the documents are the same ones load_bulk builds.
+    """
+    workers = workers or os.cpu_count() or 1
+    frames = {name: read_csv_frame(file) for name, file in files.items()}
+    shards = split_shards(frames, workers)
+    del frames
+    # spawn avoids inheriting the parent's MongoClient sockets and threads
+    context = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(load_shard, records, batch_size) for records in shards]
+        inserted = sum(future.result() for future in futures)
+
+    print(f"Inserted {inserted} client documents using {workers} worker processes")
+
+
+def iter_csv_batches(file, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield the records of a CSV file in lists of at most batch_size rows"""
+    name = file_name(file)
+    for chunk in pd.read_csv(file, chunksize=batch_size):
+        yield coerce_types(chunk, name).to_dict(orient="records")
+
+
+class BackgroundWriter:
+    """
+    Runs one database write at a time in a background thread
+
+    submit() waits for the previous write before starting the next one, so at
+    most one batch is being written while the caller parses the following one.
+    That keeps memory bounded to two batches and preserves write order.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def submit(self, func, *args, **kwargs):
+        self.wait()
+        self.pending = self.executor.submit(func, *args, **kwargs)
+
+    def wait(self):
+        if self.pending is not None:
+            # result() re-raises any error from the write
+            self.pending.result()
+            self.pending = None
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown()
+
+
+def stream_client_batches(file, batch_size):
+    for records in iter_csv_batches(file, batch_size):
+        yield records, len(records)
+
+
+def stream_poliza_updates(file, batch_size, agentes_by_id):
+    for records in iter_csv_batches(file, batch_size):
+        operations = []
+        for record in records:
+            id_cliente = record.pop("id_cliente")
+            agente = agentes_by_id.get(record.get("id_agente"))
+            if agente is not None:
+                record["agente"] = dict(agente)
+
+            operations.append(UpdateOne(
+                {"id_cliente": id_cliente, "polizas.nro_poliza": {"$ne": record["nro_poliza"]}},
+                {"$push": {"polizas": record}}
+            ))
+        yield operations, len(records)
+
+
+def stream_siniestro_updates(file, batch_size):
+    for records in iter_csv_batches(file, batch_size):
+        operations = []
+        for record in records:
+            nro_poliza = record.pop("nro_poliza")
+
+            operations.append(UpdateOne(
+                {
+                    "polizas.nro_poliza": nro_poliza,
+                    "polizas.siniestros.id_siniestro": {"$ne": record["id_siniestro"]}
+                },
+                {"$push": {"polizas.$[poliza].siniestros": record}},
+                array_filters=[{"poliza.nro_poliza": nro_poliza}]
+            ))
+        yield operations, len(records)
+
+
+def stream_vehiculo_updates(file, batch_size):
+    for records in iter_csv_batches(file, batch_size):
+        operations = []
+        for record in records:
+            id_cliente = record.pop("id_cliente")
+            operations.append(UpdateOne(
+                {"id_cliente": id_cliente, "vehiculos.id_vehiculo": {"$ne": record["id_vehiculo"]}},
+                {"$push": {"vehiculos": record}}
+            ))
+        yield operations, len(records)
+
+
+def load_streaming(mongo_collection, batch_size=DEFAULT_BATCH_SIZE, files=CSV_FILES):
+    """
+    Load the CSV files chunk by chunk with bounded memory
+
+    Only agentes.csv, a small reference table, is read in full so each policy
+    can embed its agent when it is pushed. Every other file is parsed in chunks
+    of batch_size rows and each chunk is flushed with a single insert_many or
+    bulk_write while the next chunk is being parsed.
+    """
+    agentes_by_id = {}
+    for records in iter_csv_batches(files["agentes"], batch_size):
+        for record in records:
+            agentes_by_id[record.pop("id_agente")] = record
+    print(f"Processed {len(agentes_by_id)} records from {files['agentes']}")
+
+    stages = [
+        (files["clientes"], stream_client_batches(files["clientes"], batch_size),
+         lambda docs: mongo_collection.insert_many(docs, ordered=False)),
+        (files["polizas"], stream_poliza_updates(files["polizas"], batch_size, agentes_by_id),
+         mongo_collection.bulk_write),
+        (files["siniestros"], stream_siniestro_updates(files["siniestros"], batch_size),
+         mongo_collection.bulk_write),
+        (files["vehiculos"], stream_vehiculo_updates(files["vehiculos"], batch_size),
+         mongo_collection.bulk_write),
+    ]
+
+    writer = BackgroundWriter()
+    try:
+        for file, batches, write in stages:
+            total = 0
+            for batch, rows in batches:
+                if batch:
+                    writer.submit(write, batch)
+                total += rows
+            # Later files update documents written by this one
+            writer.wait()
+            print(f"Processed {total} records from {file}")
+    finally:
+        writer.close()
+
+
+def load_row_by_row(mongo_collection, files=CSV_FILES):
+    for file in files.values():
+        records = read_csv_records(file)
+
+        if file == files["clientes"]:
             # Insert clients first as base documents
             mongo_collection.insert_many(records)
-            
-        elif file == "resources/polizas.csv":
+
+        elif file == files["polizas"]:
             for record in records:
                 # Extract id_cliente for the query but remove it from the record
                 id_cliente = record.pop("id_cliente")
-                record['fecha_inicio'] = datetime.datetime.strptime(record['fecha_inicio'], "%d/%m/%Y")
-                record['fecha_fin'] = datetime.datetime.strptime(record['fecha_fin'], "%d/%m/%Y")
 
                 # Check if poliza already exists for this client
                 query_filter = {
-                    "id_cliente": id_cliente, 
+                    "id_cliente": id_cliente,
                     "polizas.nro_poliza": {"$ne": record["nro_poliza"]}
                 }
                 update_operation = {"$push": {"polizas": record}}
                 mongo_collection.update_one(query_filter, update_operation)
-                
-        elif file == "resources/siniestros.csv":
+
+        elif file == files["siniestros"]:
             for record in records:
                 # Extract nro_poliza for the query but remove it from the record
                 nro_poliza = record.pop("nro_poliza")
-                record['fecha'] = datetime.datetime.strptime(record['fecha'], "%d/%m/%Y")
-                
+
                 # Check if siniestro already exists for this poliza
                 query_filter = {
                     "polizas.nro_poliza": nro_poliza,
@@ -59,11 +547,11 @@ def load_csv_to_mongo():
                 }
                 update_operation = {"$push": {"polizas.$.siniestros": record}}
                 mongo_collection.update_one(query_filter, update_operation)
-                
-        elif file == "resources/vehiculos.csv":
+
+        elif file == files["vehiculos"]:
             for record in records:
                 id_cliente = record.pop("id_cliente")
-                
+
                 # Check if vehiculo already exists for this client
                 query_filter = {
                     "id_cliente": id_cliente,
@@ -71,53 +559,108 @@ def load_csv_to_mongo():
                 }
                 update_operation = {"$push": {"vehiculos": record}}
                 mongo_collection.update_one(query_filter, update_operation)
-                
-        elif file == "resources/agentes.csv":
+
+        elif file == files["agentes"]:
             for record in records:
                 id_agente = record.pop("id_agente")
-                
+
                 # Add agent info to ALL polizas that have this agent using arrayFilters
                 query_filter = {"polizas.id_agente": id_agente}
                 update_operation = {"$set": {"polizas.$[elem].agente": record}}
                 array_filters = [{"elem.id_agente": id_agente}]
-                
+
                 mongo_collection.update_many(
-                    query_filter, 
-                    update_operation, 
+                    query_filter,
+                    update_operation,
                     array_filters=array_filters
                 )
         print(f"Processed {len(records)} records from {file}")
-    build_top_coverage_in_redis(mongo_collection, redis_client)
 
 
-def build_top_coverage_in_redis(mongo_collection, redis_client):
+def build_top_coverage_in_redis(mongo_collection, redis_client, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Rebuild the top_clients_coverage sorted set
 
-    redis_key = "top_clients_coverage"
-    redis_client.delete(redis_key)
+    MongoDB sums cobertura_total per client and only returns the id, name and
+    total. The members are written with one ZADD per batch into a temporary
+    key, which then replaces top_clients_coverage with an atomic RENAME, so
+    readers never see a half-built or empty set. Cancelled policies are left
+    out, matching the deltas applied by app/leaderboard.py.
+    """
+    redis_key = TOP_COVERAGE_KEY
+    tmp_key = f"{redis_key}:rebuild:{os.getpid()}"
+    redis_client.delete(tmp_key)
 
-    clients = mongo_collection.find({
-        "id_cliente": {"$exists": True},
-        "polizas": {"$exists": True}
-    })
+    totals = mongo_collection.aggregate([
+        {"$match": {
+            "id_cliente": {"$exists": True},
+            "polizas": {"$exists": True}
+        }},
+        {"$project": {
+            "_id": 0,
+            "id_cliente": 1,
+            "nombre": 1,
+            "apellido": 1,
+            "total_coverage": {"$sum": {"$map": {
+                "input": "$polizas",
+                "as": "poliza",
+                # Missing or non-numeric coverages count as 0
+                "in": {"$cond": [
+                    {"$eq": ["$$poliza.estado", CANCELLED_STATE]},
+                    0,
+                    {"$convert": {
+                        "input": "$$poliza.cobertura_total",
+                        "to": "double",
+                        "onError": 0,
+                        "onNull": 0
+                    }}
+                ]}
+            }}}
+        }},
+        {"$match": {"total_coverage": {"$gt": 0}}}
+    ], allowDiskUse=True)
 
-    for client in clients:
-        total_coverage = 0.0
+    members = 0
+    batch = {}
 
-        for poliza in client.get("polizas", []):
-            cov = poliza.get("cobertura_total")
-            if cov is None:
-                continue
-            try:
-                total_coverage += float(cov)
-            except (TypeError, ValueError):
-                continue
+    def flush():
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zadd(tmp_key, batch)
+        # Leftovers of an interrupted rebuild expire on their own
+        pipe.expire(tmp_key, 3600)
+        pipe.execute()
+        batch.clear()
+
+    for client in totals:
+        # score = cobertura_total
+        batch[coverage_member(client)] = client["total_coverage"]
+        members += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
 
-        if total_coverage > 0:
-            member = f"{client['id_cliente']}|{client.get('nombre', '')} {client.get('apellido', '')}"
-            # score = cobertura_total
-            redis_client.zadd(redis_key, {member: total_coverage}) # lo guardo en un sorted set
-    print("Processed redis sorted set")
+    if members:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.rename(tmp_key, redis_key)
+        pipe.persist(redis_key)
+        pipe.execute()
+    else:
+        redis_client.delete(redis_key)
+    print(f"Processed redis sorted set ({members} clients)")
 
 
 if __name__ == "__main__":
-    load_csv_to_mongo()
+    parser = argparse.ArgumentParser(description="Load the CSV files in resources/ into MongoDB")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR,
+                        help="Directory with the CSV files (default: resources)")
+    parser.add_argument("--mode", choices=["bulk", "stream", "parallel", "sync", "legacy"], default="bulk")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for --mode parallel (default: CPU count)")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Precompute the cached read queries after the load")
+    args = parser.parse_args()
+
+    load_csv_to_mongo(mode=args.mode, batch_size=args.batch_size, workers=args.workers, data_dir=args.data_dir,
+                      warmup=args.warmup)
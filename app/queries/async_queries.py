@@ -0,0 +1,582 @@
+"""
+Async variants of query1..query15
+
+They use the same filters, pipelines, cache keys and validations as the
+synchronous modules, but await the app/db_async.py clients, so a single
+event loop can multiplex many concurrent lookups. Unlike the synchronous
+functions they return their results without printing them.
+
+Uso:
+    python app/queries/async_queries.py --concurrency 1000
+"""
+
+import sys
+import os
+import time
+import random
+import asyncio
+import argparse
+from pymongo import ReturnDocument
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db_async import get_async_mongo_collection, get_async_redis_client, close_async_connections
+from app.cache import cliente_tag, poliza_tag, ALL_NAMESPACES
+from app.cache_async import AsyncRedisCache, invalidate_tags, invalidate_namespaces
+from app.change_stream import mark_patched_async
+from app.leaderboard import (
+    TOP_COVERAGE_KEY, CANCELLED_STATE, policy_coverage,
+    adjust_client_coverage_async, rename_client_member_async, remove_client_async,
+)
+from app.queries import (
+    query1, query2, query3, query4, query5, query6, query8,
+    query9, query10, query11, query12, query13, query14, query15,
+)
+
+
+async def cached_result(cache_key, ttl, compute, use_cache=True, tags=None):
+    """
+    Return the cached value of cache_key, or await compute() and cache it
+
+    Args:
+        cache_key: Redis key, shared with the synchronous query
+        ttl: Seconds to keep the computed result
+        compute: Coroutine function producing the result on a miss
+        use_cache: If False, always compute and do not store
+        tags: Cache tags the result is registered under
+    """
+    if not use_cache:
+        return await compute()
+    # Concurrent misses on the same key run compute() only once
+    result, _ = await AsyncRedisCache().get_or_compute(cache_key, compute, ttl=ttl, tags=tags)
+    return result
+
+
+async def aggregate(pipeline):
+    cursor = await get_async_mongo_collection().aggregate(pipeline)
+    return await cursor.to_list()
+
+
+# ---------------------------------------------------------------------------
+# Read queries (query1 - query12)
+# ---------------------------------------------------------------------------
+
+async def get_active_clients(use_cache=True):
+    collection = get_async_mongo_collection()
+    return await cached_result(
+        query1.CACHE_KEY, query1.CACHE_TTL,
+        lambda: collection.find(query1.ACTIVE_CLIENTS_FILTER).to_list(),
+        use_cache, query1.CACHE_TAGS,
+    )
+
+
+async def get_open_claims(use_cache=True):
+    return await cached_result(
+        query2.CACHE_KEY, query2.CACHE_TTL,
+        lambda: aggregate(query2.OPEN_CLAIMS_PIPELINE), use_cache, query2.CACHE_TAGS,
+    )
+
+
+async def get_insured_vehicles_with_client_and_policy(use_cache=True):
+    collection = get_async_mongo_collection()
+
+    async def compute():
+        clients = await collection.find(query3.INSURED_VEHICLES_FILTER).to_list()
+        return query3.insured_vehicle_rows(clients)
+
+    return await cached_result(query3.CACHE_KEY, query3.CACHE_TTL, compute, use_cache, query3.CACHE_TAGS)
+
+
+async def get_clients_without_active_policies(use_cache=True):
+    return await cached_result(
+        query4.CACHE_KEY, query4.CACHE_TTL,
+        lambda: aggregate(query4.CLIENTS_WITHOUT_ACTIVE_POLICIES_PIPELINE), use_cache, query4.CACHE_TAGS,
+    )
+
+
+async def get_active_agents_with_assigned_policies_count(use_cache=True):
+    return await cached_result(
+        query5.CACHE_KEY, query5.CACHE_TTL,
+        lambda: aggregate(query5.ACTIVE_AGENTS_PIPELINE), use_cache, query5.CACHE_TAGS,
+    )
+
+
+async def get_expired_policies(use_cache=True):
+    return await cached_result(
+        query6.CACHE_KEY, query6.CACHE_TTL,
+        lambda: aggregate(query6.EXPIRED_POLICIES_PIPELINE), use_cache, query6.CACHE_TAGS,
+    )
+
+
+async def get_top10_clients_by_total_coverage():
+    entries = await get_async_redis_client().zrevrange(TOP_COVERAGE_KEY, 0, 9, withscores=True)
+    result = []
+    for member, score in entries:
+        member = member.decode() if isinstance(member, bytes) else member
+        id_cliente_str, nombre = member.split("|", 1)
+        result.append({
+            "id_cliente": int(id_cliente_str),
+            "nombre": nombre,
+            "cobertura_total": float(score)
+        })
+    return result
+
+
+async def get_accident_claims_last_year(use_cache=True):
+    return await cached_result(
+        query8.CACHE_KEY, query8.CACHE_TTL,
+        lambda: aggregate(query8.accident_claims_pipeline()), use_cache, query8.CACHE_TAGS,
+    )
+
+
+async def view_active_policies(use_cache=True):
+    return await cached_result(
+        query9.CACHE_KEY, query9.CACHE_TTL,
+        lambda: aggregate(query9.ACTIVE_POLICIES_PIPELINE), use_cache, query9.CACHE_TAGS,
+    )
+
+
+async def get_suspended_policies(use_cache=True):
+    return await cached_result(
+        query10.CACHE_KEY, query10.CACHE_TTL,
+        lambda: aggregate(query10.SUSPENDED_POLICIES_PIPELINE), use_cache, query10.CACHE_TAGS,
+    )
+
+
+async def get_clients_with_multiple_insured_vehicles(use_cache=True):
+    return await cached_result(
+        query11.CACHE_KEY, query11.CACHE_TTL,
+        lambda: aggregate(query11.MULTIPLE_VEHICLES_PIPELINE), use_cache, query11.CACHE_TAGS,
+    )
+
+
+async def get_agents_with_claims_count(use_cache=True):
+    return await cached_result(
+        query12.CACHE_KEY, query12.CACHE_TTL,
+        lambda: aggregate(query12.AGENTS_CLAIMS_PIPELINE), use_cache, query12.CACHE_TAGS,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Clients ABM (query13)
+# ---------------------------------------------------------------------------
+
+async def get_next_client_id():
+    result = await get_async_mongo_collection().find_one(
+        {"id_cliente": {"$exists": True}},
+        sort=[("id_cliente", -1)]
+    )
+    if result and 'id_cliente' in result:
+        return result['id_cliente'] + 1
+    return 206
+
+
+async def create_client(client_data):
+    collection = get_async_mongo_collection()
+
+    if 'id_cliente' not in client_data:
+        client_data['id_cliente'] = await get_next_client_id()
+
+    required_fields = ['id_cliente', 'nombre', 'apellido', 'dni', 'email']
+    for field in required_fields:
+        if field not in client_data or not client_data[field]:
+            return {"error": f"Missing required field: {field}"}
+
+    if await collection.find_one({"id_cliente": client_data['id_cliente']}):
+        return {"error": f"Client with id_cliente {client_data['id_cliente']} already exists"}
+
+    client_data.setdefault('activo', True)
+    client_data['polizas'] = []
+    client_data['vehiculos'] = []
+
+    try:
+        await collection.insert_one(client_data)
+        await invalidate_tags("clientes")
+        return {
+            "success": True,
+            "id_cliente": client_data['id_cliente'],
+            "message": "Client created successfully"
+        }
+    except Exception as e:
+        return {"error": f"Error creating client: {str(e)}"}
+
+
+async def read_client(id_cliente=None, dni=None, use_cache=True):
+    query, identifier = query13.client_query(id_cliente, dni)
+    if query is None:
+        return {"error": "Must provide either id_cliente or dni"}
+
+    field, value = next(iter(query.items()))
+    cache_key = f"query13:client:{field}:{value}"
+    cache = AsyncRedisCache()
+    if use_cache:
+        cached_client = await cache.get(cache_key)
+        if cached_client is not None:
+            return cached_client
+
+    client = await get_async_mongo_collection().find_one(query, {"_id": 0})
+    if not client:
+        return {"error": f"Cliente con {identifier} no encontrado"}
+
+    if use_cache:
+        await cache.set(cache_key, client, ttl=query13.CLIENT_CACHE_TTL, tags=query13.client_tags(client))
+    return client
+
+
+async def update_client(update_data, id_cliente=None, dni=None):
+    collection = get_async_mongo_collection()
+
+    query, identifier = query13.client_query(id_cliente, dni)
+    if query is None:
+        return {"error": "Must provide either id_cliente or dni"}
+
+    existing = await collection.find_one(query)
+    if not existing:
+        return {"error": f"Client with {identifier} not found"}
+    id_cliente = existing['id_cliente']
+
+    update_data = query13.clean_update_data(update_data)
+    if not update_data:
+        return {"message": "No changes were made"}
+
+    try:
+        result = await collection.update_one({"id_cliente": id_cliente}, {"$set": update_data})
+        if result.modified_count == 0:
+            return {"message": "No changes were made"}
+
+        await rename_client_member_async(existing, {**existing, **update_data})
+        await invalidate_tags("clientes", cliente_tag(id_cliente))
+        return {
+            "success": True,
+            "id_cliente": id_cliente,
+            "modified_fields": list(update_data.keys()),
+            "message": "Client updated successfully"
+        }
+    except Exception as e:
+        return {"error": f"Error updating client: {str(e)}"}
+
+
+async def delete_client(soft_delete=True, id_cliente=None, dni=None):
+    collection = get_async_mongo_collection()
+
+    query, identifier = query13.client_query(id_cliente, dni)
+    if query is None:
+        return {"error": "Must provide either id_cliente or dni"}
+
+    existing = await collection.find_one(query)
+    if not existing:
+        return {"error": f"Client with {identifier} not found"}
+    id_cliente = existing['id_cliente']
+
+    try:
+        if soft_delete:
+            await collection.update_one({"id_cliente": id_cliente}, {"$set": {"activo": False}})
+            await invalidate_tags("clientes", cliente_tag(id_cliente))
+            return {
+                "success": True,
+                "id_cliente": id_cliente,
+                "message": "Client marked as inactive (soft delete)"
+            }
+
+        await collection.delete_one({"id_cliente": id_cliente})
+        await remove_client_async(existing)
+        await invalidate_namespaces(ALL_NAMESPACES)
+        return {
+            "success": True,
+            "id_cliente": id_cliente,
+            "message": "Client permanently deleted"
+        }
+    except Exception as e:
+        return {"error": f"Error deleting client: {str(e)}"}
+
+
+async def list_clients(filter_active=None, limit=10):
+    query = {"id_cliente": {"$exists": True}}
+    if filter_active is not None:
+        query["activo"] = filter_active
+    return await get_async_mongo_collection().find(query, {"_id": 0}).limit(limit).to_list()
+
+
+# ---------------------------------------------------------------------------
+# Claims (query14)
+# ---------------------------------------------------------------------------
+
+async def patch_cached_results(patches):
+    cache = AsyncRedisCache()
+    for key, update in patches.items():
+        await cache.patch(key, update)
+
+
+async def get_next_siniestro_id():
+    result = await aggregate(query14.MAX_CLAIM_ID_PIPELINE)
+    if result and result[0]['max_id'] is not None:
+        return result[0]['max_id'] + 1
+    return 9095
+
+
+async def create_claim(claim_data):
+    collection = get_async_mongo_collection()
+
+    if 'id_siniestro' not in claim_data:
+        claim_data['id_siniestro'] = await get_next_siniestro_id()
+
+    error = query14.validate_claim(claim_data)
+    if error:
+        return error
+
+    nro_poliza = claim_data['nro_poliza']
+    client, existing_claim = await asyncio.gather(
+        collection.find_one(
+            {"polizas.nro_poliza": nro_poliza},
+            {"nombre": 1, "apellido": 1, "polizas.nro_poliza": 1, "polizas.id_agente": 1}
+        ),
+        collection.find_one({
+            "polizas.nro_poliza": nro_poliza,
+            "polizas.siniestros.id_siniestro": claim_data['id_siniestro']
+        }, {"_id": 1}),
+    )
+    if not client:
+        return {"error": f"Policy {nro_poliza} not found"}
+    if existing_claim:
+        return {"error": f"Claim with id_siniestro {claim_data['id_siniestro']} already exists for policy {nro_poliza}"}
+
+    try:
+        result = await collection.update_one(
+            {"polizas.nro_poliza": nro_poliza},
+            {"$push": {"polizas.$.siniestros": query14.claim_record(claim_data)}}
+        )
+        if result.modified_count == 0:
+            return {"error": "Failed to create claim"}
+
+        await mark_patched_async(nro_poliza, claim_data['id_siniestro'], query14.claim_record(claim_data))
+        await patch_cached_results(query14.claim_created_patches(client, claim_data))
+        await invalidate_tags(poliza_tag(nro_poliza))
+        return {
+            "success": True,
+            "id_siniestro": claim_data['id_siniestro'],
+            "nro_poliza": nro_poliza,
+            "message": "Claim created successfully"
+        }
+    except Exception as e:
+        return {"error": f"Error creating claim: {str(e)}"}
+
+
+async def update_claim_status(nro_poliza, id_siniestro, nuevo_estado, monto_final=None, fecha_resolucion=None):
+    update_op, error = query14.claim_status_update(nuevo_estado, monto_final, fecha_resolucion)
+    if error:
+        return error
+
+    try:
+        result = await get_async_mongo_collection().update_one(
+            {"polizas.nro_poliza": nro_poliza},
+            {"$set": update_op},
+            array_filters=[
+                {"poliza.nro_poliza": nro_poliza},
+                {"siniestro.id_siniestro": id_siniestro}
+            ]
+        )
+        if result.modified_count == 0:
+            return {"error": "Claim not found or no changes were made"}
+
+        await mark_patched_async(nro_poliza, id_siniestro, query14.claim_status_fields(update_op))
+        await patch_cached_results(query14.claim_status_patches(nro_poliza, id_siniestro, update_op))
+        await invalidate_tags(poliza_tag(nro_poliza))
+        return {
+            "success": True,
+            "id_siniestro": id_siniestro,
+            "nuevo_estado": nuevo_estado,
+            "message": "Claim status updated successfully"
+        }
+    except Exception as e:
+        return {"error": f"Error updating claim: {str(e)}"}
+
+
+async def get_claims_by_policy(nro_poliza, use_cache=True):
+    cache_key = f"query14:claims:{nro_poliza}"
+    cache = AsyncRedisCache()
+    if use_cache:
+        cached_claims = await cache.get(cache_key)
+        if cached_claims is not None:
+            return cached_claims
+
+    client = await get_async_mongo_collection().find_one(
+        {"polizas.nro_poliza": nro_poliza},
+        {"polizas.$": 1, "id_cliente": 1, "nombre": 1, "apellido": 1}
+    )
+    if not client or not client.get('polizas'):
+        return {"error": f"Policy {nro_poliza} not found"}
+
+    result = {
+        "nro_poliza": nro_poliza,
+        "cliente": f"{client.get('nombre')} {client.get('apellido')}",
+        "siniestros": client['polizas'][0].get('siniestros', [])
+    }
+    if use_cache:
+        await cache.set(cache_key, result, ttl=query14.CLAIMS_CACHE_TTL,
+                        tags=[poliza_tag(nro_poliza), cliente_tag(client['id_cliente'])])
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Policies (query15)
+# ---------------------------------------------------------------------------
+
+async def get_next_policy_number():
+    result = await aggregate(query15.LAST_POLICY_NUMBER_PIPELINE)
+    if result:
+        return f"POL{result[0]['policy_number'] + 1}"
+    return "POL1161"
+
+
+async def issue_new_policy(policy_data):
+    collection = get_async_mongo_collection()
+
+    for field in query15.REQUIRED_POLICY_FIELDS:
+        if field not in policy_data:
+            return {"error": f"Missing required field: {field}"}
+
+    dni_cliente = policy_data['dni_cliente']
+    matricula_agente = policy_data['matricula_agente']
+
+    if not policy_data.get('nro_poliza'):
+        policy_data['nro_poliza'] = await get_next_policy_number()
+    nro_poliza = policy_data['nro_poliza']
+
+    # The lookups are independent, so they run concurrently
+    client, agent, any_agent, existing_policy = await asyncio.gather(
+        collection.find_one({"dni": dni_cliente, "nombre": {"$exists": True}}),
+        collection.find_one(
+            {"polizas": {"$elemMatch": {"agente.matricula": matricula_agente, "agente.activo": True}}},
+            {"polizas.$": 1}
+        ),
+        collection.find_one({"polizas.agente.matricula": matricula_agente}, {"_id": 1}),
+        collection.find_one({"polizas.nro_poliza": nro_poliza}, {"_id": 1}),
+    )
+
+    if not client:
+        return {"error": f"Client with DNI {dni_cliente} not found"}
+    if not client.get('activo', False):
+        return {"error": f"Client with DNI {dni_cliente} is not active. Cannot issue policy."}
+    if not agent:
+        if not any_agent:
+            return {"error": f"Agent with matricula {matricula_agente} not found"}
+        return {"error": f"Agent with matricula {matricula_agente} is not active. Cannot issue policy."}
+    if existing_policy:
+        return {"error": f"Policy number {nro_poliza} already exists"}
+
+    error = query15.validate_policy_fields(policy_data)
+    if error:
+        return error
+
+    agent_policy = agent['polizas'][0]
+    id_agente = agent_policy['id_agente']
+    policy_record = query15.build_policy_record(policy_data, nro_poliza, id_agente, agent_policy.get('agente', {}))
+
+    try:
+        result = await collection.update_one(
+            {"id_cliente": client['id_cliente']},
+            {"$push": {"polizas": policy_record}}
+        )
+        if result.modified_count == 0:
+            return {"error": "Failed to issue policy"}
+
+        await adjust_client_coverage_async(client, policy_coverage(policy_record))
+        await invalidate_tags("polizas", cliente_tag(client['id_cliente']))
+        return {
+            "success": True,
+            "nro_poliza": nro_poliza,
+            "dni_cliente": dni_cliente,
+            "id_cliente": client['id_cliente'],
+            "matricula_agente": matricula_agente,
+            "id_agente": id_agente,
+            "message": "Policy issued successfully"
+        }
+    except Exception as e:
+        return {"error": f"Error issuing policy: {str(e)}"}
+
+
+async def cancel_policy(nro_poliza):
+    collection = get_async_mongo_collection()
+
+    before = await collection.find_one_and_update(
+        {"polizas": {"$elemMatch": {"nro_poliza": nro_poliza, "estado": {"$ne": CANCELLED_STATE}}}},
+        {"$set": {"polizas.$.estado": CANCELLED_STATE}},
+        projection={"id_cliente": 1, "nombre": 1, "apellido": 1, "polizas.$": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not before:
+        if await collection.find_one({"polizas.nro_poliza": nro_poliza}, {"_id": 1}):
+            return {"error": f"Policy {nro_poliza} is already cancelled"}
+        return {"error": f"Policy {nro_poliza} not found"}
+
+    await adjust_client_coverage_async(before, -policy_coverage(before['polizas'][0]))
+    await invalidate_tags("polizas", poliza_tag(nro_poliza))
+    return {
+        "success": True,
+        "nro_poliza": nro_poliza,
+        "id_cliente": before['id_cliente'],
+        "message": "Policy cancelled successfully"
+    }
+
+
+async def update_policy_coverage(nro_poliza, cobertura_total):
+    try:
+        cobertura_total = float(cobertura_total)
+    except (TypeError, ValueError):
+        return {"error": "Cobertura total must be a valid number"}
+    if cobertura_total <= 0:
+        return {"error": "Cobertura total must be greater than 0"}
+
+    before = await get_async_mongo_collection().find_one_and_update(
+        {"polizas.nro_poliza": nro_poliza},
+        {"$set": {"polizas.$.cobertura_total": cobertura_total}},
+        projection={"id_cliente": 1, "nombre": 1, "apellido": 1, "polizas.$": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not before:
+        return {"error": f"Policy {nro_poliza} not found"}
+
+    old_policy = before['polizas'][0]
+    new_policy = {**old_policy, "cobertura_total": cobertura_total}
+    await adjust_client_coverage_async(before, policy_coverage(new_policy) - policy_coverage(old_policy))
+    await invalidate_tags("polizas:cobertura", poliza_tag(nro_poliza))
+    return {
+        "success": True,
+        "nro_poliza": nro_poliza,
+        "id_cliente": before['id_cliente'],
+        "cobertura_anterior": old_policy.get('cobertura_total'),
+        "cobertura_total": cobertura_total,
+        "message": "Policy coverage updated successfully"
+    }
+
+
+async def get_available_agents():
+    return await aggregate(query15.AVAILABLE_AGENTS_PIPELINE)
+
+
+async def run_concurrent_lookups(concurrency, max_id):
+    """
+    Issue `concurrency` read_client lookups at once on one event loop
+
+    Returns:
+        (found, elapsed_seconds)
+    """
+    ids = [random.randint(1, max_id) for _ in range(concurrency)]
+    start = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(read_client(id_cliente=i) for i in ids))
+    finally:
+        await close_async_connections()
+    elapsed = time.perf_counter() - start
+    return sum(1 for r in results if "error" not in r), elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many concurrent client lookups on a single event loop")
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--max-id", type=int, default=205, help="Highest id_cliente to look up")
+    args = parser.parse_args()
+
+    found, elapsed = asyncio.run(run_concurrent_lookups(args.concurrency, args.max_id))
+    print(f"{args.concurrency} consultas concurrentes en {elapsed:.2f}s "
+          f"({args.concurrency / elapsed:.0f} consultas/s), {found} clientes encontrados")
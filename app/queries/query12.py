@@ -3,59 +3,55 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_mongo_collection
-from app.cache import RedisCache
+from app.cache import cached_query
+
+CACHE_KEY = "query12:agents_claims_count"
+CACHE_TTL = 300
+CACHE_TAGS = ["polizas", "siniestros"]
+AGENTS_CLAIMS_PIPELINE = [
+    { "$unwind": "$polizas" },
+    { "$match": {
+        "polizas.id_agente": {"$exists": True, "$gt": 0}
+    }}, 
+    { "$group": {
+        "_id": "$polizas.id_agente",
+        "nombre": {"$first": "$polizas.agente.nombre"},
+        "apellido": {"$first": "$polizas.agente.apellido"},
+        "siniestros_asociados": {"$sum": {"$size": {"$ifNull": ["$polizas.siniestros", []]}}}
+    }}
+]
+
+
+@cached_query(CACHE_KEY, ttl=CACHE_TTL, tags=CACHE_TAGS)
+def fetch_agents_claims():
+    return list(get_mongo_collection().aggregate(AGENTS_CLAIMS_PIPELINE))
+
 
 def get_agents_with_claims_count(use_cache=True):
     """
     Get agents with claims count using Redis cache
     """
-    cache_key = "query12:agents_claims_count"
-    cache = RedisCache()
-    
-    # Try cache first
-    if use_cache:
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            print(f"✓ Cache HIT - Se recuperaron {len(cached_result)} agentes desde Redis")
-            print(f"  (TTL: {cache.get_ttl(cache_key)} segundos restantes)\n")
-            
-            print("Agentes y cantidad de siniestros asociados:")
-            for a in cached_result:
-                print(
-                    f"Agente {int(a['_id'])} - {a['nombre']} {a['apellido']}: "
-                    f"{a['siniestros_asociados']} siniestros"
-                )
-            
-            return cached_result
-    
-    # Cache miss - query MongoDB
-    print("✗ Cache MISS - Consultando MongoDB...")
-    collection = get_mongo_collection()
-
-    clients = collection.find({
-        "id_cliente": {"$exists": True},
-        "polizas": {"$exists": True}
-    })
+    # Stale results are served while they refresh in the background
+    result, hit, ttl = fetch_agents_claims.lookup_with_ttl(use_cache=use_cache)
 
-    agents = collection.aggregate([
-        { "$unwind": "$polizas" },
-        { "$match": {
-            "polizas.id_agente": {"$exists": True, "$gt": 0}
-        }}, 
-        { "$group": {
-            "_id": "$polizas.id_agente",
-            "nombre": {"$first": "$polizas.agente.nombre"},
-            "apellido": {"$first": "$polizas.agente.apellido"},
-            "siniestros_asociados": {"$sum": {"$size": {"$ifNull": ["$polizas.siniestros", []]}}}
-        }}
-    ])
-
-    result = [agent for agent in agents]
+    if hit:
+        print(f"✓ Cache HIT - Se recuperaron {len(result)} agentes desde Redis")
+        print(f"  (TTL: {ttl} segundos restantes)\n")
+        
+        print("Agentes y cantidad de siniestros asociados:")
+        for a in result:
+            print(
+                f"Agente {int(a['_id'])} - {a['nombre']} {a['apellido']}: "
+                f"{a['siniestros_asociados']} siniestros"
+            )
+        
+        return result
     
-    # Store in cache (5 minutes)
+    # Cache miss - the result was computed from MongoDB
+    print("✗ Cache MISS - Consultando MongoDB...")
+    # Stored in cache (5 minutes)
     if use_cache:
-        cache.set(cache_key, result, ttl=300)
-        print(f"✓ Almacenados {len(result)} agentes en caché (TTL: 300 segundos)\n")
+        print(f"✓ Almacenados {len(result)} agentes en caché (TTL: {CACHE_TTL} segundos)\n")
 
     print("Agentes y cantidad de siniestros asociados:")
     for a in result:
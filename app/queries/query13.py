@@ -3,7 +3,49 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_mongo_collection
-from app.cache import invalidate_cache_pattern
+from app.cache import RedisCache, invalidate_tags, invalidate_namespaces, cliente_tag, poliza_tag, ALL_NAMESPACES
+from app.leaderboard import rename_client_member, remove_client
+
+CLIENT_CACHE_TTL = 300
+
+
+def client_query(id_cliente=None, dni=None):
+    """
+    Build the lookup filter for a client identified by DNI or id_cliente
+    
+    Returns:
+        (query, identifier) tuple, or (None, None) if neither was given
+    """
+    if dni is not None:
+        return {"dni": dni}, f"DNI {dni}"
+    if id_cliente is not None:
+        return {"id_cliente": id_cliente}, f"id_cliente {id_cliente}"
+    return None, None
+
+
+def client_tags(client):
+    """
+    Tags of a cached client document
+    
+    The document embeds its policies and claims, so it depends on them too.
+    """
+    return [cliente_tag(client['id_cliente'])] + [
+        poliza_tag(poliza['nro_poliza']) for poliza in client.get('polizas', [])
+    ]
+
+
+def clean_update_data(update_data):
+    """
+    Drop the fields update_client must not change and the empty values
+    
+    Returns:
+        Dictionary with the fields to $set
+    """
+    # id_cliente is immutable; polizas and vehiculos have their own services
+    return {
+        k: v for k, v in update_data.items()
+        if k not in ('id_cliente', 'polizas', 'vehiculos') and v != ''
+    }
 
 
 def get_next_client_id():
@@ -73,9 +115,8 @@ def create_client(client_data):
         result = collection.insert_one(client_data)
         print(f"✓ Cliente creado exitosamente con ID: {client_data['id_cliente']}")
         
-        # Invalidate related caches
-        invalidate_cache_pattern("query1:*")  # Active clients
-        invalidate_cache_pattern("query4:*")  # Clients without policies
+        # Invalidate the caches built from clients
+        invalidate_tags("clientes")
         print("✓ Caché invalidado")
         
         return {
@@ -87,33 +128,40 @@ def create_client(client_data):
         return {"error": f"Error creating client: {str(e)}"}
 
 
-def read_client(id_cliente=None, dni=None):
+def read_client(id_cliente=None, dni=None, use_cache=True):
     """
     Read/retrieve a client by ID or DNI
     
     Args:
         id_cliente: Client ID to search for (optional)
         dni: Client DNI to search for (optional)
+        use_cache: Serve and store the document in Redis (tagged with the
+                   client and its policies)
     
     Returns:
         Client document or error message
     """
-    collection = get_mongo_collection()
-    
-    if dni is not None:
-        query = {"dni": dni}
-        identifier = f"DNI {dni}"
-    elif id_cliente is not None:
-        query = {"id_cliente": id_cliente}
-        identifier = f"id_cliente {id_cliente}"
-    else:
+    query, identifier = client_query(id_cliente, dni)
+    if query is None:
         return {"error": "Must provide either id_cliente or dni"}
     
+    field, value = next(iter(query.items()))
+    cache_key = f"query13:client:{field}:{value}"
+    cache = RedisCache()
+    if use_cache:
+        cached_client = cache.get(cache_key)
+        if cached_client is not None:
+            return cached_client
+    
+    collection = get_mongo_collection()
     client = collection.find_one(query, {"_id": 0})
     
     if not client:
         return {"error": f"Cliente con {identifier} no encontrado"}
     
+    if use_cache:
+        cache.set(cache_key, client, ttl=CLIENT_CACHE_TTL, tags=client_tags(client))
+    
     return client
 
 
@@ -131,14 +179,8 @@ def update_client(update_data, id_cliente=None, dni=None):
     """
     collection = get_mongo_collection()
     
-    # Build query based on identifier
-    if dni is not None:
-        query = {"dni": dni}
-        identifier = f"DNI {dni}"
-    elif id_cliente is not None:
-        query = {"id_cliente": id_cliente}
-        identifier = f"id_cliente {id_cliente}"
-    else:
+    query, identifier = client_query(id_cliente, dni)
+    if query is None:
         return {"error": "Must provide either id_cliente or dni"}
     
     # Check if client exists
@@ -148,18 +190,8 @@ def update_client(update_data, id_cliente=None, dni=None):
     
     id_cliente = existing['id_cliente']
     
-    # Don't allow updating id_cliente
-    if 'id_cliente' in update_data:
-        del update_data['id_cliente']
-    
-    # Don't allow updating polizas or vehiculos through this method
-    if 'polizas' in update_data:
-        del update_data['polizas']
-    if 'vehiculos' in update_data:
-        del update_data['vehiculos']
-    
-    # Remove empty strings from update_data (keep existing values)
-    update_data = {k: v for k, v in update_data.items() if v != ''}
+    # Remove immutable fields and empty strings (keep existing values)
+    update_data = clean_update_data(update_data)
     
     if not update_data:
         return {"message": "No changes were made"}
@@ -173,9 +205,11 @@ def update_client(update_data, id_cliente=None, dni=None):
         if result.modified_count > 0:
             print(f"✓ Cliente {id_cliente} actualizado exitosamente")
             
-            # Invalidate related caches
-            invalidate_cache_pattern("query1:*")
-            invalidate_cache_pattern("query4:*")
+            # The coverage ranking member includes the client's name
+            rename_client_member(existing, {**existing, **update_data})
+            
+            # Invalidate the caches built from clients and this client's document
+            invalidate_tags("clientes", cliente_tag(id_cliente))
             print("✓ Caché invalidado")
             
             return {
@@ -204,14 +238,8 @@ def delete_client(soft_delete=True, id_cliente=None, dni=None):
     """
     collection = get_mongo_collection()
     
-    # Build query based on identifier
-    if dni is not None:
-        query = {"dni": dni}
-        identifier = f"DNI {dni}"
-    elif id_cliente is not None:
-        query = {"id_cliente": id_cliente}
-        identifier = f"id_cliente {id_cliente}"
-    else:
+    query, identifier = client_query(id_cliente, dni)
+    if query is None:
         return {"error": "Must provide either id_cliente or dni"}
     
     # Check if client exists
@@ -231,8 +259,7 @@ def delete_client(soft_delete=True, id_cliente=None, dni=None):
             print(f"✓ Cliente {id_cliente} marcado como inactivo")
             
             # Invalidate caches
-            invalidate_cache_pattern("query1:*")
-            invalidate_cache_pattern("query4:*")
+            invalidate_tags("clientes", cliente_tag(id_cliente))
             print("✓ Caché invalidado")
             
             return {
@@ -245,8 +272,11 @@ def delete_client(soft_delete=True, id_cliente=None, dni=None):
             result = collection.delete_one({"id_cliente": id_cliente})
             print(f"✓ Cliente {id_cliente} eliminado permanentemente")
             
-            # Invalidate caches
-            invalidate_cache_pattern("query*")  # Invalidate all query caches
+            remove_client(existing)
+            
+            # The client takes its policies, claims and vehicles with it, so
+            # every cached result is dropped with one generation bump
+            invalidate_namespaces(ALL_NAMESPACES)
             print("✓ Caché invalidado")
             
             return {
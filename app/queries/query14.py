@@ -3,9 +3,221 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_mongo_collection
-from app.cache import invalidate_cache_pattern
+from app.cache import RedisCache, invalidate_tags, cliente_tag, poliza_tag
+from app.change_stream import mark_patched
+from app.queries import query1, query2, query8, query12
 from datetime import datetime
 
+VALID_CLAIM_TYPES = ['Accidente', 'Robo', 'Incendio', 'Danio', 'Granizo', 'Otro']
+VALID_CLAIM_STATES = ['Abierto', 'En Proceso', 'Cerrado', 'Rechazado']
+CLAIMS_CACHE_TTL = 120
+
+# Maximum id_siniestro across all policies
+MAX_CLAIM_ID_PIPELINE = [
+    {"$match": {"polizas": {"$exists": True}}},
+    {"$unwind": "$polizas"},
+    {"$unwind": {"path": "$polizas.siniestros", "preserveNullAndEmptyArrays": False}},
+    {"$group": {
+        "_id": None,
+        "max_id": {"$max": "$polizas.siniestros.id_siniestro"}
+    }}
+]
+
+
+def validate_claim(claim_data):
+    """
+    Validate the fields of a new claim and parse its fecha in place
+    
+    Returns:
+        Error dictionary, or None if the claim is valid
+    """
+    required_fields = ['nro_poliza', 'id_siniestro', 'tipo', 'fecha', 'monto_estimado', 'estado']
+    for field in required_fields:
+        if field not in claim_data:
+            return {"error": f"Missing required field: {field}"}
+    
+    if claim_data['tipo'] not in VALID_CLAIM_TYPES:
+        return {"error": f"Invalid claim type. Must be one of: {', '.join(VALID_CLAIM_TYPES)}"}
+    
+    if claim_data['estado'] not in VALID_CLAIM_STATES:
+        return {"error": f"Invalid estado. Must be one of: {', '.join(VALID_CLAIM_STATES)}"}
+    
+    try:
+        claim_data['fecha'] = datetime.strptime(claim_data['fecha'], "%d/%m/%Y")
+    except ValueError:
+        return {"error": "Invalid date format. Use DD/MM/YYYY"}
+    
+    return None
+
+
+def claim_record(claim_data):
+    """Claim as stored in the policy's siniestros array"""
+    # nro_poliza is only used to find the policy
+    record = {k: v for k, v in claim_data.items() if k != 'nro_poliza'}
+    record.setdefault('descripcion', '')
+    return record
+
+
+def claim_status_update(nuevo_estado, monto_final=None, fecha_resolucion=None):
+    """
+    Build the $set of update_claim_status (used with the poliza/siniestro arrayFilters)
+    
+    Returns:
+        (update_op, error) tuple; update_op is None when the input is invalid
+    """
+    if nuevo_estado not in VALID_CLAIM_STATES:
+        return None, {"error": f"Invalid estado. Must be one of: {', '.join(VALID_CLAIM_STATES)}"}
+    
+    update_op = {
+        "polizas.$[poliza].siniestros.$[siniestro].estado": nuevo_estado
+    }
+    
+    if monto_final is not None:
+        update_op["polizas.$[poliza].siniestros.$[siniestro].monto_final"] = monto_final
+    
+    if fecha_resolucion is not None:
+        try:
+            fecha_resolucion = datetime.strptime(fecha_resolucion, "%d/%m/%Y")
+        except ValueError:
+            return None, {"error": "Invalid date format. Use DD/MM/YYYY"}
+        update_op["polizas.$[poliza].siniestros.$[siniestro].fecha_resolucion"] = fecha_resolucion
+    
+    return update_op, None
+
+
+def claim_status_fields(update_op):
+    """Claim fields set by a claim_status_update() operation, with their values"""
+    return {path.rsplit('.', 1)[1]: value for path, value in update_op.items()}
+
+
+def add_row(row, *fields):
+    """Cache patch adding row to a cached result, unless a row with the same fields is already there"""
+    def update(rows):
+        if any(all(r.get(field) == row[field] for field in fields) for r in rows):
+            return rows
+        return rows + [row]
+    return update
+
+
+def remove_open_claim(id_siniestro):
+    """Cache patch removing a claim from query2's open claims"""
+    def update(rows):
+        if sum(1 for r in rows if r.get('id_siniestro') == id_siniestro) > 1:
+            return None  # The same id in several policies: the row can't be told apart
+        return [r for r in rows if r.get('id_siniestro') != id_siniestro]
+    return update
+
+
+def keep_open_claim(id_siniestro):
+    """Cache patch for a claim set to Abierto: a claim not listed yet needs its client, so the entry is dropped"""
+    def update(rows):
+        return rows if any(r.get('id_siniestro') == id_siniestro for r in rows) else None
+    return update
+
+
+def add_agent_claims(id_agente, count):
+    """Cache patch adjusting an agent's counter in query12"""
+    def update(rows):
+        for r in rows:
+            if r.get('_id') == id_agente:
+                r['siniestros_asociados'] += count
+                return rows
+        return None
+    return update
+
+
+def add_embedded_claim(client_id, nro_poliza, record):
+    """Cache patch adding a claim to its policy in query1's client documents"""
+    def update(rows):
+        for row in rows:
+            if row.get('_id') != client_id:
+                continue
+            poliza = next((p for p in row.get('polizas') or [] if p.get('nro_poliza') == nro_poliza), None)
+            if poliza is None:
+                return None
+            siniestros = poliza.setdefault('siniestros', [])
+            if not any(s.get('id_siniestro') == record['id_siniestro'] for s in siniestros):
+                siniestros.append(dict(record))
+            return rows
+        # Inactive clients are not listed
+        return rows
+    return update
+
+
+def set_embedded_claim(nro_poliza, id_siniestro, fields):
+    """Cache patch setting fields of a claim in query1's client documents"""
+    def update(rows):
+        polizas = [p for row in rows for p in row.get('polizas') or [] if p.get('nro_poliza') == nro_poliza]
+        if len(polizas) > 1:
+            return None  # The same policy number in several documents: can't tell which one was updated
+        if not polizas:
+            return rows
+        claim = next((s for s in polizas[0].get('siniestros') or [] if s.get('id_siniestro') == id_siniestro), None)
+        if claim is None:
+            return None
+        claim.update(fields)
+        return rows
+    return update
+
+
+def claim_created_patches(client, claim):
+    """
+    Write-through patches for a new claim of client, instead of recomputing
+    the cached results that embed, list or count claims (query1, query2,
+    query8 and query12, the ones tagged "siniestros")
+    
+    Returns:
+        Dict of cache key -> update function (see RedisCache.patch)
+    """
+    patches = {
+        query1.CACHE_KEY: add_embedded_claim(client['_id'], claim['nro_poliza'], claim_record(claim)),
+    }
+    if claim['estado'] == 'Abierto':
+        patches[query2.CACHE_KEY] = add_row({
+            "_id": client['_id'],
+            "id_siniestro": claim['id_siniestro'],
+            "tipo": claim['tipo'],
+            "monto_estimado": claim['monto_estimado'],
+            "cliente": f"{client.get('nombre')} {client.get('apellido')}",
+        }, "_id", "id_siniestro")
+    
+    now = datetime.now()
+    if claim['tipo'] == 'Accidente' and now.replace(year=now.year - 1) < claim['fecha'] <= now:
+        patches[query8.CACHE_KEY] = add_row({
+            "_id": claim['id_siniestro'],
+            "nombre": client.get('nombre'),
+            "apellido": client.get('apellido'),
+            "fecha": claim['fecha'],
+        }, "_id")
+    
+    policy = next(p for p in client['polizas'] if p.get('nro_poliza') == claim['nro_poliza'])
+    id_agente = policy.get('id_agente')
+    if id_agente is not None and id_agente > 0:
+        patches[query12.CACHE_KEY] = add_agent_claims(id_agente, 1)
+    return patches
+
+
+def claim_status_patches(nro_poliza, id_siniestro, update_op):
+    """
+    Write-through patches for a claim_status_update() operation: query1 embeds
+    the claim and query2 lists it while it is open
+    """
+    fields = claim_status_fields(update_op)
+    if fields['estado'] == 'Abierto':
+        open_claims = keep_open_claim(id_siniestro)
+    else:
+        open_claims = remove_open_claim(id_siniestro)
+    return {
+        query1.CACHE_KEY: set_embedded_claim(nro_poliza, id_siniestro, fields),
+        query2.CACHE_KEY: open_claims,
+    }
+
+
+def patch_cached_results(patches):
+    cache = RedisCache()
+    for key, update in patches.items():
+        cache.patch(key, update)
+
 
 def get_next_siniestro_id():
     """
@@ -17,18 +229,7 @@ def get_next_siniestro_id():
     """
     collection = get_mongo_collection()
     
-    # Find all siniestros across all policies and get the maximum id_siniestro
-    pipeline = [
-        {"$match": {"polizas": {"$exists": True}}},
-        {"$unwind": "$polizas"},
-        {"$unwind": {"path": "$polizas.siniestros", "preserveNullAndEmptyArrays": False}},
-        {"$group": {
-            "_id": None,
-            "max_id": {"$max": "$polizas.siniestros.id_siniestro"}
-        }}
-    ]
-    
-    result = list(collection.aggregate(pipeline))
+    result = list(collection.aggregate(MAX_CLAIM_ID_PIPELINE))
     
     if result and result[0]['max_id'] is not None:
         next_id = result[0]['max_id'] + 1
@@ -58,11 +259,10 @@ def create_claim(claim_data):
     if 'id_siniestro' not in claim_data:
         claim_data['id_siniestro'] = get_next_siniestro_id()
     
-    # Validate required fields
-    required_fields = ['nro_poliza', 'id_siniestro', 'tipo', 'fecha', 'monto_estimado', 'estado']
-    for field in required_fields:
-        if field not in claim_data:
-            return {"error": f"Missing required field: {field}"}
+    # Validate required fields, tipo, estado and date format
+    error = validate_claim(claim_data)
+    if error:
+        return error
     
     nro_poliza = claim_data['nro_poliza']
     
@@ -83,44 +283,23 @@ def create_claim(claim_data):
     if existing_claim:
         return {"error": f"Claim with id_siniestro {claim_data['id_siniestro']} already exists for policy {nro_poliza}"}
     
-    # Validate claim type
-    valid_types = ['Accidente', 'Robo', 'Incendio', 'Danio', 'Granizo', 'Otro']
-    if claim_data['tipo'] not in valid_types:
-        return {"error": f"Invalid claim type. Must be one of: {', '.join(valid_types)}"}
-    
-    # Validate estado
-    valid_estados = ['Abierto', 'En Proceso', 'Cerrado', 'Rechazado']
-    if claim_data['estado'] not in valid_estados:
-        return {"error": f"Invalid estado. Must be one of: {', '.join(valid_estados)}"}
-    
-    # Validate date format
-    try:
-        claim_data['fecha'] = datetime.strptime(claim_data['fecha'], "%d/%m/%Y")
-    except ValueError:
-        return {"error": "Invalid date format. Use DD/MM/YYYY"}
-    
-    # Prepare claim data (remove nro_poliza as it's only for query)
-    claim_record = {k: v for k, v in claim_data.items() if k != 'nro_poliza'}
-    
-    # Add default values
-    if 'descripcion' not in claim_record:
-        claim_record['descripcion'] = ''
-    
     try:
         # Add claim to the policy's siniestros array
         result = collection.update_one(
             {"polizas.nro_poliza": nro_poliza},
-            {"$push": {"polizas.$.siniestros": claim_record}}
+            {"$push": {"polizas.$.siniestros": claim_record(claim_data)}}
         )
         
         if result.modified_count > 0:
             print(f"✓ Siniestro {claim_data['id_siniestro']} creado exitosamente para póliza {nro_poliza}")
             
-            # Invalidate claims-related caches
-            invalidate_cache_pattern("query2:*")  # Open claims
-            invalidate_cache_pattern("query8:*")  # Accident claims
-            invalidate_cache_pattern("query12:*")  # Agents with claims
-            print("✓ Caché invalidado")
+            # Patch the cached claim lists and counters (query1, query2,
+            # query8, query12) and invalidate the cached documents that embed this policy.
+            # The mark keeps the change stream daemon from dropping the patched lists
+            mark_patched(nro_poliza, claim_data['id_siniestro'], claim_record(claim_data))
+            patch_cached_results(claim_created_patches(client, claim_data))
+            invalidate_tags(poliza_tag(nro_poliza))
+            print("✓ Caché actualizado")
             
             return {
                 "success": True,
@@ -150,25 +329,10 @@ def update_claim_status(nro_poliza, id_siniestro, nuevo_estado, monto_final=None
     """
     collection = get_mongo_collection()
     
-    valid_estados = ['Abierto', 'En Proceso', 'Cerrado', 'Rechazado']
-    if nuevo_estado not in valid_estados:
-        return {"error": f"Invalid estado. Must be one of: {', '.join(valid_estados)}"}
-    
     # Build update operation
-    update_op = {
-        "polizas.$[poliza].siniestros.$[siniestro].estado": nuevo_estado
-    }
-    
-    if monto_final is not None:
-        update_op["polizas.$[poliza].siniestros.$[siniestro].monto_final"] = monto_final
-    
-    if fecha_resolucion is not None:
-        # Validate date format
-        try:
-            fecha_resolucion = datetime.strptime(fecha_resolucion, "%d/%m/%Y")
-            update_op["polizas.$[poliza].siniestros.$[siniestro].fecha_resolucion"] = fecha_resolucion
-        except ValueError:
-            return {"error": "Invalid date format. Use DD/MM/YYYY"}
+    update_op, error = claim_status_update(nuevo_estado, monto_final, fecha_resolucion)
+    if error:
+        return error
     
     try:
         result = collection.update_one(
@@ -183,10 +347,12 @@ def update_claim_status(nro_poliza, id_siniestro, nuevo_estado, monto_final=None
         if result.modified_count > 0:
             print(f"✓ Siniestro {id_siniestro} actualizado exitosamente a estado: {nuevo_estado}")
             
-            # Invalidate claims-related caches
-            invalidate_cache_pattern("query2:*")
-            invalidate_cache_pattern("query8:*")
-            print("✓ Caché invalidado")
+            # Patch the active clients (query1) and open claims (query2) and
+            # invalidate the cached documents that embed this policy
+            mark_patched(nro_poliza, id_siniestro, claim_status_fields(update_op))
+            patch_cached_results(claim_status_patches(nro_poliza, id_siniestro, update_op))
+            invalidate_tags(poliza_tag(nro_poliza))
+            print("✓ Caché actualizado")
             
             return {
                 "success": True,
@@ -200,38 +366,48 @@ def update_claim_status(nro_poliza, id_siniestro, nuevo_estado, monto_final=None
         return {"error": f"Error updating claim: {str(e)}"}
 
 
-def get_claims_by_policy(nro_poliza):
+def get_claims_by_policy(nro_poliza, use_cache=True):
     """
     Get all claims for a specific policy
     
     Args:
         nro_poliza: Policy number
+        use_cache: Serve and store the result in Redis (tagged with the policy)
     
     Returns:
         List of claims or error
     """
-    collection = get_mongo_collection()
-    
-    client = collection.find_one(
-        {"polizas.nro_poliza": nro_poliza},
-        {"polizas.$": 1, "nombre": 1, "apellido": 1}
-    )
-    
-    if not client or 'polizas' not in client or len(client['polizas']) == 0:
-        return {"error": f"Policy {nro_poliza} not found"}
-    
-    poliza = client['polizas'][0]
-    siniestros = poliza.get('siniestros', [])
+    cache_key = f"query14:claims:{nro_poliza}"
+    cache = RedisCache()
+    result = cache.get(cache_key) if use_cache else None
     
+    if result is None:
+        collection = get_mongo_collection()
+        
+        client = collection.find_one(
+            {"polizas.nro_poliza": nro_poliza},
+            {"polizas.$": 1, "id_cliente": 1, "nombre": 1, "apellido": 1}
+        )
+        
+        if not client or 'polizas' not in client or len(client['polizas']) == 0:
+            return {"error": f"Policy {nro_poliza} not found"}
+        
+        result = {
+            "nro_poliza": nro_poliza,
+            "cliente": f"{client.get('nombre')} {client.get('apellido')}",
+            "siniestros": client['polizas'][0].get('siniestros', [])
+        }
+        if use_cache:
+            # The result also shows the client's name
+            cache.set(cache_key, result, ttl=CLAIMS_CACHE_TTL,
+                      tags=[poliza_tag(nro_poliza), cliente_tag(client['id_cliente'])])
+    
+    siniestros = result['siniestros']
     print(f"Se encontraron {len(siniestros)} siniestros para póliza {nro_poliza}:")
     for s in siniestros:
         print(f"  - Siniestro {s.get('id_siniestro')}: {s.get('tipo')} - ${s.get('monto_estimado')} - {s.get('estado')}")
     
-    return {
-        "nro_poliza": nro_poliza,
-        "cliente": f"{client.get('nombre')} {client.get('apellido')}",
-        "siniestros": siniestros
-    }
+    return result
 
 
 def interactive_abm():
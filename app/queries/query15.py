@@ -3,9 +3,99 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_mongo_collection
-from app.cache import invalidate_cache_pattern
+from app.cache import invalidate_tags, cliente_tag, poliza_tag
+from app.leaderboard import CANCELLED_STATE, adjust_client_coverage, policy_coverage
+from pymongo import ReturnDocument
 from datetime import datetime, timedelta
 
+VALID_POLICY_TYPES = ['Auto', 'Hogar', 'Vida', 'Salud', 'Comercio']
+VALID_POLICY_STATES = ['Activa', 'Suspendida', 'Vencida', 'Cancelada']
+REQUIRED_POLICY_FIELDS = ['dni_cliente', 'tipo', 'fecha_inicio', 'fecha_fin',
+                          'prima_mensual', 'cobertura_total', 'matricula_agente', 'estado']
+
+# Highest POLxxxx policy number
+LAST_POLICY_NUMBER_PIPELINE = [
+    {"$unwind": "$polizas"},
+    {"$match": {"polizas.nro_poliza": {"$regex": "^POL\\d+$"}}},
+    {"$project": {
+        "nro_poliza": "$polizas.nro_poliza",
+        "policy_number": {
+            "$toInt": {"$substr": ["$polizas.nro_poliza", 3, -1]}
+        }
+    }},
+    {"$sort": {"policy_number": -1}},
+    {"$limit": 1}
+]
+
+AVAILABLE_AGENTS_PIPELINE = [
+    {"$unwind": "$polizas"},
+    {"$match": {"polizas.agente.activo": True}},
+    {"$group": {
+        "_id": "$polizas.id_agente",
+        "matricula": {"$first": "$polizas.agente.matricula"},
+        "nombre": {"$first": "$polizas.agente.nombre"},
+        "apellido": {"$first": "$polizas.agente.apellido"},
+        "email": {"$first": "$polizas.agente.email"},
+        "telefono": {"$first": "$polizas.agente.telefono"},
+        "policy_count": {"$sum": 1}
+    }},
+    {"$sort": {"policy_count": 1}}  # Show agents with fewer policies first
+]
+
+
+def validate_policy_fields(policy_data):
+    """
+    Validate tipo, estado, dates and amounts of a new policy
+    
+    Dates are parsed and amounts converted to float in place.
+    
+    Returns:
+        Error dictionary, or None if the fields are valid
+    """
+    if policy_data['tipo'] not in VALID_POLICY_TYPES:
+        return {"error": f"Invalid policy type. Must be one of: {', '.join(VALID_POLICY_TYPES)}"}
+    
+    if policy_data['estado'] not in VALID_POLICY_STATES:
+        return {"error": f"Invalid estado. Must be one of: {', '.join(VALID_POLICY_STATES)}"}
+    
+    try:
+        policy_data['fecha_inicio'] = datetime.strptime(policy_data['fecha_inicio'], "%d/%m/%Y")
+        policy_data['fecha_fin'] = datetime.strptime(policy_data['fecha_fin'], "%d/%m/%Y")
+    except ValueError:
+        return {"error": "Invalid date format. Use DD/MM/YYYY"}
+    
+    if policy_data['fecha_fin'] <= policy_data['fecha_inicio']:
+        return {"error": "End date must be after start date"}
+    
+    try:
+        policy_data['prima_mensual'] = float(policy_data['prima_mensual'])
+        policy_data['cobertura_total'] = float(policy_data['cobertura_total'])
+    except (TypeError, ValueError):
+        return {"error": "Prima mensual and cobertura total must be valid numbers"}
+    
+    if policy_data['prima_mensual'] <= 0:
+        return {"error": "Prima mensual must be greater than 0"}
+    if policy_data['cobertura_total'] <= 0:
+        return {"error": "Cobertura total must be greater than 0"}
+    
+    return None
+
+
+def build_policy_record(policy_data, nro_poliza, id_agente, agente_data):
+    """Policy as stored in the client's polizas array"""
+    return {
+        "nro_poliza": nro_poliza,
+        "tipo": policy_data['tipo'],
+        "fecha_inicio": policy_data['fecha_inicio'],
+        "fecha_fin": policy_data['fecha_fin'],
+        "prima_mensual": policy_data['prima_mensual'],
+        "cobertura_total": policy_data['cobertura_total'],
+        "id_agente": id_agente,
+        "agente": agente_data,
+        "estado": policy_data['estado'],
+        "siniestros": []
+    }
+
 
 def get_next_policy_number():
     """
@@ -17,21 +107,8 @@ def get_next_policy_number():
     """
     collection = get_mongo_collection()
     
-    # Find all policy numbers that match the POLxxxx pattern
-    pipeline = [
-        {"$unwind": "$polizas"},
-        {"$match": {"polizas.nro_poliza": {"$regex": "^POL\\d+$"}}},
-        {"$project": {
-            "nro_poliza": "$polizas.nro_poliza",
-            "policy_number": {
-                "$toInt": {"$substr": ["$polizas.nro_poliza", 3, -1]}
-            }
-        }},
-        {"$sort": {"policy_number": -1}},
-        {"$limit": 1}
-    ]
-    
-    result = list(collection.aggregate(pipeline))
+    # Find the highest policy number that matches the POLxxxx pattern
+    result = list(collection.aggregate(LAST_POLICY_NUMBER_PIPELINE))
     
     if result:
         last_number = result[0]['policy_number']
@@ -58,9 +135,7 @@ def issue_new_policy(policy_data):
     """
     collection = get_mongo_collection()
     
-    required_fields = ['dni_cliente', 'tipo', 'fecha_inicio', 
-                      'fecha_fin', 'prima_mensual', 'cobertura_total', 'matricula_agente', 'estado']
-    for field in required_fields:
+    for field in REQUIRED_POLICY_FIELDS:
         if field not in policy_data:
             return {"error": f"Missing required field: {field}"}
     
@@ -117,37 +192,12 @@ def issue_new_policy(policy_data):
     if existing_policy:
         return {"error": f"Policy number {nro_poliza} already exists"}
     
-    # 4. Validate policy type
-    valid_types = ['Auto', 'Hogar', 'Vida', 'Salud', 'Comercio']
-    if policy_data['tipo'] not in valid_types:
-        return {"error": f"Invalid policy type. Must be one of: {', '.join(valid_types)}"}
-    
-    # 5. Validate estado
-    valid_estados = ['Activa', 'Suspendida', 'Vencida', 'Cancelada']
-    if policy_data['estado'] not in valid_estados:
-        return {"error": f"Invalid estado. Must be one of: {', '.join(valid_estados)}"}
-    
-    # 6. Validate dates
-    try:
-        policy_data['fecha_inicio'] = datetime.strptime(policy_data['fecha_inicio'], "%d/%m/%Y")
-        policy_data['fecha_fin'] = datetime.strptime(policy_data['fecha_fin'], "%d/%m/%Y")
-    except ValueError:
-        return {"error": "Invalid date format. Use DD/MM/YYYY"}
-    
-    if policy_data['fecha_fin'] <= policy_data['fecha_inicio']:
-        return {"error": "End date must be after start date"}
-    
-    # 7. Validate numeric fields
-    try:
-        prima_mensual = float(policy_data['prima_mensual'])
-        cobertura_total = float(policy_data['cobertura_total'])
-        
-        if prima_mensual <= 0:
-            return {"error": "Prima mensual must be greater than 0"}
-        if cobertura_total <= 0:
-            return {"error": "Cobertura total must be greater than 0"}
-    except (TypeError, ValueError):
-        return {"error": "Prima mensual and cobertura total must be valid numbers"}
+    # 4-7. Validate policy type, estado, dates and numeric fields
+    error = validate_policy_fields(policy_data)
+    if error:
+        return error
+    prima_mensual = policy_data['prima_mensual']
+    cobertura_total = policy_data['cobertura_total']
     
     # 8. Get agent information from existing policies using matricula
     agent_info = collection.find_one(
@@ -160,18 +210,7 @@ def issue_new_policy(policy_data):
         agente_data = agent_info['polizas'][0].get('agente', {})
     
     # 9. Prepare policy record
-    policy_record = {
-        "nro_poliza": nro_poliza,
-        "tipo": policy_data['tipo'],
-        "fecha_inicio": policy_data['fecha_inicio'],
-        "fecha_fin": policy_data['fecha_fin'],
-        "prima_mensual": prima_mensual,
-        "cobertura_total": cobertura_total,
-        "id_agente": id_agente,
-        "agente": agente_data,
-        "estado": policy_data['estado'],
-        "siniestros": []
-    }
+    policy_record = build_policy_record(policy_data, nro_poliza, id_agente, agente_data)
     
     # 10. Insert policy into client's polizas array
     try:
@@ -188,11 +227,11 @@ def issue_new_policy(policy_data):
             print(f"  Cobertura total: ${cobertura_total}")
             print(f"  Agente matricula: {matricula_agente} (ID: {id_agente})")
             
-            # Invalidate policy-related caches
-            invalidate_cache_pattern("query4:*")  # Clients without active policies
-            invalidate_cache_pattern("query5:*")  # Agents with policy count
-            invalidate_cache_pattern("query7:*")  # Top clients by coverage
-            invalidate_cache_pattern("query9:*")  # Active policies view
+            # Top clients by coverage is kept exact with a delta, not invalidated
+            adjust_client_coverage(client, policy_coverage(policy_record))
+
+            # Invalidate policy-related caches and the client's cached document
+            invalidate_tags("polizas", cliente_tag(id_cliente))
             print("✓ Caché invalidado")
             
             return {
@@ -210,6 +249,98 @@ def issue_new_policy(policy_data):
         return {"error": f"Error issuing policy: {str(e)}"}
 
 
+def cancel_policy(nro_poliza):
+    """
+    Cancel a policy (estado = Cancelada)
+    
+    Args:
+        nro_poliza: Policy number
+    
+    Returns:
+        Success message or error
+    """
+    collection = get_mongo_collection()
+    
+    # Match only a policy that is not cancelled yet, so the coverage
+    # delta is applied exactly once even with concurrent cancellations
+    before = collection.find_one_and_update(
+        {"polizas": {"$elemMatch": {"nro_poliza": nro_poliza, "estado": {"$ne": CANCELLED_STATE}}}},
+        {"$set": {"polizas.$.estado": CANCELLED_STATE}},
+        projection={"id_cliente": 1, "nombre": 1, "apellido": 1, "polizas.$": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    
+    if not before:
+        if collection.find_one({"polizas.nro_poliza": nro_poliza}, {"_id": 1}):
+            return {"error": f"Policy {nro_poliza} is already cancelled"}
+        return {"error": f"Policy {nro_poliza} not found"}
+    
+    print(f"✓ Póliza {nro_poliza} cancelada")
+    
+    adjust_client_coverage(before, -policy_coverage(before['polizas'][0]))
+    
+    invalidate_tags("polizas", poliza_tag(nro_poliza))
+    print("✓ Caché invalidado")
+    
+    return {
+        "success": True,
+        "nro_poliza": nro_poliza,
+        "id_cliente": before['id_cliente'],
+        "message": "Policy cancelled successfully"
+    }
+
+
+def update_policy_coverage(nro_poliza, cobertura_total):
+    """
+    Change the total coverage of a policy
+    
+    Args:
+        nro_poliza: Policy number
+        cobertura_total: New total coverage (must be greater than 0)
+    
+    Returns:
+        Success message or error
+    """
+    try:
+        cobertura_total = float(cobertura_total)
+    except (TypeError, ValueError):
+        return {"error": "Cobertura total must be a valid number"}
+    if cobertura_total <= 0:
+        return {"error": "Cobertura total must be greater than 0"}
+    
+    collection = get_mongo_collection()
+    
+    # The document before the update tells the exact delta to apply
+    before = collection.find_one_and_update(
+        {"polizas.nro_poliza": nro_poliza},
+        {"$set": {"polizas.$.cobertura_total": cobertura_total}},
+        projection={"id_cliente": 1, "nombre": 1, "apellido": 1, "polizas.$": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    
+    if not before:
+        return {"error": f"Policy {nro_poliza} not found"}
+    
+    old_policy = before['polizas'][0]
+    new_policy = {**old_policy, "cobertura_total": cobertura_total}
+    print(f"✓ Cobertura de póliza {nro_poliza} actualizada a ${cobertura_total}")
+    
+    adjust_client_coverage(before, policy_coverage(new_policy) - policy_coverage(old_policy))
+    
+    # Only query9 and the cached policy documents show the coverage
+    invalidate_tags("polizas:cobertura", poliza_tag(nro_poliza))
+    print("✓ Caché invalidado")
+    
+    return {
+        "success": True,
+        "nro_poliza": nro_poliza,
+        "id_cliente": before['id_cliente'],
+        "cobertura_anterior": old_policy.get('cobertura_total'),
+        "cobertura_total": cobertura_total,
+        "message": "Policy coverage updated successfully"
+    }
+
+
 def validate_policy_requirements(dni_cliente, tipo_poliza):
     """
     Validate specific requirements for policy types
@@ -262,22 +393,7 @@ def get_available_agents():
     collection = get_mongo_collection()
     
     # Find all active agents
-    pipeline = [
-        {"$unwind": "$polizas"},
-        {"$match": {"polizas.agente.activo": True}},
-        {"$group": {
-            "_id": "$polizas.id_agente",
-            "matricula": {"$first": "$polizas.agente.matricula"},
-            "nombre": {"$first": "$polizas.agente.nombre"},
-            "apellido": {"$first": "$polizas.agente.apellido"},
-            "email": {"$first": "$polizas.agente.email"},
-            "telefono": {"$first": "$polizas.agente.telefono"},
-            "policy_count": {"$sum": 1}
-        }},
-        {"$sort": {"policy_count": 1}}  # Show agents with fewer policies first
-    ]
-    
-    agents = list(collection.aggregate(pipeline))
+    agents = list(collection.aggregate(AVAILABLE_AGENTS_PIPELINE))
     
     print(f"Se encontraron {len(agents)} agentes activos:")
     for agent in agents:
@@ -3,43 +3,22 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_mongo_collection
-from app.cache import RedisCache
+from app.cache import cached_query
 
+CACHE_KEY = "query3:insured_vehicles"
+CACHE_TTL = 420
+CACHE_TAGS = ["clientes", "polizas", "vehiculos"]
+# The loader stores asegurado as a real boolean, so it can be matched exactly
+INSURED_VEHICLES_FILTER = {
+    "id_cliente": {"$exists": True},
+    "vehiculos.asegurado": True,
+    "polizas.tipo": "Auto"
+}
 
-def get_insured_vehicles_with_client_and_policy(use_cache=True):
-    """
-    Get insured vehicles with client and policy info using Redis cache
-    """
-    cache_key = "query3:insured_vehicles"
-    cache = RedisCache()
-    
-    # Try cache first
-    if use_cache:
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            print(f"✓ Cache HIT - Se recuperaron {len(cached_result)} vehículos asegurados desde Redis")
-            print(f"  (TTL: {cache.get_ttl(cache_key)} segundos restantes)\n")
-            
-            for r in cached_result:
-                print(
-                    f"Vehículo {r['id_vehiculo']} ({r['patente']}) - "
-                    f"Cliente {r['cliente']} - "
-                    f"Póliza {r['nro_poliza']} ({r['estado_poliza']})"
-                )
-            
-            return cached_result
-    
-    # Cache miss - query MongoDB
-    print("✗ Cache MISS - Consultando MongoDB...")
-    collection = get_mongo_collection()
-    result = []
-
-    clients = collection.find({
-        "id_cliente": {"$exists": True},
-        "vehiculos": {"$exists": True},
-        "polizas": {"$exists": True}
-    })
 
+def insured_vehicle_rows(clients):
+    """One row per insured vehicle and Auto policy of each client"""
+    result = []
     for client in clients:
         polizas_auto = [
             p for p in client.get("polizas", [])
@@ -50,8 +29,7 @@ def get_insured_vehicles_with_client_and_policy(use_cache=True):
 
         for poliza in polizas_auto:
             for vehiculo in client.get("vehiculos", []):
-                asegurado = vehiculo.get("asegurado")
-                if asegurado in (True, "True", "true", 1):
+                if vehiculo.get("asegurado") is True:
                     result.append({
                         "id_vehiculo": vehiculo.get("id_vehiculo"),
                         "patente": vehiculo.get("patente"),
@@ -59,11 +37,39 @@ def get_insured_vehicles_with_client_and_policy(use_cache=True):
                         "nro_poliza": poliza.get("nro_poliza"),
                         "estado_poliza": poliza.get("estado")
                     })
+    return result
+
+
+@cached_query(CACHE_KEY, ttl=CACHE_TTL, tags=CACHE_TAGS)
+def fetch_insured_vehicles():
+    return insured_vehicle_rows(get_mongo_collection().find(INSURED_VEHICLES_FILTER))
+
+
+def get_insured_vehicles_with_client_and_policy(use_cache=True):
+    """
+    Get insured vehicles with client and policy info using Redis cache
+    """
+    # Stale results are served while they refresh in the background
+    result, hit, ttl = fetch_insured_vehicles.lookup_with_ttl(use_cache=use_cache)
+
+    if hit:
+        print(f"✓ Cache HIT - Se recuperaron {len(result)} vehículos asegurados desde Redis")
+        print(f"  (TTL: {ttl} segundos restantes)\n")
+        
+        for r in result:
+            print(
+                f"Vehículo {r['id_vehiculo']} ({r['patente']}) - "
+                f"Cliente {r['cliente']} - "
+                f"Póliza {r['nro_poliza']} ({r['estado_poliza']})"
+            )
+        
+        return result
     
-    # Store in cache (7 minutes - vehicle insurance status doesn't change often)
+    # Cache miss - the result was computed from MongoDB
+    print("✗ Cache MISS - Consultando MongoDB...")
+    # Stored in cache (7 minutes - vehicle insurance status doesn't change often)
     if use_cache:
-        cache.set(cache_key, result, ttl=420)
-        print(f"✓ Almacenados {len(result)} vehículos en caché (TTL: 420 segundos)\n")
+        print(f"✓ Almacenados {len(result)} vehículos en caché (TTL: {CACHE_TTL} segundos)\n")
 
     print(f"Se encontraron {len(result)} vehículos asegurados con cliente y póliza Auto:")
 
@@ -3,54 +3,55 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_mongo_collection
-from app.cache import RedisCache
+from app.cache import cached_query
 import json
 from datetime import datetime
 
+CACHE_KEY = "query4:clients_no_active_policies"
+CACHE_TTL = 300
+CACHE_TAGS = ["clientes", "polizas"]
+CLIENTS_WITHOUT_ACTIVE_POLICIES_PIPELINE = [{
+    "$match": {
+        "polizas": {
+            "$elemMatch": {
+                "estado": {"$ne": "Activa"}
+            }
+        }
+    }
+}, {"$project": {
+        "id_cliente": "$id_cliente",
+        "nombre": "$nombre",
+        "apellido": "$apellido"
+    }
+}]
+
+
+@cached_query(CACHE_KEY, ttl=CACHE_TTL, tags=CACHE_TAGS)
+def fetch_clients_without_active_policies():
+    return list(get_mongo_collection().aggregate(CLIENTS_WITHOUT_ACTIVE_POLICIES_PIPELINE))
+
 
 def get_clients_without_active_policies(use_cache=True):
     """
     Get clients without active policies using Redis cache
     """
-    cache_key = "query4:clients_no_active_policies"
-    cache = RedisCache()
-    
-    # Try cache first
-    if use_cache:
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            print(f"✓ Cache HIT - Se recuperaron {len(cached_result)} clientes desde Redis")
-            print(f"  (TTL: {cache.get_ttl(cache_key)} segundos restantes)\n")
-            
-            for c in cached_result:
-                print(f"Cliente {c['id_cliente']}: {c['nombre']} {c['apellido']}")
-            
-            return cached_result
+    # Stale results are served while they refresh in the background
+    result, hit, ttl = fetch_clients_without_active_policies.lookup_with_ttl(use_cache=use_cache)
+
+    if hit:
+        print(f"✓ Cache HIT - Se recuperaron {len(result)} clientes desde Redis")
+        print(f"  (TTL: {ttl} segundos restantes)\n")
+        
+        for c in result:
+            print(f"Cliente {c['id_cliente']}: {c['nombre']} {c['apellido']}")
+        
+        return result
     
-    # Cache miss - query MongoDB
+    # Cache miss - the result was computed from MongoDB
     print("✗ Cache MISS - Consultando MongoDB...")
-    collection = get_mongo_collection()
-
-    clients = collection.aggregate([{
-        "$match": {
-            "polizas": {
-                "$elemMatch": {
-                    "estado": {"$ne": "Activa"}
-                }
-            }
-        }
-    }, {"$project": {
-            "id_cliente": "$id_cliente",
-            "nombre": "$nombre",
-            "apellido": "$apellido"
-        }
-    }])
-    result = [client for client in clients]
-    
-    # Store in cache (5 minutes)
+    # Stored in cache (5 minutes)
     if use_cache:
-        cache.set(cache_key, result, ttl=300)
-        print(f"✓ Almacenados {len(result)} clientes en caché (TTL: 300 segundos)\n")
+        print(f"✓ Almacenados {len(result)} clientes en caché (TTL: {CACHE_TTL} segundos)\n")
 
     print(f"Se encontraron {len(result)} clientes sin pólizas activas:")
     for c in result:
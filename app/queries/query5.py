@@ -3,61 +3,61 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_mongo_collection
-from app.cache import RedisCache
+from app.cache import cached_query
+
+CACHE_KEY = "query5:active_agents_policies"
+CACHE_TTL = 600
+CACHE_TAGS = ["polizas"]
+ACTIVE_AGENTS_PIPELINE = [
+    {
+        "$unwind": "$polizas"
+    },
+    {
+        "$match": {
+            "polizas.agente.activo": True
+        }
+    },
+    {
+        "$group": {
+            "_id": "$polizas.id_agente",
+            "nombre": {"$first": "$polizas.agente.nombre"},
+            "apellido": {"$first": "$polizas.agente.apellido"},
+            "polizas_asignadas": {"$sum": 1}
+        }
+    }
+]
+
+
+@cached_query(CACHE_KEY, ttl=CACHE_TTL, tags=CACHE_TAGS)
+def fetch_active_agents():
+    return list(get_mongo_collection().aggregate(ACTIVE_AGENTS_PIPELINE))
 
 
 def get_active_agents_with_assigned_policies_count(use_cache=True):
     """
     Get active agents with policy count using Redis cache
     """
-    cache_key = "query5:active_agents_policies"
-    cache = RedisCache()
-    
-    # Try cache first
-    if use_cache:
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            print(f"✓ Cache HIT - Retornando {len(cached_result)} agentes desde Redis")
-            print(f"  (TTL: {cache.get_ttl(cache_key)} segundos restantes)\n")
-            
-            print("Agentes activos con cantidad de pólizas asignadas:")
-            for r in cached_result:
-                print(
-                    f"Agente {int(r['_id'])} - {r['nombre']} {r['apellido']}: "
-                    f"{r['polizas_asignadas']} pólizas"
-                )
-            
-            return cached_result
-    
-    # Cache miss - query MongoDB
-    print("✗ Cache MISS - Consultando MongoDB...")
-    collection = get_mongo_collection()
+    # Stale results are served while they refresh in the background
+    result, hit, ttl = fetch_active_agents.lookup_with_ttl(use_cache=use_cache)
 
-    agents = collection.aggregate([
-        {
-            "$unwind": "$polizas"
-        },
-        {
-            "$match": {
-                "polizas.agente.activo": True
-            }
-        },
-        {
-            "$group": {
-                "_id": "$polizas.id_agente",
-                "nombre": {"$first": "$polizas.agente.nombre"},
-                "apellido": {"$first": "$polizas.agente.apellido"},
-                "polizas_asignadas": {"$sum": 1}
-            }
-        }
-    ])
-
-    result = [agent for agent in agents]
+    if hit:
+        print(f"✓ Cache HIT - Retornando {len(result)} agentes desde Redis")
+        print(f"  (TTL: {ttl} segundos restantes)\n")
+        
+        print("Agentes activos con cantidad de pólizas asignadas:")
+        for r in result:
+            print(
+                f"Agente {int(r['_id'])} - {r['nombre']} {r['apellido']}: "
+                f"{r['polizas_asignadas']} pólizas"
+            )
+        
+        return result
     
-    # Store in cache (10 minutes - agent data changes less frequently)
+    # Cache miss - the result was computed from MongoDB
+    print("✗ Cache MISS - Consultando MongoDB...")
+    # Stored in cache (10 minutes - agent data changes less frequently)
     if use_cache:
-        cache.set(cache_key, result, ttl=600)
-        print(f"✓ Guardado {len(result)} agentes en cache (TTL: 600 segundos)\n")
+        print(f"✓ Guardado {len(result)} agentes en cache (TTL: {CACHE_TTL} segundos)\n")
 
     print("Agentes activos con cantidad de pólizas asignadas:")
 
@@ -3,12 +3,13 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_redis_client
+from app.leaderboard import TOP_COVERAGE_KEY
 
 
 def get_top10_clients_by_total_coverage():
 
     redis_client = get_redis_client()
-    redis_key = "top_clients_coverage"
+    redis_key = TOP_COVERAGE_KEY
 
     entries = redis_client.zrevrange(redis_key, 0, 9, withscores=True)
 
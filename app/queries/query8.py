@@ -5,35 +5,17 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_mongo_collection
-from app.cache import RedisCache
+from app.cache import cached_query
+
+CACHE_KEY = "query8:accident_claims_last_year"
+CACHE_TTL = 180
+CACHE_TAGS = ["clientes", "siniestros"]
 
-def get_accident_claims_last_year(use_cache=True):
-    """
-    Get accident claims from the last year using Redis cache
-    """
-    cache_key = "query8:accident_claims_last_year"
-    cache = RedisCache()
-    
-    # Try cache first
-    if use_cache:
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            print(f"✓ Cache HIT - Se recuperaron {len(cached_result)} siniestros de accidente desde Redis")
-            print(f"  (TTL: {cache.get_ttl(cache_key)} segundos restantes)\n")
-            
-            for r in cached_result:
-                print(
-                    f"Siniestro {r['_id']} - Fecha: {datetime.fromisoformat(r['fecha']).strftime("%d/%m/%Y")} - "
-                    f"Cliente: {r['nombre']} {r['apellido']}"
-                )
-            
-            return cached_result
-    
-    # Cache miss - query MongoDB
-    print("✗ Cache MISS - Consultando MongoDB...")
-    collection = get_mongo_collection()
 
-    siniestros = collection.aggregate([
+def accident_claims_pipeline(now=None):
+    """Accident claims between a year ago and now"""
+    now = now or datetime.now()
+    return [
         { 
             "$unwind": "$polizas"
         }, {
@@ -43,7 +25,7 @@ def get_accident_claims_last_year(use_cache=True):
                 "id_cliente": {"$exists": True},
                 "polizas": {"$exists": True},
                 "polizas.siniestros.tipo": {"$eq": "Accidente"},
-                "polizas.siniestros.fecha": {"$lte": datetime.now(), "$gt": datetime.now().replace(year = datetime.now().year - 1)}
+                "polizas.siniestros.fecha": {"$lte": now, "$gt": now.replace(year = now.year - 1)}
             }
         }, {
             "$project": {
@@ -53,21 +35,46 @@ def get_accident_claims_last_year(use_cache=True):
                 "fecha": "$polizas.siniestros.fecha"
             }
         }
-    ])
-    result = [siniestro for siniestro in siniestros]
+    ]
 
-    # Store in cache (3 minutes - accident claims change moderately)
-    if use_cache:
-        cache.set(cache_key, result, ttl=180)
-        print(f"✓ Almacenados {len(result)} siniestros de accidente en caché (TTL: 180 segundos)\n")
 
-    print(f"Se encontraron {len(result)} siniestros en 2025:")
+def print_accident_claims(result):
     for r in result:
         print(
             f"Siniestro {r['_id']} - Fecha: {r['fecha'].strftime("%d/%m/%Y")} - "
             f"Cliente: {r['nombre']} {r['apellido']}"
         )
 
+
+@cached_query(CACHE_KEY, ttl=CACHE_TTL, tags=CACHE_TAGS)
+def fetch_accident_claims():
+    # The one-year window is computed on every call, refreshes included
+    return list(get_mongo_collection().aggregate(accident_claims_pipeline()))
+
+
+def get_accident_claims_last_year(use_cache=True):
+    """
+    Get accident claims from the last year using Redis cache
+    """
+    # Stale results are served while they refresh in the background
+    result, hit, ttl = fetch_accident_claims.lookup_with_ttl(use_cache=use_cache)
+
+    if hit:
+        print(f"✓ Cache HIT - Se recuperaron {len(result)} siniestros de accidente desde Redis")
+        print(f"  (TTL: {ttl} segundos restantes)\n")
+        
+        print_accident_claims(result)
+        return result
+    
+    # Cache miss - the result was computed from MongoDB
+    print("✗ Cache MISS - Consultando MongoDB...")
+    # Stored in cache (3 minutes - accident claims change moderately)
+    if use_cache:
+        print(f"✓ Almacenados {len(result)} siniestros de accidente en caché (TTL: {CACHE_TTL} segundos)\n")
+
+    print(f"Se encontraron {len(result)} siniestros en 2025:")
+    print_accident_claims(result)
+
     return result
 
 
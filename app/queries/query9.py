@@ -1,72 +1,41 @@
 import sys
 import os
-from datetime import datetime
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.db import get_mongo_collection
-from app.cache import RedisCache
+from app.cache import cached_query
 
-def view_active_policies(use_cache=True):
-    """
-    View active policies sorted by start date using Redis cache
-    """
-    cache_key = "query9:active_policies_sorted"
-    cache = RedisCache()
-    
-    # Try cache first
-    if use_cache:
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            print(f"✓ Cache HIT - Se recuperaron {len(cached_result)} pólizas activas desde Redis")
-            print(f"  (TTL: {cache.get_ttl(cache_key)} segundos restantes)\n")
-            
-            print("Pólizas activas\n")
-            for p in cached_result:
-                print(
-                    f"{p['nro_poliza']} | Cliente {p['id_cliente']} | "
-                    f"Tipo: {p['tipo']} | Inicio: {datetime.fromisoformat(p['fecha_inicio']).strftime("%d/%m/%Y")} | "
-                    f"Fin: {datetime.fromisoformat(p['fecha_fin']).strftime("%d/%m/%Y")} | Estado: {p['estado']}"
-                )
-            
-            return cached_result
-    
-    # Cache miss - query MongoDB
-    print("✗ Cache MISS - Consultando MongoDB...")
-    col = get_mongo_collection()
+CACHE_KEY = "query9:active_policies_sorted"
+CACHE_TTL = 300
+# Shows coverage amounts, which update_policy_coverage invalidates on their own
+CACHE_TAGS = ["polizas", "polizas:cobertura"]
+ACTIVE_POLICIES_PIPELINE = [
+    {"$unwind": "$polizas"},
 
-    pipeline = [
-        {"$unwind": "$polizas"},
+    {"$match": {
+        "polizas.estado": "Activa"
+    }},
 
-        {"$match": {
-            "polizas.estado": "Activa"
-        }},
+    {"$sort": {
+        "fecha_inicio_date": 1
+    }},
 
-        {"$sort": {
-            "fecha_inicio_date": 1
-        }},
+    {"$project": {
+        "_id": 0,
+        "id_cliente": 1,
+        "nro_poliza": "$polizas.nro_poliza",
+        "tipo": "$polizas.tipo",
+        "fecha_inicio": "$polizas.fecha_inicio",
+        "fecha_fin": "$polizas.fecha_fin",
+        "prima_mensual": "$polizas.prima_mensual",
+        "cobertura_total": "$polizas.cobertura_total",
+        "id_agente": "$polizas.id_agente",
+        "estado": "$polizas.estado"
+    }}
+]
 
-        {"$project": {
-            "_id": 0,
-            "id_cliente": 1,
-            "nro_poliza": "$polizas.nro_poliza",
-            "tipo": "$polizas.tipo",
-            "fecha_inicio": "$polizas.fecha_inicio",
-            "fecha_fin": "$polizas.fecha_fin",
-            "prima_mensual": "$polizas.prima_mensual",
-            "cobertura_total": "$polizas.cobertura_total",
-            "id_agente": "$polizas.id_agente",
-            "estado": "$polizas.estado"
-        }}
-    ]
-    
-    # Convert to list for caching
-    result = list(col.aggregate(pipeline))
-    
-    # Store in cache (5 minutes)
-    if use_cache:
-        cache.set(cache_key, result, ttl=300)
-        print(f"✓ Almacenadas {len(result)} pólizas activas en caché (TTL: 300 segundos)\n")
 
+def print_active_policies(result):
     print("Pólizas activas\n")
     for p in result:
         print(
@@ -75,5 +44,34 @@ def view_active_policies(use_cache=True):
             f"Fin: {p['fecha_fin'].strftime("%d/%m/%Y")} | Estado: {p['estado']}"
         )
 
+
+@cached_query(CACHE_KEY, ttl=CACHE_TTL, tags=CACHE_TAGS)
+def fetch_active_policies():
+    return list(get_mongo_collection().aggregate(ACTIVE_POLICIES_PIPELINE))
+
+
+def view_active_policies(use_cache=True):
+    """
+    View active policies sorted by start date using Redis cache
+    """
+    # Stale results are served while they refresh in the background
+    result, hit, ttl = fetch_active_policies.lookup_with_ttl(use_cache=use_cache)
+
+    if hit:
+        print(f"✓ Cache HIT - Se recuperaron {len(result)} pólizas activas desde Redis")
+        print(f"  (TTL: {ttl} segundos restantes)\n")
+        
+        print_active_policies(result)
+        return result
+    
+    # Cache miss - the result was computed from MongoDB
+    print("✗ Cache MISS - Consultando MongoDB...")
+    # Stored in cache (5 minutes)
+    if use_cache:
+        print(f"✓ Almacenadas {len(result)} pólizas activas en caché (TTL: {CACHE_TTL} segundos)\n")
+
+    print_active_policies(result)
+    return result
+
 if __name__ == "__main__":
     view_active_policies()
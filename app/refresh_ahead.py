@@ -0,0 +1,175 @@
+"""
+Background refresh of cached query results
+
+RedisCache.get_or_compute registers how each key is computed. With that
+registry this module can recompute a key off the request path:
+
+- Stale-while-revalidate: a hit past its soft TTL is served as is and the
+  key is queued for a background refresh.
+- Refresh-ahead: a scheduler thread periodically takes the most requested
+  keys and recomputes those that would go stale before its next run.
+
+Refreshes take the same single-flight lock as a miss, so across every
+process only one worker recomputes a key at a time.
+
+CACHE_REFRESH_AHEAD_INTERVAL (seconds, 0 disables the scheduler),
+CACHE_REFRESH_AHEAD_TOP (keys considered per run), CACHE_REFRESH_WORKERS
+(background refresh threads) and CACHE_REFRESH_REGISTRY_SIZE (keys whose
+computation is remembered, least recently used dropped first) configure it.
+"""
+
+import os
+import time
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+REFRESH_WORKERS = int(os.environ.get("CACHE_REFRESH_WORKERS", "4"))
+REFRESH_AHEAD_INTERVAL = float(os.environ.get("CACHE_REFRESH_AHEAD_INTERVAL", "0"))
+REFRESH_AHEAD_TOP = int(os.environ.get("CACHE_REFRESH_AHEAD_TOP", "10"))
+# Parameterized queries register one key per argument set, so the registry is bounded
+REFRESH_REGISTRY_SIZE = max(int(os.environ.get("CACHE_REFRESH_REGISTRY_SIZE", "1000")), REFRESH_AHEAD_TOP)
+
+_lock = threading.Lock()
+_computations = OrderedDict()  # key -> (compute, ttl, tags), least recently used first
+_hits = Counter()
+_pending = set()
+_executor = None
+_scheduler = None
+
+
+def _reset_after_fork():
+    # Worker and scheduler threads do not survive a fork
+    global _lock, _pending, _executor, _scheduler
+    _lock = threading.Lock()
+    _pending = set()
+    _executor = None
+    _scheduler = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def register(key, compute, ttl, tags=None):
+    """Remember how to recompute key, forgetting the least recently used keys past the limit"""
+    with _lock:
+        _computations[key] = (compute, ttl, tags)
+        _computations.move_to_end(key)
+        while len(_computations) > REFRESH_REGISTRY_SIZE:
+            evicted, _ = _computations.popitem(last=False)
+            _hits.pop(evicted, None)
+    if REFRESH_AHEAD_INTERVAL > 0:
+        start_refresh_ahead()
+
+
+def record_hit(key):
+    with _lock:
+        # Only registered keys are counted, so the counters stay bounded too
+        if key in _computations:
+            _hits[key] += 1
+
+
+def refresh_in_background(key):
+    """Queue a refresh of a registered key unless one is already queued"""
+    global _executor
+    with _lock:
+        if key in _pending or key not in _computations:
+            return
+        _pending.add(key)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+        executor = _executor
+    executor.submit(_refresh, key)
+
+
+def _refresh(key):
+    from app.cache import RedisCache
+
+    try:
+        with _lock:
+            computation = _computations.get(key)
+        if computation is not None:
+            compute, ttl, tags = computation
+            RedisCache().refresh(key, compute, ttl=ttl, tags=tags)
+    except Exception as e:
+        print(f"Error refrescando {key}: {e}")
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def hottest_keys(n=REFRESH_AHEAD_TOP):
+    """Most requested keys since the previous call, older hits weighing half"""
+    with _lock:
+        keys = [key for key, _ in _hits.most_common(n)]
+        for key in list(_hits):
+            _hits[key] //= 2
+            if not _hits[key]:
+                del _hits[key]
+    return keys
+
+
+def refresh_due(cache, horizon):
+    """
+    Queue the hottest keys that go stale within horizon seconds
+
+    Keys that are missing (expired or evicted) are recomputed as well. Keys
+    whose stored generation is behind the current one were invalidated and
+    are left for the next request, which recomputes them on its own.
+
+    Returns:
+        Keys queued for refresh
+    """
+    from app.cache import stale_ttl_for, unpack_entry
+
+    keys = hottest_keys()
+    with _lock:
+        # A key can be dropped from the registry after it was counted
+        computations = {key: _computations[key] for key in keys if key in _computations}
+    if not computations:
+        return []
+    keys = list(computations)
+    generations = cache.current_generations(keys)
+    pipe = cache.redis.pipeline(transaction=False)
+    for key in keys:
+        pipe.pttl(key)
+        # The entry header is enough to read its generation
+        pipe.getrange(key, 0, 8)
+    results = pipe.execute()
+
+    due = []
+    for key, pttl, header in zip(keys, results[::2], results[1::2]):
+        if header and unpack_entry(header)[0] < generations[key]:
+            continue
+        ttl = computations[key][1]
+        # Seconds until the entry goes stale; a missing key (-2) is already due
+        fresh_for = pttl / 1000 - stale_ttl_for(ttl) if pttl >= 0 else 0
+        if fresh_for <= horizon:
+            refresh_in_background(key)
+            due.append(key)
+    return due
+
+
+def _run_scheduler(interval):
+    from app.cache import RedisCache
+
+    cache = RedisCache()
+    while True:
+        time.sleep(interval)
+        try:
+            refresh_due(cache, interval)
+        except Exception as e:
+            print(f"Error en refresh-ahead: {e}")
+
+
+def start_refresh_ahead(interval=REFRESH_AHEAD_INTERVAL):
+    """Start the refresh-ahead scheduler thread (once per process)"""
+    global _scheduler
+    with _lock:
+        if _scheduler is not None or interval <= 0:
+            return
+        _scheduler = threading.Thread(
+            target=_run_scheduler, args=(interval,), name="cache-refresh-ahead", daemon=True
+        )
+        _scheduler.start()
@@ -0,0 +1,383 @@
+"""
+Codecs for values stored in the Redis cache
+
+Every codec round-trips the types MongoDB returns, datetime and ObjectId
+included, so a cached result is identical to the one read from MongoDB.
+Payloads start with a one-byte header naming their codec, so readers decode
+whatever codec the writer used.
+
+CACHE_CODEC selects the codec used for writing: "auto" (default) picks
+msgpack (a dependency in requirements.txt), then orjson, then the standard
+library json. The pickle codec is only used when selected explicitly, and
+even then only unpickles the handful of classes listed in
+PICKLE_ALLOWED_CLASSES, so a value planted in Redis cannot run code.
+
+Payloads of CACHE_COMPRESS_MIN_BYTES or more are compressed, with another
+one-byte header in front. CACHE_COMPRESSION selects the compressor: "auto"
+(default) picks zstd (zstandard is a dependency in requirements.txt), then
+lz4, and only falls back to zlib from the standard library when neither is
+installed; "none" disables compression.
+
+Run this module to compare the codecs with plain json.dumps(default=str):
+
+    python -m app.serialization
+"""
+
+import io
+import os
+import json
+import time
+import zlib
+import struct
+import pickle
+from datetime import datetime, date
+from bson import ObjectId
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+CACHE_CODEC = os.environ.get("CACHE_CODEC", "auto")
+CACHE_COMPRESSION = os.environ.get("CACHE_COMPRESSION", "auto")
+COMPRESS_MIN_BYTES = int(os.environ.get("CACHE_COMPRESS_MIN_BYTES", "16384"))
+
+# Tagged representations used by the JSON codecs. MongoDB field names cannot
+# contain a NUL character, so a document never has one of these keys
+DATE_TAG = "\x00date"
+DAY_TAG = "\x00day"
+OID_TAG = "\x00oid"
+
+# Headers of the JSON codecs when they tagged with "$date", "$day" and "$oid",
+# which real documents can contain; those entries are no longer decoded
+RETIRED_HEADERS = (b"\x01", b"\x02")
+
+# msgpack extension type codes
+EXT_DATETIME = 1
+EXT_DATE = 2
+EXT_OBJECTID = 3
+EXT_NAIVE_DATETIME = 4
+
+# Naive datetimes (what MongoDB returns) as fixed-width fields: 11 bytes
+# instead of a 19-26 byte ISO string, unpacked in C on decode
+NAIVE_DATETIME = struct.Struct(">HBBBBBI")
+
+
+def tag_value(value):
+    """JSON-compatible tagged form of a datetime, date or ObjectId"""
+    if isinstance(value, datetime):
+        return {DATE_TAG: value.isoformat()}
+    if isinstance(value, date):
+        return {DAY_TAG: value.isoformat()}
+    if isinstance(value, ObjectId):
+        return {OID_TAG: str(value)}
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def untag_object(obj):
+    """Inverse of tag_value for a decoded JSON object"""
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if isinstance(value, str):
+            if key == DATE_TAG:
+                return datetime.fromisoformat(value)
+            if key == DAY_TAG:
+                return date.fromisoformat(value)
+            if key == OID_TAG:
+                return ObjectId(value)
+    return obj
+
+
+def untag(value):
+    """Restore tagged values in a structure decoded without an object hook"""
+    if isinstance(value, list):
+        return [untag(item) for item in value]
+    if isinstance(value, dict):
+        return untag_object({k: untag(v) for k, v in value.items()})
+    return value
+
+
+class JsonCodec:
+    """Standard library json with tagged datetimes and ObjectIds"""
+
+    name = "json"
+    header = b"\x05"
+
+    def encode(self, data):
+        return json.dumps(data, default=tag_value, separators=(",", ":")).encode()
+
+    def decode(self, payload):
+        return json.loads(payload, object_hook=untag_object)
+
+
+class OrjsonCodec:
+    """orjson with the same tagged representation as JsonCodec"""
+
+    name = "orjson"
+    header = b"\x06"
+
+    def encode(self, data):
+        # Without the passthrough flags orjson would write plain ISO strings
+        return orjson.dumps(
+            data,
+            default=tag_value,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+
+    def decode(self, payload):
+        return untag(orjson.loads(payload))
+
+
+class MsgpackCodec:
+    """msgpack with extension types for datetime, date and ObjectId"""
+
+    name = "msgpack"
+    header = b"\x03"
+
+    @staticmethod
+    def _default(value):
+        if isinstance(value, datetime):
+            if value.tzinfo is None:
+                return msgpack.ExtType(EXT_NAIVE_DATETIME, NAIVE_DATETIME.pack(
+                    value.year, value.month, value.day,
+                    value.hour, value.minute, value.second, value.microsecond,
+                ))
+            return msgpack.ExtType(EXT_DATETIME, value.isoformat().encode())
+        if isinstance(value, date):
+            return msgpack.ExtType(EXT_DATE, value.isoformat().encode())
+        if isinstance(value, ObjectId):
+            return msgpack.ExtType(EXT_OBJECTID, value.binary)
+        raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+    @staticmethod
+    def _ext_hook(code, data):
+        if code == EXT_NAIVE_DATETIME:
+            return datetime(*NAIVE_DATETIME.unpack(data))
+        if code == EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == EXT_DATE:
+            return date.fromisoformat(data.decode())
+        if code == EXT_OBJECTID:
+            return ObjectId(data)
+        return msgpack.ExtType(code, data)
+
+    def encode(self, data):
+        return msgpack.packb(data, default=self._default, datetime=False)
+
+    def decode(self, payload):
+        return msgpack.unpackb(payload, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+
+PICKLE_ALLOWED_CLASSES = {
+    ("datetime", "datetime"),
+    ("datetime", "date"),
+    ("datetime", "timedelta"),
+    ("datetime", "timezone"),
+    ("bson.objectid", "ObjectId"),
+}
+
+
+class RestrictedUnpickler(pickle.Unpickler):
+    """Unpickler that refuses every class outside PICKLE_ALLOWED_CLASSES"""
+
+    def find_class(self, module, name):
+        if (module, name) not in PICKLE_ALLOWED_CLASSES:
+            raise pickle.UnpicklingError(f"Clase no permitida en caché: {module}.{name}")
+        return super().find_class(module, name)
+
+
+class PickleCodec:
+    """Standard library pickle, restricted to plain data, dates and ObjectIds"""
+
+    name = "pickle"
+    header = b"\x04"
+
+    def encode(self, data):
+        return pickle.dumps(data, protocol=5)
+
+    def decode(self, payload):
+        return RestrictedUnpickler(io.BytesIO(payload)).load()
+
+
+AVAILABLE_CODECS = {"json": JsonCodec(), "pickle": PickleCodec()}
+if orjson is not None:
+    AVAILABLE_CODECS["orjson"] = OrjsonCodec()
+if msgpack is not None:
+    AVAILABLE_CODECS["msgpack"] = MsgpackCodec()
+
+CODECS_BY_HEADER = {codec.header: codec for codec in AVAILABLE_CODECS.values()}
+
+
+def get_codec(name=CACHE_CODEC):
+    """Codec used to write cache entries"""
+    if name == "auto":
+        # Never pickle by default: it is opt-in on a shared Redis
+        for candidate in ("msgpack", "orjson", "json"):
+            if candidate in AVAILABLE_CODECS:
+                return AVAILABLE_CODECS[candidate]
+    if name not in AVAILABLE_CODECS:
+        raise ValueError(f"Codec no disponible: {name} (disponibles: {', '.join(AVAILABLE_CODECS)})")
+    return AVAILABLE_CODECS[name]
+
+
+class ZlibCompressor:
+    """Standard library zlib, at a fast level"""
+
+    name = "zlib"
+    header = b"\x10"
+
+    def compress(self, payload):
+        return zlib.compress(payload, 1)
+
+    def decompress(self, payload):
+        return zlib.decompress(payload)
+
+
+class ZstdCompressor:
+    """zstandard: better ratio than zlib at a similar speed"""
+
+    name = "zstd"
+    header = b"\x11"
+
+    def compress(self, payload):
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+
+    def decompress(self, payload):
+        return zstandard.ZstdDecompressor().decompress(payload)
+
+
+class Lz4Compressor:
+    """lz4 frames: the fastest to decompress"""
+
+    name = "lz4"
+    header = b"\x12"
+
+    def compress(self, payload):
+        return lz4_frame.compress(payload)
+
+    def decompress(self, payload):
+        return lz4_frame.decompress(payload)
+
+
+AVAILABLE_COMPRESSORS = {"zlib": ZlibCompressor()}
+if lz4_frame is not None:
+    AVAILABLE_COMPRESSORS["lz4"] = Lz4Compressor()
+if zstandard is not None:
+    AVAILABLE_COMPRESSORS["zstd"] = ZstdCompressor()
+
+COMPRESSORS_BY_HEADER = {compressor.header: compressor for compressor in AVAILABLE_COMPRESSORS.values()}
+
+
+def get_compressor(name=CACHE_COMPRESSION):
+    """Compressor used for large payloads (None if compression is disabled)"""
+    if name == "none":
+        return None
+    if name == "auto":
+        for candidate in ("zstd", "lz4", "zlib"):
+            if candidate in AVAILABLE_COMPRESSORS:
+                return AVAILABLE_COMPRESSORS[candidate]
+    if name not in AVAILABLE_COMPRESSORS:
+        raise ValueError(f"Compresor no disponible: {name} (disponibles: {', '.join(AVAILABLE_COMPRESSORS)})")
+    return AVAILABLE_COMPRESSORS[name]
+
+
+def compress(payload, min_bytes=COMPRESS_MIN_BYTES):
+    """Compress a payload of min_bytes or more, with a header byte naming the compressor"""
+    compressor = get_compressor()
+    if compressor is None or len(payload) < min_bytes:
+        return payload
+    compressed = compressor.header + compressor.compress(payload)
+    return compressed if len(compressed) < len(payload) else payload
+
+
+def decompress(payload):
+    """Inverse of compress; uncompressed payloads are returned as is"""
+    compressor = COMPRESSORS_BY_HEADER.get(payload[:1])
+    if compressor is None:
+        if payload[:1] in (b"\x11", b"\x12"):
+            raise ValueError("Valor escrito con un compresor que no está instalado")
+        return payload
+    return compressor.decompress(payload[1:])
+
+
+def dumps(data, codec=None):
+    """Serialize data with a header byte naming the codec, compressed if large"""
+    codec = codec or get_codec()
+    return compress(codec.header + codec.encode(data))
+
+
+def loads(payload):
+    """Deserialize a payload written by dumps with any available codec"""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    payload = decompress(payload)
+    codec = CODECS_BY_HEADER.get(payload[:1])
+    if codec is None:
+        if payload[:1] in RETIRED_HEADERS:
+            raise ValueError("Valor escrito con un formato anterior del codec")
+        if payload[:1] in (b"\x03", b"\x04", b"\x05", b"\x06"):
+            raise ValueError("Valor escrito con un codec que no está instalado")
+        # Entries written before the codec layer are plain JSON
+        return json.loads(payload)
+    return codec.decode(payload[1:])
+
+
+def benchmark_codecs(rows=5000, iterations=20):
+    """Time encode/decode of query-like rows for each codec against plain json"""
+    sample = [
+        {
+            "_id": ObjectId(),
+            "id_cliente": i,
+            "nro_poliza": f"POL{1000 + i}",
+            "tipo": "Auto",
+            "fecha_inicio": datetime(2024, 1, 1 + i % 28, 10, 30),
+            "fecha_fin": datetime(2025, 1, 1 + i % 28, 10, 30),
+            "prima_mensual": 1234.5 + i,
+            "cobertura_total": 500000.0,
+            "estado": "Activa",
+        }
+        for i in range(rows)
+    ]
+
+    def timed(encode, decode):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            payload = encode(sample)
+        encode_ms = (time.perf_counter() - start) * 1000 / iterations
+        start = time.perf_counter()
+        for _ in range(iterations):
+            decode(payload)
+        decode_ms = (time.perf_counter() - start) * 1000 / iterations
+        return encode_ms, decode_ms, len(payload), len(compress(payload, min_bytes=0))
+
+    # Every row is timed uncompressed, so the codecs are compared on equal
+    # terms; the last column shows the size once compressed as dumps would.
+    # The baseline writes dates and ObjectIds as plain strings, so it reads
+    # back different values than the codecs do.
+    results = {"json default=str": timed(lambda d: json.dumps(d, default=str).encode(), json.loads)}
+    for codec in AVAILABLE_CODECS.values():
+        results[codec.name] = timed(codec.encode, codec.decode)
+        assert loads(dumps(sample, codec)) == sample, f"{codec.name} no preserva los valores"
+
+    print(f"{'Codec':<18} {'Encode ms':>10} {'Decode ms':>10} {'Bytes':>10} {'Comprimido':>11}")
+    for name, (encode_ms, decode_ms, size, compressed) in results.items():
+        print(f"{name:<18} {encode_ms:>10.2f} {decode_ms:>10.2f} {size:>10} {compressed:>11}")
+    return results
+
+if __name__ == "__main__":
+    benchmark_codecs()
@@ -0,0 +1,343 @@
+"""
+Incremental CSV to MongoDB synchronization
+
+Instead of deleting the collection and loading everything again, each client,
+policy, claim and vehicle built from the CSV files is fingerprinted and
+compared with the fingerprints stored by the previous run. Only the entities
+that were added, removed or changed are written, and only the Redis caches
+that depend on them are invalidated.
+"""
+
+import sys
+import os
+import json
+import hashlib
+from pymongo import InsertOne, DeleteOne, UpdateOne, ReplaceOne
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import get_mongo_collection, get_redis_client
+from app.cache import invalidate_namespaces, invalidate_tags, cliente_tag, poliza_tag, ALL_NAMESPACES
+from app.indexes import ensure_indexes
+from app.main import (
+    CSV_FILES,
+    DEFAULT_BATCH_SIZE,
+    FINGERPRINTS_COLLECTION,
+    build_client_documents,
+    build_top_coverage_in_redis,
+    insert_in_batches,
+    read_csv_records,
+)
+
+# Cache tag of the results built from each kind of entity
+KIND_TAGS = {
+    "cliente": "clientes",
+    "poliza": "polizas",
+    "siniestro": "siniestros",
+    "vehiculo": "vehiculos",
+}
+
+CHILD_FIELDS = ("polizas", "vehiculos", "_id")
+
+
+def fingerprint(record, exclude=()):
+    """Stable hash of a record's fields"""
+    data = {k: v for k, v in record.items() if k not in exclude}
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def client_fields(document):
+    return {k: v for k, v in document.items() if k not in CHILD_FIELDS}
+
+
+def collect_fingerprints(documents):
+    """
+    Fingerprint every entity of the built client documents
+
+    Returns:
+        Dict of entity key -> fingerprint document. A policy's fingerprint
+        includes its embedded agent but not its claims, which are tracked
+        on their own. As in build_client_documents, the first document with
+        a given id wins.
+    """
+    entities = {}
+    for document in documents:
+        id_cliente = document["id_cliente"]
+        if f"cliente:{id_cliente}" in entities:
+            continue
+        fields = client_fields(document)
+        entities[f"cliente:{id_cliente}"] = {
+            "kind": "cliente",
+            "hash": fingerprint(fields),
+            "id_cliente": id_cliente,
+            "fields": sorted(fields),
+        }
+
+        for poliza in document.get("polizas", []):
+            nro_poliza = poliza["nro_poliza"]
+            entities.setdefault(f"poliza:{id_cliente}:{nro_poliza}", {
+                "kind": "poliza",
+                "hash": fingerprint(poliza, exclude=("siniestros",)),
+                "id_cliente": id_cliente,
+                "nro_poliza": nro_poliza,
+            })
+            for siniestro in poliza.get("siniestros", []):
+                id_siniestro = siniestro["id_siniestro"]
+                entities.setdefault(f"siniestro:{id_cliente}:{nro_poliza}:{id_siniestro}", {
+                    "kind": "siniestro",
+                    "hash": fingerprint(siniestro),
+                    "id_cliente": id_cliente,
+                    "nro_poliza": nro_poliza,
+                    "id_siniestro": id_siniestro,
+                })
+
+        for vehiculo in document.get("vehiculos", []):
+            id_vehiculo = vehiculo["id_vehiculo"]
+            entities.setdefault(f"vehiculo:{id_cliente}:{id_vehiculo}", {
+                "kind": "vehiculo",
+                "hash": fingerprint(vehiculo),
+                "id_cliente": id_cliente,
+                "id_vehiculo": id_vehiculo,
+            })
+    return entities
+
+
+def diff_entities(stored, desired):
+    """Split entity keys into added, removed and changed"""
+    added = desired.keys() - stored.keys()
+    removed = stored.keys() - desired.keys()
+    changed = {
+        key for key in desired.keys() & stored.keys()
+        if desired[key]["hash"] != stored[key]["hash"]
+    }
+    return added, removed, changed
+
+
+def plan_operations(documents, stored, desired):
+    """
+    Translate the entity diff into MongoDB write operations
+
+    A new or removed parent carries its children with it, and a changed
+    policy is replaced as a whole (claims included), so children of those
+    parents do not get operations of their own.
+
+    Returns:
+        Tuple (operations, changed_kinds)
+    """
+    added, removed, changed = diff_entities(stored, desired)
+    documents_by_id = {}
+    polizas_by_key = {}
+    siniestros_by_key = {}
+    vehiculos_by_key = {}
+    for document in documents:
+        id_cliente = document["id_cliente"]
+        # First wins, matching collect_fingerprints
+        if id_cliente in documents_by_id:
+            continue
+        documents_by_id[id_cliente] = document
+        for poliza in document.get("polizas", []):
+            polizas_by_key.setdefault((id_cliente, poliza["nro_poliza"]), poliza)
+            for siniestro in poliza.get("siniestros", []):
+                siniestros_by_key.setdefault((id_cliente, poliza["nro_poliza"], siniestro["id_siniestro"]), siniestro)
+        for vehiculo in document.get("vehiculos", []):
+            vehiculos_by_key.setdefault((id_cliente, vehiculo["id_vehiculo"]), vehiculo)
+
+    def keys_of(keys, kind):
+        return sorted(k for k in keys if k.startswith(kind + ":"))
+
+    def parent_poliza(entity):
+        return f"poliza:{entity['id_cliente']}:{entity['nro_poliza']}"
+
+    operations = []
+    changed_kinds = {key.split(":", 1)[0] for key in added | removed | changed}
+
+    for key in keys_of(removed, "cliente"):
+        operations.append(DeleteOne({"id_cliente": stored[key]["id_cliente"]}))
+    for key in keys_of(added, "cliente"):
+        operations.append(InsertOne(documents_by_id[desired[key]["id_cliente"]]))
+    for key in keys_of(changed, "cliente"):
+        id_cliente = desired[key]["id_cliente"]
+        fields = client_fields(documents_by_id[id_cliente])
+        update = {"$set": fields}
+        dropped = set(stored[key].get("fields", [])) - set(fields)
+        if dropped:
+            update["$unset"] = {field: "" for field in dropped}
+        operations.append(UpdateOne({"id_cliente": id_cliente}, update))
+
+    for key in keys_of(removed, "poliza"):
+        entity = stored[key]
+        if f"cliente:{entity['id_cliente']}" in removed:
+            continue
+        operations.append(UpdateOne(
+            {"id_cliente": entity["id_cliente"]},
+            {"$pull": {"polizas": {"nro_poliza": entity["nro_poliza"]}}}
+        ))
+    for key in keys_of(added, "poliza"):
+        entity = desired[key]
+        if f"cliente:{entity['id_cliente']}" in added:
+            continue
+        operations.append(UpdateOne(
+            {"id_cliente": entity["id_cliente"]},
+            {"$push": {"polizas": polizas_by_key[(entity["id_cliente"], entity["nro_poliza"])]}}
+        ))
+    for key in keys_of(changed, "poliza"):
+        entity = desired[key]
+        operations.append(UpdateOne(
+            {"id_cliente": entity["id_cliente"]},
+            {"$set": {"polizas.$[poliza]": polizas_by_key[(entity["id_cliente"], entity["nro_poliza"])]}},
+            array_filters=[{"poliza.nro_poliza": entity["nro_poliza"]}]
+        ))
+
+    for key in keys_of(removed, "siniestro"):
+        entity = stored[key]
+        if parent_poliza(entity) in removed:
+            continue
+        operations.append(UpdateOne(
+            {"id_cliente": entity["id_cliente"]},
+            {"$pull": {"polizas.$[poliza].siniestros": {"id_siniestro": entity["id_siniestro"]}}},
+            array_filters=[{"poliza.nro_poliza": entity["nro_poliza"]}]
+        ))
+    for key in keys_of(added | changed, "siniestro"):
+        entity = desired[key]
+        poliza_key = parent_poliza(entity)
+        if poliza_key in added or poliza_key in changed:
+            continue
+        siniestro = siniestros_by_key[(entity["id_cliente"], entity["nro_poliza"], entity["id_siniestro"])]
+        if key in added:
+            operations.append(UpdateOne(
+                {"id_cliente": entity["id_cliente"]},
+                {"$push": {"polizas.$[poliza].siniestros": siniestro}},
+                array_filters=[{"poliza.nro_poliza": entity["nro_poliza"]}]
+            ))
+        else:
+            operations.append(UpdateOne(
+                {"id_cliente": entity["id_cliente"]},
+                {"$set": {"polizas.$[poliza].siniestros.$[siniestro]": siniestro}},
+                array_filters=[
+                    {"poliza.nro_poliza": entity["nro_poliza"]},
+                    {"siniestro.id_siniestro": entity["id_siniestro"]}
+                ]
+            ))
+
+    for key in keys_of(removed, "vehiculo"):
+        entity = stored[key]
+        if f"cliente:{entity['id_cliente']}" in removed:
+            continue
+        operations.append(UpdateOne(
+            {"id_cliente": entity["id_cliente"]},
+            {"$pull": {"vehiculos": {"id_vehiculo": entity["id_vehiculo"]}}}
+        ))
+    for key in keys_of(added | changed, "vehiculo"):
+        entity = desired[key]
+        if f"cliente:{entity['id_cliente']}" in added:
+            continue
+        vehiculo = vehiculos_by_key[(entity["id_cliente"], entity["id_vehiculo"])]
+        if key in added:
+            operations.append(UpdateOne(
+                {"id_cliente": entity["id_cliente"]},
+                {"$push": {"vehiculos": vehiculo}}
+            ))
+        else:
+            operations.append(UpdateOne(
+                {"id_cliente": entity["id_cliente"]},
+                {"$set": {"vehiculos.$[vehiculo]": vehiculo}},
+                array_filters=[{"vehiculo.id_vehiculo": entity["id_vehiculo"]}]
+            ))
+
+    return operations, changed_kinds
+
+
+def load_stored_fingerprints(fingerprints_collection):
+    stored = {}
+    for entity in fingerprints_collection.find({}):
+        stored[entity.pop("_id")] = entity
+    return stored
+
+
+def save_fingerprints(fingerprints_collection, stored, desired, batch_size=DEFAULT_BATCH_SIZE):
+    """Persist the fingerprints of the entities that changed since the last run"""
+    added, removed, changed = diff_entities(stored, desired)
+    operations = [DeleteOne({"_id": key}) for key in removed]
+    operations += [
+        ReplaceOne({"_id": key}, {"_id": key, **desired[key]}, upsert=True)
+        for key in added | changed
+    ]
+    for start in range(0, len(operations), batch_size):
+        fingerprints_collection.bulk_write(operations[start:start + batch_size], ordered=False)
+
+
+def changed_entity_tags(stored, desired):
+    """Tags of the cached client and policy documents that embed a changed entity"""
+    added, removed, changed = diff_entities(stored, desired)
+    tags = set()
+    for key in added | removed | changed:
+        entity = desired.get(key) or stored[key]
+        tags.add(cliente_tag(entity["id_cliente"]))
+        if "nro_poliza" in entity:
+            tags.add(poliza_tag(entity["nro_poliza"]))
+    return tags
+
+
+def invalidate_affected_caches(changed_kinds, entity_tags, mongo_collection, redis_client):
+    """Invalidate only the caches built from the entities that changed"""
+    tags = sorted(KIND_TAGS[kind] for kind in changed_kinds) + sorted(entity_tags)
+    invalidate_tags(*tags)
+
+    # Coverage totals and member names come from clients and policies
+    if changed_kinds & {"cliente", "poliza"}:
+        build_top_coverage_in_redis(mongo_collection, redis_client)
+
+
+def sync_csv_to_mongo(batch_size=DEFAULT_BATCH_SIZE, files=CSV_FILES):
+    """
+    Apply only the differences between the CSV files and the last synced state
+
+    The first run (no stored fingerprints) falls back to a full reload, since
+    there is nothing to compare the files with.
+    """
+    mongo_collection = get_mongo_collection()
+    fingerprints_collection = get_mongo_collection(FINGERPRINTS_COLLECTION)
+    redis_client = get_redis_client()
+
+    records = {name: read_csv_records(file) for name, file in files.items()}
+    documents = build_client_documents(
+        records["clientes"],
+        records["polizas"],
+        records["siniestros"],
+        records["vehiculos"],
+        records["agentes"],
+    )
+    desired = collect_fingerprints(documents)
+    stored = load_stored_fingerprints(fingerprints_collection)
+
+    if not stored:
+        print("No stored fingerprints found, running a full reload")
+        mongo_collection.delete_many({})
+        inserted = insert_in_batches(mongo_collection, documents, batch_size)
+        print(f"Inserted {inserted} client documents")
+        ensure_indexes(mongo_collection)
+        save_fingerprints(fingerprints_collection, stored, desired, batch_size)
+        # Every cached result may be stale after a full reload
+        invalidate_namespaces(ALL_NAMESPACES)
+        build_top_coverage_in_redis(mongo_collection, redis_client)
+        return {"full_reload": True, "operations": inserted}
+
+    operations, changed_kinds = plan_operations(documents, stored, desired)
+    if not operations:
+        print("Collection already up to date, nothing to sync")
+        return {"full_reload": False, "operations": 0}
+
+    for start in range(0, len(operations), batch_size):
+        # Ordered, so pulls run before pushes of the same element
+        mongo_collection.bulk_write(operations[start:start + batch_size], ordered=True)
+    print(f"Applied {len(operations)} write operations ({', '.join(sorted(changed_kinds))})")
+
+    entity_tags = changed_entity_tags(stored, desired)
+    save_fingerprints(fingerprints_collection, stored, desired, batch_size)
+    invalidate_affected_caches(changed_kinds, entity_tags, mongo_collection, redis_client)
+    return {"full_reload": False, "operations": len(operations)}
+
+
+if __name__ == "__main__":
+    sync_csv_to_mongo()
@@ -0,0 +1,108 @@
+"""
+Cache warmup for the read queries
+
+After a reload every query cache is cold, so the first caller of each of
+query1 to query12 pays the full aggregation. This recomputes every query
+registered with cached_query on a bounded thread pool and stores the results
+in Redis, reporting how long each one took to build.
+
+Queries are recomputed even if they are cached, because after a reload the
+cached results belong to the previous data. Each refresh takes the
+single-flight lock, so a query already being recomputed elsewhere is skipped.
+A result that could not be stored (Redis failed, or an invalidation during
+the recompute made the write stale) is reported as an error.
+
+Uso:
+    python app/warmup.py --workers 4
+    python app/warmup.py query2:open_claims query12:agents_claims_count
+    python app/main.py --warmup
+"""
+
+import sys
+import os
+import time
+import argparse
+import importlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.cache import RedisCache, QUERY_REGISTRY
+
+WARMUP_WORKERS = int(os.environ.get("CACHE_WARMUP_WORKERS", "4"))
+
+# Query modules whose results are cached with cached_query
+CACHED_QUERY_MODULES = [f"app.queries.query{number}" for number in (1, 2, 3, 4, 5, 6, 8, 9, 10, 11, 12)]
+
+
+def registered_queries():
+    """Import the query modules and return their cached queries by namespace"""
+    for module in CACHED_QUERY_MODULES:
+        importlib.import_module(module)
+    return dict(sorted(QUERY_REGISTRY.items()))
+
+
+def warm_query(query):
+    """
+    Recompute a cached query (without arguments) and store it in Redis
+
+    Returns:
+        (seconds, "built" | "skipped" | error message)
+    """
+    start = time.perf_counter()
+    try:
+        stored = RedisCache().refresh(query.cache_key(), query.func, ttl=query.ttl, tags=query.tags_for())
+        if stored is None:
+            status = "skipped"
+        else:
+            status = "built" if stored else "error: result not stored in Redis"
+    except Exception as e:
+        status = f"error: {e}"
+    return time.perf_counter() - start, status
+
+
+def warm_caches(namespaces=None, workers=WARMUP_WORKERS):
+    """
+    Populate the cache of the registered read queries concurrently
+
+    Args:
+        namespaces: Namespaces to warm (default: every registered query)
+        workers: Queries computed at the same time; bounded so the warmup
+                 does not take every MongoDB connection
+
+    Returns:
+        List of (namespace, seconds, status), slowest first
+    """
+    queries = registered_queries()
+    if namespaces:
+        unknown = set(namespaces) - set(queries)
+        if unknown:
+            raise ValueError(f"Unknown cached queries: {', '.join(sorted(unknown))}")
+        queries = {namespace: queries[namespace] for namespace in namespaces}
+
+    print(f"Warming {len(queries)} cached queries with {workers} workers...")
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cache-warmup") as executor:
+        futures = {executor.submit(warm_query, query): namespace for namespace, query in queries.items()}
+        for future in as_completed(futures):
+            seconds, status = future.result()
+            results.append((futures[future], seconds, status))
+            print(f"  {futures[future]:<40} {seconds * 1000:>9.1f} ms  {status}")
+
+    results.sort(key=lambda result: result[1], reverse=True)
+    built = sum(1 for _, _, status in results if status == "built")
+    failed = sum(1 for _, _, status in results if status.startswith("error"))
+    print(f"Warmed {built}/{len(results)} queries ({failed} failed) in {time.perf_counter() - start:.2f} s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the cached read queries into Redis")
+    parser.add_argument("namespaces", nargs="*",
+                        help="Cached query namespaces to warm (default: all)")
+    parser.add_argument("--workers", type=int, default=WARMUP_WORKERS,
+                        help=f"Queries computed concurrently (default: {WARMUP_WORKERS})")
+    args = parser.parse_args()
+
+    warm_caches(args.namespaces, args.workers)
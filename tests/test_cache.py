@@ -0,0 +1,157 @@
+"""
+Tests of the cache coordination in app/cache.py against fakeredis
+
+Uso:
+    python -m unittest discover tests
+"""
+
+import threading
+import unittest
+from unittest import mock
+
+import fakeredis
+
+from app import cache_metrics
+from app.cache import RedisCache, ALL_NAMESPACES, recompute_lock_key
+
+
+class CacheTestCase(unittest.TestCase):
+    """Every RedisCache of a test shares one fake Redis server"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        # The metrics flusher writes to Redis too
+        patcher = mock.patch.object(cache_metrics, "get_redis_client", return_value=self.client())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Cleanups run last first: flush while the fake client is still patched in
+        self.addCleanup(cache_metrics.flush)
+
+    def client(self):
+        return fakeredis.FakeRedis(server=self.server)
+
+    def cache(self):
+        """A RedisCache with its own connection, like one per process"""
+        return RedisCache(redis_client=self.client())
+
+
+class SingleFlightTest(CacheTestCase):
+
+    def test_one_compute_under_contention(self):
+        workers = 8
+        calls = []
+        started = threading.Barrier(workers)
+        results = [None] * workers
+
+        def compute():
+            calls.append(threading.get_ident())
+            # Long enough for every other worker to find the lock taken
+            threading.Event().wait(0.3)
+            return [1, 2, 3]
+
+        def worker(index):
+            cache = self.cache()
+            started.wait()
+            results[index] = cache.get_or_compute("query2:open_claims", compute, ttl=60)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([data for data, _ in results], [[1, 2, 3]] * workers)
+        self.assertEqual(sum(1 for _, hit in results if not hit), 1)
+        self.assertFalse(self.client().exists(recompute_lock_key("query2:open_claims")))
+
+
+class GenerationTest(CacheTestCase):
+
+    def test_invalidate_namespaces_turns_entries_into_misses(self):
+        cache = self.cache()
+        cache.set("query2:open_claims", [1], ttl=60)
+        cache.set("query3:vehicles", [2], ttl=60)
+
+        cache.invalidate_namespaces("query2")
+
+        self.assertIsNone(cache.get("query2:open_claims"))
+        self.assertEqual(cache.get("query3:vehicles"), [2])
+
+    def test_bump_all_namespaces_invalidates_every_entry(self):
+        cache = self.cache()
+        cache.set("query2:open_claims", [1], ttl=60)
+        cache.set("query3:vehicles", [2], ttl=60)
+
+        cache.bump_generations(ALL_NAMESPACES)
+
+        self.assertIsNone(cache.get("query2:open_claims"))
+        self.assertIsNone(cache.get("query3:vehicles"))
+
+    def test_in_flight_set_is_rejected_after_invalidation(self):
+        cache = self.cache()
+
+        def compute():
+            # A write invalidates the namespace while the query runs
+            self.cache().invalidate_namespaces("query2")
+            return ["before the write"]
+
+        data, hit = cache.get_or_compute("query2:open_claims", compute, ttl=60)
+
+        self.assertEqual(data, ["before the write"])
+        self.assertFalse(hit)
+        self.assertFalse(self.client().exists("query2:open_claims"))
+        self.assertIsNone(cache.get("query2:open_claims"))
+
+    def test_refresh_reports_a_rejected_set(self):
+        def compute():
+            self.cache().invalidate_namespaces("query2")
+            return [1]
+
+        self.assertIs(self.cache().refresh("query2:open_claims", compute, ttl=60), False)
+        self.assertIs(self.cache().refresh("query2:open_claims", lambda: [2], ttl=60), True)
+        self.assertEqual(self.cache().get("query2:open_claims"), [2])
+
+
+class PatchTest(CacheTestCase):
+
+    def test_patch_updates_entry_and_keeps_ttl(self):
+        cache = self.cache()
+        cache.set("query14:claims:POL1001", [1], ttl=60)
+
+        self.assertTrue(cache.patch("query14:claims:POL1001", lambda rows: rows + [2]))
+
+        data, remaining = cache.get_entry("query14:claims:POL1001")
+        self.assertEqual(data, [1, 2])
+        self.assertGreater(remaining, 50)
+
+    def test_patch_during_recompute_invalidates_the_result(self):
+        key = "query14:claims:POL1001"
+        recompute = self.cache()
+        recompute.set(key, [1], ttl=60)
+        # A recompute takes the lock and pins the generation, then reads MongoDB
+        self.assertTrue(recompute.acquire_recompute_lock(key))
+        recompute.pin_generation(key)
+
+        self.assertFalse(self.cache().patch(key, lambda rows: rows + [2]))
+        # The recompute read MongoDB before the write, so its result is stale
+        self.assertFalse(recompute.set(key, [1], ttl=60))
+
+        self.assertIsNone(self.cache().get(key))
+        self.assertFalse(self.client().exists(recompute_lock_key(key)))
+
+    def test_recompute_pinned_before_patch_cannot_overwrite_it(self):
+        key = "query14:claims:POL1001"
+        recompute = self.cache()
+        recompute.set(key, [1], ttl=60)
+        # The recompute's lock expired before it finished, so the patch applies
+        recompute.pin_generation(key)
+
+        self.assertTrue(self.cache().patch(key, lambda rows: rows + [2]))
+        self.assertFalse(recompute.set(key, [1], ttl=60))
+
+        self.assertEqual(self.cache().get(key), [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()